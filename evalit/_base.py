@@ -3,16 +3,31 @@
 from __future__ import annotations
 
 import copy
+import os
 import random
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Any, Dict, Optional, Sequence, Tuple, Type, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
 
 import yaml
 from loguru import logger
 
+from .misc.checkpoint import Checkpoint
 from .structures import TYPE_PATH, TransferDTO
 
+if TYPE_CHECKING:
+    from .misc.replay import TrialArtifacts
+
 
 class AbstractAutomation(ABC):
     """
@@ -28,6 +43,8 @@ class AbstractAutomation(ABC):
 
     Each automation component should implement `rclone_automation` method
     and must return `Tuple[TransferDTO]` data structure.
+    Optionally, `stream_automation` can be overridden to yield the
+    records while the transfer is running.
     """
 
     _CFG_KEYS = {
@@ -52,6 +69,7 @@ class AbstractAutomation(ABC):
         config: Union[TYPE_PATH, Dict[str, str]],
         files: Optional[Sequence[TYPE_PATH]] = None,
         debug: bool = False,
+        name: Optional[str] = None,
         **kwargs,
     ) -> None:
         """
@@ -65,9 +83,15 @@ class AbstractAutomation(ABC):
 
             debug: `bool`
                 Flag to represent debugging mode.
+
+            name: `str`
+                Optional label for this automation, to tell apart several
+                automations of the same class in the controller results.
+                Defaults to the class name.
         """
         assert isinstance(debug, bool)
         self.debug = bool(debug)
+        self.name = name
 
         files = files or []
         self.files = tuple(files)
@@ -83,6 +107,22 @@ class AbstractAutomation(ABC):
             logger.debug(self.__get_redacted_cfg())
         self._sanity_check_config(self.config)
 
+        # live metrics holder (`misc.metrics.AutomationMetrics`),
+        # attached by the controller when the exporter is enabled.
+        self.metrics = None
+
+        # recorder of the raw tool artifacts (`misc.replay.TrialRecorder`),
+        # attached by the controller when the run is recorded.
+        self.recorder = None
+
+        # wall-clock timings (in seconds) of the stages of the latest run,
+        # like "setup" or "transfer", reported apart from the throughput.
+        self.timings: Dict[str, float] = {}
+
+        # prefix of the destination keys, for the automations that support
+        # it (eg: to keep concurrent automations apart, see the controller)
+        self.dest_prefix = ""
+
     @abstractmethod
     def run_automation(self, **kwargs) -> Tuple[TransferDTO]:
         """
@@ -90,6 +130,77 @@ class AbstractAutomation(ABC):
         """
         raise NotImplementedError()
 
+    def stream_automation(self, **kwargs) -> Iterator[TransferDTO]:
+        """
+        Start the transfer and yield the `TransferDTO` records
+        as soon as they are available.
+
+        By default, this is an adapter over `run_automation(...)` that
+        yields the records once all of them are done. Automations whose
+        parsers detect completions while the transfer is running can
+        override this to yield each record as it completes.
+        """
+        results = self.run_automation(**kwargs)
+        self._observe_progress(results)
+        yield from results
+
+    def resume_automation(
+        self, checkpoint: Union[TYPE_PATH, Checkpoint], **kwargs
+    ) -> Tuple[TransferDTO]:
+        """
+        Reattach to the in-flight transfers recorded in the `checkpoint`
+        (see `misc.checkpoint.Checkpoint`) and finish measuring them,
+        without resubmitting anything.
+        """
+        raise NotImplementedError(
+            f"{self.__classname__} can't reattach to in-flight transfers!"
+        )
+
+    def replay_automation(
+        self, artifacts: TrialArtifacts, **kwargs
+    ) -> Tuple[TransferDTO]:
+        """
+        Build the records again from the artifacts recorded during a past
+        run (see `misc.replay`), without transferring anything.
+
+        By default, the recorded records are returned as they are.
+        Automations that parse the outputs of a tool override this to
+        parse the recorded outputs again.
+        """
+        return artifacts.records()
+
+    def checkpoint_path(self, checkpoint_dir: Optional[TYPE_PATH]) -> Optional[str]:
+        """
+        Path of the checkpoint of this automation inside `checkpoint_dir`.
+        """
+        if checkpoint_dir is None:
+            return None
+        return os.path.join(checkpoint_dir, f"{self.label}.checkpoint.json")
+
+    def _open_checkpoint(self, **kwargs) -> Optional[Checkpoint]:
+        """
+        A fresh checkpoint if `checkpoint_dir` is passed through the kwargs.
+        It's written every `checkpoint_interval` seconds.
+        """
+        path = self.checkpoint_path(kwargs.get("checkpoint_dir"))
+        if path is None:
+            return None
+        return Checkpoint(
+            path,
+            interval=kwargs.get("checkpoint_interval", 30),
+            state={"automation": self.__classname__},
+        )
+
+    @staticmethod
+    def _load_checkpoint(
+        checkpoint: Union[TYPE_PATH, Checkpoint], **kwargs
+    ) -> Checkpoint:
+        if isinstance(checkpoint, Checkpoint):
+            return checkpoint
+        return Checkpoint.load(
+            checkpoint, interval=kwargs.get("checkpoint_interval", 30)
+        )
+
     @staticmethod
     def load_yaml(config_yaml: TYPE_PATH) -> Dict[str, str]:
         """
@@ -119,10 +230,36 @@ class AbstractAutomation(ABC):
                     raise ValueError(f"key={src_key} not found in the config!")
         return True
 
+    def _observe_progress(
+        self, dtos: Sequence[TransferDTO], lag: Optional[float] = None
+    ) -> None:
+        """
+        Push the transfer records detected so far to the live metrics,
+        if any are attached.
+        """
+        if self.metrics is None:
+            return
+        self.metrics.observe(dtos, lag=lag)
+
     @property
     def __classname__(self) -> str:
         return self.__class__.__name__
 
+    @property
+    def verifiable(self) -> bool:
+        """
+        Whether the transferred objects land at the destination under
+        the same keys, so that they can be verified against the source.
+        """
+        return True
+
+    @property
+    def label(self) -> str:
+        """
+        Name of the automation in the controller results.
+        """
+        return self.name or self.__classname__
+
     def __get_redacted_cfg(self) -> Dict[str, str]:
         """
         Returns the stored config in redacted form.
@@ -143,6 +280,9 @@ class AbstractAutomation(ABC):
         params = copy.deepcopy(self.__dict__)
         params.pop("config", None)
         params.pop("files", None)
+        params.pop("metrics", None)
+        params.pop("timings", None)
+        params.pop("recorder", None)
         return f"[{self.__classname__}] | [Redacted config] = {self.__get_redacted_cfg()} | [params] => {params}"
 
 
@@ -190,23 +330,12 @@ class AbstractController(ABC):
             cfg = AbstractAutomation.load_yaml(cfg)
 
         # importing at runtime, as it's not a necessity to use this function
-        import boto3
+        from .misc.s3 import iter_objects, make_s3_client
 
-        logger.debug(f"Boto3 version: {boto3.__version__}")
-
-        s3_client = boto3.client(
-            "s3",
-            aws_access_key_id=cfg["source_token"],
-            aws_secret_access_key=cfg["source_secret"],
-            endpoint_url=cfg["source_s3_endpoint"],
-            region_name=cfg["source_s3_region"],
-        )
-        response_contents = s3_client.list_objects_v2(
-            Bucket=cfg["source_s3_bucket"]
-        ).get("Contents", {})
+        s3_client = make_s3_client(cfg, "source")
         return {
             val["Key"]: dict(size=val["Size"] / (1024 * 1024 * 1024))
-            for val in response_contents
+            for val in iter_objects(s3_client, cfg["source_s3_bucket"])
         }
 
     def sanity_check_automations(
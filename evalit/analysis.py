@@ -0,0 +1,395 @@
+from __future__ import annotations
+
+import json
+import math
+from collections import defaultdict
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+from .misc.streaming import RunningThroughput, record_to_dto
+from .structures import TYPE_PATH, TransferDTO
+
+_GB = 1024 * 1024 * 1024
+
+# upper edges (in bytes) of the size bins, the last bin being unbounded
+SIZE_BIN_EDGES: Tuple[int, ...] = (
+    64 * 1024,
+    1024 * 1024,
+    16 * 1024 * 1024,
+    256 * 1024 * 1024,
+    _GB,
+)
+
+
+def _human(nbytes: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if nbytes < 1024:
+            return f"{nbytes}{unit}"
+        nbytes //= 1024
+    return f"{nbytes}TB"
+
+
+def bin_labels(edges: Sequence[int] = SIZE_BIN_EDGES) -> List[str]:
+    bounds = [0, *edges]
+    labels = [f"{_human(lo)}-{_human(hi)}" for lo, hi in zip(bounds, bounds[1:])]
+    return labels + [f">{_human(edges[-1])}"]
+
+
+def object_size(dto: TransferDTO, filemap: Dict[str, dict]) -> Optional[int]:
+    """
+    Size (in bytes) of the transferred object: from the filemap
+    (as built by `get_source_file_map`) or as reported by the tool.
+    """
+    if dto.fname in filemap:
+        return int(filemap[dto.fname]["size"] * _GB)
+    return dto.nbytes
+
+
+def size_bins(
+    dtos: Iterable[TransferDTO],
+    filemap: Dict[str, dict],
+    edges: Sequence[int] = SIZE_BIN_EDGES,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Bin the successful transfers by object size, and compute the
+    throughput and objects/sec of each bin, as if it was transferred alone.
+
+    Returns:
+        `{bin label: {"count", "volume_gb", "throughput", "objects_per_sec"}}`
+        for the non-empty bins, in ascending size.
+    """
+    labels = bin_labels(edges)
+    # volumes come from the sizes set below, whether mapped or not
+    trackers = [RunningThroughput() for _ in labels]
+    for dto in dtos:
+        size = object_size(dto, filemap)
+        if size is None or dto.failed:
+            continue
+        dto = replace(dto, nbytes=size)
+        trackers[int(np.searchsorted(edges, size, side="left"))].add(dto)
+    return {
+        label: dict(
+            count=tracker.count,
+            volume_gb=round(tracker.volume, 6),
+            throughput=tracker.throughput(),
+            objects_per_sec=tracker.objects_per_second(),
+        )
+        for label, tracker in zip(labels, trackers)
+        if tracker.count
+    }
+
+
+@dataclass
+class CostModel:
+    """
+    `duration = latency + size / bandwidth` per object, with transfers
+    overlapping `concurrency` at a time on average.
+
+    `latency` is the per-object overhead (requests, listing, scheduling)
+    and `bandwidth` the streaming rate of a single transfer, so that a tool
+    losing on small objects and a tool losing on large ones can be told apart.
+    """
+
+    # seconds per object
+    latency: float = 0.0
+
+    # seconds per byte of a single transfer
+    seconds_per_byte: float = 0.0
+
+    # average number of transfers in flight
+    concurrency: float = 1.0
+
+    samples: int = 0
+
+    # coefficient of determination of the per-object fit
+    r2: float = 0.0
+
+    @property
+    def bandwidth_gbps(self) -> float:
+        """
+        Streaming bandwidth of a single transfer.
+        """
+        if self.seconds_per_byte <= 0:
+            return float("inf")
+        return 8 / self.seconds_per_byte / 1e9
+
+    def predict_object(self, size: int) -> float:
+        return self.latency + size * self.seconds_per_byte
+
+    def predict(self, sizes: Iterable[int]) -> float:
+        """
+        Predicted completion time (seconds) of a manifest of object sizes
+        (in bytes), eg: `(m["size"] * _GB for m in filemap.values())`.
+        """
+        count, volume = 0, 0
+        for size in sizes:
+            count += 1
+            volume += size
+        busy = count * self.latency + volume * self.seconds_per_byte
+        return busy / max(self.concurrency, 1.0)
+
+    def predict_filemap(self, filemap: Dict[str, dict]) -> float:
+        return self.predict(int(m["size"] * _GB) for m in filemap.values())
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        The fitted parameters. An unbounded bandwidth (the durations don't
+        grow with the size) is `None`, as JSON has no infinity.
+        """
+        bandwidth = self.bandwidth_gbps
+        return dict(
+            latency=round(self.latency, 6),
+            bandwidth_gbps=round(bandwidth, 3) if math.isfinite(bandwidth) else None,
+            concurrency=round(self.concurrency, 3),
+            samples=self.samples,
+            r2=round(self.r2, 3),
+        )
+
+
+def _seconds(t: datetime) -> float:
+    return (t - datetime(1970, 1, 1)).total_seconds()
+
+
+def fit_cost_model(dtos: Iterable[TransferDTO], filemap: Dict[str, dict]) -> CostModel:
+    """
+    Least-squares fit of the per-object durations against the object sizes.
+    The concurrency is the total busy time over the makespan of the run.
+    """
+    sizes, durations = [], []
+    tmin, tmax = float("inf"), float("-inf")
+    for dto in dtos:
+        size = object_size(dto, filemap)
+        if dto.failed or size is None or dto.start_time is None or dto.end_time is None:
+            continue
+        start, end = _seconds(dto.start_time), _seconds(dto.end_time)
+        sizes.append(size)
+        durations.append(max(end - start, 0.0))
+        tmin, tmax = min(tmin, start), max(tmax, end)
+
+    model = CostModel(samples=len(sizes))
+    if not sizes:
+        return model
+
+    x = np.asarray(sizes, dtype=np.float64)
+    y = np.asarray(durations, dtype=np.float64)
+    if len(sizes) > 1 and np.ptp(x) > 0:
+        slope, intercept = np.polyfit(x, y, 1)
+        if intercept < 0:
+            # a negative overhead is meaningless: fit the bandwidth alone
+            intercept, slope = 0.0, float(x @ y / (x @ x))
+        elif slope < 0:
+            # no size dependency: all overhead
+            intercept, slope = float(y.mean()), 0.0
+    else:
+        # single size: can't separate the overhead from the bandwidth
+        logger.warning("Can't fit the cost model over a single object size!")
+        intercept, slope = 0.0, float(y.sum() / x.sum()) if x.sum() else 0.0
+
+    model.latency, model.seconds_per_byte = float(intercept), float(slope)
+    residuals = y - (model.latency + model.seconds_per_byte * x)
+    variance = float(((y - y.mean()) ** 2).sum())
+    model.r2 = 1 - float((residuals**2).sum()) / variance if variance > 0 else 1.0
+    makespan = tmax - tmin
+    model.concurrency = float(y.sum() / makespan) if makespan > 0 else 1.0
+    return model
+
+
+def jain_index(values: Sequence[float]) -> Optional[float]:
+    """
+    Jain's fairness index `(sum x)^2 / (n * sum x^2)`: 1 when all the
+    values are equal, down to 1/n when a single one takes everything.
+    """
+    x = np.asarray(values, dtype=np.float64)
+    if not len(x) or not (x**2).sum():
+        return None
+    return round(float(x.sum() ** 2 / (len(x) * (x**2).sum())), 3)
+
+
+def _cumulative_volume(
+    dtos: Iterable[TransferDTO], filemap: Dict[str, dict], times: np.ndarray
+) -> np.ndarray:
+    """
+    Volume (GB) transferred by each of the `times` (seconds since epoch),
+    each object being spread evenly over its transfer.
+
+    The cumulative volume is piecewise linear, its slope changing by the
+    rate of an object at its start and end, so it's built from the sorted
+    start/end events instead of per time bin.
+    """
+    starts, ends, sizes = [], [], []
+    for dto in dtos:
+        size = object_size(dto, filemap)
+        if dto.failed or size is None or dto.start_time is None or dto.end_time is None:
+            continue
+        starts.append(_seconds(dto.start_time))
+        ends.append(_seconds(dto.end_time))
+        sizes.append(size / _GB)
+    if not sizes:
+        return np.zeros(len(times))
+
+    starts, ends = np.asarray(starts), np.asarray(ends)
+    rates = np.asarray(sizes) / np.maximum(ends - starts, 1e-6)
+    events = np.concatenate([starts, np.maximum(ends, starts + 1e-6)])
+    order = np.argsort(events, kind="stable")
+    events = events[order]
+    slopes = np.cumsum(np.concatenate([rates, -rates])[order])
+    volume = np.concatenate([[0.0], np.cumsum(slopes[:-1] * np.diff(events))])
+    return np.interp(times, events, volume)
+
+
+def link_share(
+    records: Dict[str, Iterable[TransferDTO]],
+    filemap: Dict[str, dict],
+    interval: Optional[float] = None,
+    capacity_gbps: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    How automations that ran at the same time shared the link,
+    from their per-object transfer times.
+
+    Args:
+        `records`: `Dict[str, Iterable[TransferDTO]]`
+            The records of each automation.
+
+        `interval`: `float`
+            Width (seconds) of the timeline bins.
+            Defaults to 1/300th of the run, and at least a second.
+
+        `capacity_gbps`: `float`
+            Achievable bandwidth of the link (eg: `misc.probe.LinkProbe`),
+            to report the utilization.
+
+    Returns:
+        - "timeline": per bin, the throughput ("gbps") and "share" of
+        each automation, the "total_gbps" and Jain's index ("jain")
+        - "tools": per automation, its "volume_gb", its "contended_gbps"
+        while all of them were running and its "share" of that
+        - "jain": Jain's index of the contended throughputs
+        - "aggregate_gbps" (and "utilization"): total volume over the run span
+    """
+    records = {label: list(dtos) for label, dtos in records.items()}
+    spans = {}
+    for label, dtos in records.items():
+        times = [
+            (_seconds(d.start_time), _seconds(d.end_time))
+            for d in dtos
+            if not d.failed and d.start_time is not None and d.end_time is not None
+        ]
+        if times:
+            spans[label] = (min(t[0] for t in times), max(t[1] for t in times))
+    if not spans:
+        logger.warning("No transfer times to compute the link share!")
+        return dict(
+            interval=interval,
+            start=None,
+            contended_seconds=0.0,
+            timeline=dict(
+                t=[],
+                gbps={label: [] for label in records},
+                share={label: [] for label in records},
+                total_gbps=[],
+                jain=[],
+            ),
+            tools={
+                label: dict(volume_gb=0.0, contended_gbps=None, share=None)
+                for label in records
+            },
+            jain=None,
+            aggregate_gbps=0.0,
+        )
+
+    tmin = min(s[0] for s in spans.values())
+    tmax = max(s[1] for s in spans.values())
+    interval = interval or max(1.0, (tmax - tmin) / 300)
+    edges = np.arange(tmin, tmax + interval, interval)
+    # contended window: while all the automations were running
+    cstart = max(s[0] for s in spans.values())
+    cend = min(s[1] for s in spans.values())
+    contended = len(spans) == len(records) and cend > cstart
+
+    gbps, tools = {}, {}
+    for label, dtos in records.items():
+        volume = _cumulative_volume(
+            dtos, filemap, np.concatenate([edges, [cstart, cend]])
+        )
+        gbps[label] = np.diff(volume[:-2]) * 8 / interval
+        tools[label] = dict(
+            volume_gb=round(float(volume[-3]), 6),
+            contended_gbps=(
+                round(float((volume[-1] - volume[-2]) * 8 / (cend - cstart)), 3)
+                if contended
+                else None
+            ),
+        )
+    total = sum(gbps.values())
+    shares = {
+        label: np.divide(x, total, out=np.zeros_like(x), where=total > 0)
+        for label, x in gbps.items()
+    }
+    if contended:
+        contended_total = sum(t["contended_gbps"] for t in tools.values())
+        for tool in tools.values():
+            tool["share"] = (
+                round(tool["contended_gbps"] / contended_total, 3)
+                if contended_total
+                else None
+            )
+    else:
+        logger.warning("The automations never ran all at the same time!")
+        for tool in tools.values():
+            tool["share"] = None
+
+    result = dict(
+        interval=interval,
+        start=(datetime(1970, 1, 1) + timedelta(seconds=tmin)).isoformat(),
+        contended_seconds=round(cend - cstart, 3) if contended else 0.0,
+        timeline=dict(
+            t=[round(float(t - tmin), 3) for t in edges[:-1]],
+            gbps={k: np.round(v, 3).tolist() for k, v in gbps.items()},
+            share={k: np.round(v, 3).tolist() for k, v in shares.items()},
+            total_gbps=np.round(total, 3).tolist(),
+            jain=[jain_index(column) for column in zip(*gbps.values())],
+        ),
+        tools=tools,
+        jain=(
+            jain_index([t["contended_gbps"] for t in tools.values()])
+            if contended
+            else None
+        ),
+        aggregate_gbps=round(
+            sum(t["volume_gb"] for t in tools.values()) * 8 / (tmax - tmin), 3
+        )
+        if tmax > tmin
+        else 0.0,
+    )
+    if capacity_gbps:
+        result["utilization"] = round(result["aggregate_gbps"] / capacity_gbps, 3)
+    return result
+
+
+def analyze_results(
+    path: TYPE_PATH,
+    filemap: Dict[str, dict],
+    edges: Sequence[int] = SIZE_BIN_EDGES,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Size bins and cost model of every automation of a results file
+    (as written by `controller.StandardAutomationController.run(results_path=...)`).
+    """
+    automations = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                automations[record.get("automation")].append(record_to_dto(record))
+    return {
+        name: dict(
+            size_bins=size_bins(dtos, filemap, edges),
+            cost_model=fit_cost_model(dtos, filemap).summary(),
+        )
+        for name, dtos in automations.items()
+    }
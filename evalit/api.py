@@ -1,4 +1,61 @@
-from .mft import MFTAutomation
-from .nifi import NifiAutomation
-from .rclone import RcloneAutomation
-from .structures import TransferDTO
+"""
+Public API of evalit.
+
+The automations are loaded lazily on first access (see `evalit.registry`),
+so that importing this module doesn't import every tool's dependencies.
+"""
+
+from typing import TYPE_CHECKING, Any, List
+
+from .registry import available_automations, find_automation, get_automation
+from .structures import TransferDTO, TransferStatus
+
+if TYPE_CHECKING:
+    # for the type checkers and linters only: at runtime, these are
+    # resolved by `__getattr__` on first access
+    from .composite import CompositeAutomation, CostModelRouting, SizeRouting
+    from .local import LocalAutomation
+    from .mft import MFTAutomation
+    from .native import NativeAutomation
+    from .nifi import NifiAutomation
+    from .rclone import RcloneAutomation
+
+# helpers exported alongside the automations
+_LAZY = {
+    "CostModelRouting": "evalit.composite",
+    "SizeRouting": "evalit.composite",
+}
+
+__all__ = [
+    "CompositeAutomation",
+    "CostModelRouting",
+    "LocalAutomation",
+    "MFTAutomation",
+    "NativeAutomation",
+    "NifiAutomation",
+    "RcloneAutomation",
+    "SizeRouting",
+    "TransferDTO",
+    "TransferStatus",
+    "available_automations",
+    "get_automation",
+]
+
+
+def __getattr__(name: str) -> Any:
+    # PEP 562: only called for the names that aren't defined yet
+    if name in _LAZY:
+        import importlib
+
+        value = getattr(importlib.import_module(_LAZY[name]), name)
+    else:
+        registered = find_automation(name)
+        if registered is None:
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+        value = get_automation(registered)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
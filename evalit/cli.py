@@ -0,0 +1,404 @@
+"""
+`evalit` command: run a benchmark described by a YAML spec.
+
+Spec:
+
+    .. code-block:: yaml
+
+        # endpoints: path of the usual config yaml, or the keys inline
+        config: tests/config.yaml
+
+        # which source objects to transfer (all of them by default)
+        files:
+          prefix: "data/"       # only the keys under this prefix
+          limit: 1000           # at most this many keys
+          delta: false          # only the objects missing/changed at the dest
+          # keys: [a.bin, b.bin]
+
+        tools:
+          - type: rclone        # name in `evalit.registry`
+            name: rclone-16
+            params: {ntransfers: 16, s3_upload_concurrency: 16}
+          - type: nifi
+            params:
+              nifi_url: https://localhost:8443/nifi-api
+              nifi_dir: ${NIFI_INSTALLATION}
+          - type: composite
+            name: rclone+native
+            policy: {size_mb: [64]}
+            children:
+              - {type: rclone, name: small}
+              - {type: native, name: large}
+
+        # keyword arguments of `StandardAutomationController.run(...)`
+        run:
+          trials: 3
+          reset_destination: true
+
+Instead of `config`, a matrix of endpoint pairs runs every tool on every pair
+(see `evalit.matrix`). Pairs sharing no network path run at the same time:
+
+    .. code-block:: yaml
+
+        pairs:
+          - name: aws-to-minio
+            config: configs/aws_minio.yaml
+            files: {limit: 100}        # per pair, like `files` above
+          - name: esa-to-aws
+            config: configs/esa_aws.yaml
+            paths: [esa]               # default: the endpoint hosts
+            through_host: false        # default: true, adds the "host" path
+
+Environment variables (`${VAR}`) are expanded in all the strings.
+
+Usage:
+
+    evalit spec.yaml --only rclone-16 --trials 5 --output results.json
+    evalit spec.yaml --dry-run
+    evalit spec.yaml --record runs/run.tar.gz   # see `misc.replay`
+    evalit matrix.yaml --pair aws-to-minio --output matrix.parquet
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import yaml
+from loguru import logger
+
+from .__version__ import __version__
+from .registry import available_automations, get_automation
+
+_FORMATS = ("json", "parquet")
+
+
+def _expand(value: Any) -> Any:
+    if isinstance(value, str):
+        return os.path.expandvars(value)
+    if isinstance(value, dict):
+        return {k: _expand(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_expand(v) for v in value]
+    return value
+
+
+def load_spec(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        spec = _expand(yaml.safe_load(f) or {})
+    if not spec.get("tools"):
+        raise ValueError(f"No tools in the spec {path}!")
+    if "config" not in spec and not spec.get("pairs"):
+        raise ValueError(f"No config (or pairs) in the spec {path}!")
+    for i, pair in enumerate(spec.get("pairs") or []):
+        if "name" not in pair or "config" not in pair:
+            raise ValueError(f"Pair #{i} of the spec needs a name and a config!")
+    spec.setdefault("files", {})
+    spec.setdefault("run", {})
+    for i, tool in enumerate(spec["tools"]):
+        if "type" not in tool:
+            raise ValueError(f"Tool #{i} of the spec has no type!")
+        tool.setdefault("name", tool["type"])
+    names = [tool["name"] for tool in spec["tools"]]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Tool names must be unique. Got {names}")
+    return spec
+
+
+def _load_config(spec: Dict[str, Any]) -> Dict[str, str]:
+    from ._base import AbstractAutomation
+
+    config = spec["config"]
+    return AbstractAutomation.load_yaml(config) if isinstance(config, str) else config
+
+
+def build_pairs(pairs: Sequence[Dict[str, Any]], selection: Dict[str, Any]):
+    from .matrix import EndpointPair
+
+    endpoint_pairs = []
+    for pair in pairs:
+        cfg = _load_config(pair)
+        _, filemap = select_files(cfg, pair.get("files", selection))
+        logger.info(f"[{pair['name']}] {len(filemap)} files selected")
+        endpoint_pairs.append(
+            EndpointPair(
+                pair["name"],
+                cfg,
+                pair.get("paths") or (),
+                filemap,
+                through_host=pair.get("through_host", True),
+            )
+        )
+    return endpoint_pairs
+
+
+def select_files(cfg: Dict[str, str], selection: Dict[str, Any]):
+    """
+    The keys to transfer and their filemap, as selected by the spec.
+    """
+    from ._base import AbstractController
+
+    if selection.get("delta"):
+        from .misc.delta import plan_transfer
+
+        plan = plan_transfer(cfg, prefix=selection.get("prefix", ""))
+        filemap = plan.filemap()
+    else:
+        filemap = AbstractController.get_source_file_map(cfg)
+        if selection.get("prefix"):
+            filemap = {
+                k: v for k, v in filemap.items() if k.startswith(selection["prefix"])
+            }
+    if selection.get("keys"):
+        wanted = set(selection["keys"])
+        filemap = {k: v for k, v in filemap.items() if k in wanted}
+    if selection.get("limit"):
+        filemap = dict(list(filemap.items())[: int(selection["limit"])])
+    return tuple(filemap), filemap
+
+
+def _policy(spec: Dict[str, Any]):
+    from .composite import SizeRouting
+
+    policy = spec.get("policy", {})
+    if "size_mb" not in policy:
+        raise ValueError(
+            f"Composite {spec['name']} needs a policy like {{size_mb: [64]}}"
+        )
+    return SizeRouting(policy["size_mb"])
+
+
+def build_automation(tool: Dict[str, Any], cfg: Dict[str, str], files: Sequence[str]):
+    automation = get_automation(tool["type"])
+    params = dict(tool.get("params") or {})
+    params.setdefault("name", tool.get("name", tool["type"]))
+    if tool["type"] == "composite":
+        children = [
+            build_automation(
+                dict(child, name=child.get("name", child["type"])), cfg, ()
+            )
+            for child in tool.get("children", [])
+        ]
+        return automation(
+            automations=children,
+            policy=_policy(tool),
+            files=files,
+            config=cfg,
+            **params,
+        )
+    return automation(config=cfg, files=files, **params)
+
+
+def _rows(results: Dict[str, dict], pair: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Flat rows (one per automation and trial) for tabular outputs.
+    """
+    rows = []
+    for name, result in results.items():
+        trials = result.get("trials", [result])
+        for i, trial in enumerate(trials):
+            row = dict(
+                pair=pair,
+                automation=name,
+                trial=i,
+                throughput=trial["throughput"],
+                objects_per_sec=trial["objects_per_sec"],
+                link_efficiency=result.get("link_efficiency"),
+            )
+            for stage, seconds in trial.get("timings", {}).items():
+                row[f"timings.{stage}"] = seconds
+            for status, count in trial.get("failures", {}).items():
+                row[f"failures.{status}"] = count
+            rows.append(row)
+    return rows
+
+
+def write_results(output: str, fmt: str, document: Dict[str, Any]) -> None:
+    if fmt == "parquet":
+        # optional, and slow to import
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError("Parquet output needs the pyarrow package!")
+        if "matrix" in document:
+            rows = [
+                row
+                for pair, results in document["results"].items()
+                for row in _rows(results, pair)
+                if "error" not in results
+            ]
+        else:
+            rows = _rows(document["results"])
+        pyarrow.parquet.write_table(pyarrow.Table.from_pylist(rows), output)
+    else:
+        with open(output, "w") as f:
+            json.dump(document, f, indent=2, default=str)
+    logger.info(f"Results written to {output}")
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="evalit", description="Run a data transfer benchmark spec."
+    )
+    parser.add_argument("spec", help="YAML benchmark spec")
+    parser.add_argument(
+        "--only",
+        action="append",
+        default=[],
+        metavar="NAME",
+        help="only run the tool with this name (repeatable)",
+    )
+    parser.add_argument(
+        "--trials", type=int, help="trials per tool (overrides the spec)"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="print the resolved plan without transferring anything",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="BUNDLE",
+        help="archive the raw tool outputs to this .tar.gz, for replaying",
+    )
+    parser.add_argument(
+        "--pair",
+        action="append",
+        default=[],
+        metavar="NAME",
+        help="only run the endpoint pair with this name (repeatable)",
+    )
+    parser.add_argument("--output", "-o", help="results file (default: stdout)")
+    parser.add_argument("--format", choices=_FORMATS, help="default: from --output")
+    parser.add_argument("--version", action="version", version=__version__)
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = _parser().parse_args(argv)
+    spec = load_spec(args.spec)
+
+    tools = spec["tools"]
+    if args.only:
+        unknown = set(args.only) - {tool["name"] for tool in tools}
+        if unknown:
+            raise SystemExit(f"Unknown tools in --only: {sorted(unknown)}")
+        tools = [tool for tool in tools if tool["name"] in args.only]
+    pairs = spec.get("pairs") or []
+    if args.pair:
+        unknown = set(args.pair) - {pair["name"] for pair in pairs}
+        if unknown:
+            raise SystemExit(f"Unknown pairs in --pair: {sorted(unknown)}")
+        pairs = [pair for pair in pairs if pair["name"] in args.pair]
+    run_kwargs = dict(spec["run"])
+    if args.trials is not None:
+        run_kwargs["trials"] = args.trials
+    if args.record:
+        run_kwargs["record_path"] = args.record
+
+    fmt = args.format or (
+        "parquet" if (args.output or "").endswith(".parquet") else "json"
+    )
+    if fmt == "parquet" and not args.output:
+        raise SystemExit("--format parquet needs --output")
+    if fmt == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        # checked before running, not after hours of transfers
+        raise SystemExit("Parquet output needs the pyarrow package!")
+
+    registered = available_automations()
+    missing = {t["type"] for t in tools} - set(registered)
+    if missing:
+        raise SystemExit(
+            f"Unknown tool types {sorted(missing)}. Available: {sorted(registered)}"
+        )
+
+    if args.dry_run:
+        plan = dict(
+            spec=args.spec,
+            tools=[dict(tool, target=registered[tool["type"]]) for tool in tools],
+            files=spec["files"],
+            pairs=pairs or None,
+            run=run_kwargs,
+            output=args.output,
+            format=fmt,
+        )
+        json.dump(plan, sys.stdout, indent=2, default=str)
+        print()
+        return 0
+
+    if pairs:
+        return _run_matrix(args, spec, pairs, tools, run_kwargs, fmt)
+
+    from .controller import StandardAutomationController
+
+    cfg = _load_config(spec)
+    files, filemap = select_files(cfg, spec["files"])
+    logger.info(f"{len(files)} files selected")
+
+    controller = StandardAutomationController().add_automations(
+        [build_automation(tool, cfg, files) for tool in tools]
+    )
+    started = datetime.now()
+    start = time.time()
+    results = controller.run(filemap=filemap, **run_kwargs)
+    document = dict(
+        spec=args.spec,
+        version=__version__,
+        started=started.isoformat(),
+        seconds=time.time() - start,
+        nfiles=len(files),
+        run=run_kwargs,
+        results=results,
+    )
+    _output(args, fmt, document)
+    return 0
+
+
+def _run_matrix(args, spec, pairs, tools, run_kwargs, fmt) -> int:
+    from .matrix import MatrixRunner
+
+    endpoint_pairs = build_pairs(pairs, spec["files"])
+    runner = MatrixRunner(
+        endpoint_pairs,
+        {
+            tool["name"]: (
+                lambda cfg, files, tool=tool: build_automation(tool, cfg, files)
+            )
+            for tool in tools
+        },
+        max_parallel=spec.get("max_parallel"),
+    )
+    logger.info(f"Matrix schedule: {runner.plan()['waves']}")
+    started = datetime.now()
+    result = runner.run(**run_kwargs)
+    document = dict(
+        spec=args.spec,
+        version=__version__,
+        started=started.isoformat(),
+        seconds=result.seconds,
+        nfiles={pair.name: len(pair.filemap) for pair in endpoint_pairs},
+        run=run_kwargs,
+        matrix=result.summary(),
+        results=result.results,
+    )
+    _output(args, fmt, document)
+    return 0
+
+
+def _output(args, fmt: str, document: Dict[str, Any]) -> None:
+    if args.output:
+        write_results(args.output, fmt, document)
+    else:
+        json.dump(document, sys.stdout, indent=2, default=str)
+        print()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,6 @@
+from .composite_automation import (
+    CompositeAutomation,
+    CostModelRouting,
+    RoutingPolicy,
+    SizeRouting,
+)
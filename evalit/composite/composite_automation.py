@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from loguru import logger
+
+from .._base import AbstractAutomation, AbstractController
+from ..structures import TYPE_PATH, TransferDTO
+
+if TYPE_CHECKING:
+    from ..analysis import CostModel
+    from ..misc.replay import TrialArtifacts
+
+_GB = 1024 * 1024 * 1024
+
+
+class RoutingPolicy(ABC):
+    """
+    Decides which child automation transfers which file.
+    """
+
+    @abstractmethod
+    def route(self, sizes: Dict[str, int], nchildren: int) -> List[List[str]]:
+        """
+        Args:
+            `sizes`: `Dict[str, int]`
+                Files to transfer, with their sizes in bytes.
+
+            `nchildren`: `int`
+                Number of child automations.
+
+        Returns:
+            The files of each child, in the order of the children.
+        """
+        raise NotImplementedError()
+
+
+class SizeRouting(RoutingPolicy):
+    """
+    Route by object size: with `thresholds=(t0, t1, ...)` in MB,
+    the first child gets the files up to `t0`, the second up to `t1`, ...
+    and the last one all the larger files.
+
+    Usage:
+
+        .. code-block:: python
+
+            # rclone below 64 MB, native streaming above
+            SizeRouting((64,))
+    """
+
+    def __init__(self, thresholds_mb: Sequence[float]) -> None:
+        self.thresholds = tuple(sorted(int(t * 1024 * 1024) for t in thresholds_mb))
+
+    def route(self, sizes: Dict[str, int], nchildren: int) -> List[List[str]]:
+        if len(self.thresholds) != nchildren - 1:
+            raise ValueError(
+                f"{len(self.thresholds)} thresholds for {nchildren} automations. "
+                f"Expected {nchildren - 1}!"
+            )
+        parts = [[] for _ in range(nchildren)]
+        for fname, size in sizes.items():
+            i = 0
+            while i < len(self.thresholds) and size > self.thresholds[i]:
+                i += 1
+            parts[i].append(fname)
+        return parts
+
+
+class CostModelRouting(RoutingPolicy):
+    """
+    Route with the fitted cost model of each child (see
+    `analysis.fit_cost_model`), so that all the children finish as early
+    as possible: files are assigned largest first to the child whose
+    predicted completion time grows the least.
+    """
+
+    def __init__(self, models: Sequence[CostModel]) -> None:
+        self.models = tuple(models)
+
+    def route(self, sizes: Dict[str, int], nchildren: int) -> List[List[str]]:
+        if len(self.models) != nchildren:
+            raise ValueError(
+                f"{len(self.models)} cost models for {nchildren} automations!"
+            )
+        parts = [[] for _ in range(nchildren)]
+        busy = [0.0] * nchildren
+        for fname, size in sorted(sizes.items(), key=lambda x: -x[1]):
+
+            def _finish(i: int) -> float:
+                model = self.models[i]
+                return (busy[i] + model.predict_object(size)) / max(
+                    model.concurrency, 1.0
+                )
+
+            best = min(range(nchildren), key=_finish)
+            busy[best] += self.models[best].predict_object(size)
+            parts[best].append(fname)
+        predicted = [
+            round(b / max(m.concurrency, 1.0), 3) for b, m in zip(busy, self.models)
+        ]
+        logger.debug(f"Predicted completion times (seconds) = {predicted}")
+        return parts
+
+
+class CompositeAutomation(AbstractAutomation):
+    """
+    Split the files between several child automations by a routing policy,
+    and run the children concurrently.
+
+    The records of all the children are merged into a single stream as
+    they're yielded, so that the controller reports the combined makespan
+    and throughput. Each record keeps the `transferer` of its child.
+
+    Usage:
+
+        .. code-block:: python
+
+            composite = CompositeAutomation(
+                (RcloneAutomation(cfg), NativeAutomation(cfg)),
+                policy=SizeRouting((64,)),
+                files=filenames,
+            )
+            controller.add_automation(composite).run(filemap=filemap)
+
+    Args:
+        `automations`: `Sequence[AbstractAutomation]`
+            The children. Their own `files` are replaced by their share.
+
+        `policy`: `RoutingPolicy`
+            How the files are split (see `SizeRouting`, `CostModelRouting`).
+
+        `files`: `List[str]`
+            Files to transfer. Defaults to all the source objects.
+
+    The sizes come from the `filemap` passed to the run
+    (`StandardAutomationController.run(filemap=...)`),
+    or from listing the source bucket.
+
+    A `dest_prefix` param (or attribute) is passed down to the children.
+    The children only transfer the files routed to them (a NiFi child lists
+    them instead of the whole bucket, rclone copies them with
+    `--files-from-raw`). Their files, scoping and prefix are restored after
+    the run.
+
+    When the run is recorded (see `misc.replay`), each child records its
+    own artifacts, and the replay parses them again child by child.
+    """
+
+    # attributes of the children that decide what they copy (see `route`)
+    _SCOPING = ("listing_mode", "files_from")
+
+    def __init__(
+        self,
+        automations: Sequence[AbstractAutomation],
+        policy: RoutingPolicy,
+        files: Optional[Sequence[TYPE_PATH]] = None,
+        config: Optional[Union[TYPE_PATH, Dict[str, str]]] = None,
+        debug: bool = False,
+        **params,
+    ) -> None:
+        if not automations:
+            raise ValueError("CompositeAutomation needs at least one automation!")
+        super().__init__(
+            config=config if config is not None else automations[0].config,
+            files=files,
+            debug=debug,
+            name=params.get("name"),
+        )
+        labels = [a.label for a in automations]
+        if len(set(labels)) != len(labels):
+            raise ValueError(
+                f"Child automations need distinct names. Got {labels}. Use name=..."
+            )
+        self.automations = tuple(automations)
+        self.policy = policy
+        self.metrics_interval = params.get("metrics_interval", 1)
+        self.dest_prefix = params.get("dest_prefix", "")
+
+    @property
+    def verifiable(self) -> bool:
+        return all(a.verifiable for a in self.automations)
+
+    def _sizes(self, filemap: Dict[str, dict]) -> Dict[str, int]:
+        if not filemap:
+            filemap = AbstractController.get_source_file_map(self.config)
+        if not self.files:
+            return {k: int(v["size"] * _GB) for k, v in filemap.items()}
+        missing = [f for f in map(str, self.files) if f not in filemap]
+        if missing:
+            logger.warning(
+                f"[{self.label}] {len(missing)} files without size. Routing them as empty."
+            )
+        return {
+            f: int(filemap.get(f, {}).get("size", 0) * _GB)
+            for f in map(str, self.files)
+        }
+
+    def route(self, filemap: Optional[Dict[str, dict]] = None) -> List[List[str]]:
+        parts = self.policy.route(self._sizes(filemap or {}), len(self.automations))
+        for automation, part in zip(self.automations, parts):
+            automation.files = tuple(part)
+            # NiFi and rclone children copy the whole source bucket by default
+            if getattr(automation, "listing_mode", None) == "bucket":
+                automation.listing_mode = "files"
+            if getattr(automation, "files_from", None) is False:
+                automation.files_from = True
+            logger.info(
+                f"[{self.label}] {len(part)} files routed to {automation.label}"
+            )
+        return parts
+
+    def run_automation(self, **kwargs) -> Tuple[TransferDTO]:
+        return tuple(self.stream_automation(**kwargs))
+
+    def stream_automation(self, **kwargs) -> Iterator[TransferDTO]:
+        # the children keep their own files, scoping and prefix
+        # outside of this composite
+        saved = [
+            (
+                a,
+                a.files,
+                a.dest_prefix,
+                {k: getattr(a, k) for k in self._SCOPING if hasattr(a, k)},
+            )
+            for a in self.automations
+        ]
+        try:
+            start = time.time()
+            parts = self.route(kwargs.get("filemap"))
+            self.timings["routing"] = time.time() - start
+
+            # children without files would transfer everything
+            children = [a for a, part in zip(self.automations, parts) if part]
+            if self.dest_prefix:
+                for automation in children:
+                    automation.dest_prefix = self.dest_prefix
+            if self.recorder is not None:
+                # in <label>/trial<i>/<child>/, replayed by `replay_automation`
+                for automation in children:
+                    automation.recorder = self.recorder.scope(automation)
+            records = queue.Queue()
+            done = object()
+            errors = []
+
+            def _run(automation: AbstractAutomation) -> None:
+                try:
+                    for dto in automation.stream_automation(**kwargs):
+                        if automation.recorder is not None:
+                            automation.recorder.add_record(dto)
+                        records.put(dto)
+                except BaseException as e:
+                    logger.error(f"[{automation.label}] failed: {e}")
+                    errors.append(e)
+                finally:
+                    records.put(done)
+
+            threads = [
+                threading.Thread(target=_run, args=(a,), name=a.label, daemon=True)
+                for a in children
+            ]
+            for thread in threads:
+                thread.start()
+
+            seen = []
+            last_observed = time.time()
+            running = len(threads)
+            while running:
+                dto = records.get()
+                if dto is done:
+                    running -= 1
+                    continue
+                yield dto
+                if self.metrics is not None:
+                    seen.append(dto)
+                    if time.time() - last_observed >= self.metrics_interval:
+                        last_observed = time.time()
+                        self._observe_progress(seen)
+            for thread in threads:
+                thread.join()
+            self._observe_progress(seen)
+
+            for automation in children:
+                for stage, seconds in automation.timings.items():
+                    self.timings[f"{automation.label}.{stage}"] = seconds
+            self.timings["transfer"] = time.time() - start - self.timings["routing"]
+            if errors:
+                raise errors[0]
+        finally:
+            for automation, files, prefix, scoping in saved:
+                automation.files = files
+                automation.dest_prefix = prefix
+                automation.recorder = None
+                vars(automation).update(scoping)
+
+    def replay_automation(
+        self, artifacts: TrialArtifacts, **kwargs
+    ) -> Tuple[TransferDTO]:
+        """
+        Replay each child over its own recorded artifacts. The children are
+        matched by label, or rebuilt from the recording (see
+        `misc.replay.TrialArtifacts.child_automation`).
+        Recordings without children are returned as they are.
+        """
+        if not artifacts.children:
+            return super().replay_automation(artifacts, **kwargs)
+        automations = {a.label: a for a in getattr(self, "automations", ())}
+        records = []
+        for label in artifacts.children:
+            child_artifacts = artifacts.child(label)
+            automation = automations.get(label) or artifacts.child_automation(label)
+            files = automation.files
+            automation.files = tuple(child_artifacts.json("files.json"))
+            automation.timings = dict(child_artifacts.timings)
+            try:
+                records.extend(automation.replay_automation(child_artifacts, **kwargs))
+            finally:
+                automation.files = files
+        return tuple(records)
@@ -1,21 +1,41 @@
+import os
+import statistics
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 
-import numpy as np
 from loguru import logger
 
-try:
-    import matplotlib.pyplot as plt
+from ._base import AbstractAutomation, AbstractController
+from .misc.metrics import MetricsExporter
+from .misc.probe import LinkProbe, probe_link
+from .misc.replay import RunBundle, RunRecorder
+from .misc.reset import reset_bucket
+from .misc.streaming import ResultWriter, RunningThroughput, read_results
+from .misc.verify import verify_transfer
+from .structures import TransferDTO
 
-    MATPLOTLIB = True
-except ModuleNotFoundError:
-    MATPLOTLIB = False
-    logger.warning("matplotlib not found!")
+_PYPLOT = None
+_PYPLOT_LOCK = threading.Lock()
 
 
-from ._base import AbstractController
-from .structures import TransferDTO
+def _pyplot():
+    """
+    `matplotlib.pyplot`, imported on first use as it's slow to import
+    and only needed for the graphs. `None` if matplotlib isn't installed.
+    """
+    global _PYPLOT
+    if _PYPLOT is None:
+        try:
+            import matplotlib.pyplot as plt
+
+            _PYPLOT = plt
+        except ModuleNotFoundError:
+            logger.warning("matplotlib not found!")
+            _PYPLOT = False
+    return _PYPLOT or None
 
 
 class StandardAutomationController(AbstractController):
@@ -26,6 +46,54 @@ class StandardAutomationController(AbstractController):
         - runs all the available automation (Type[AbstractAutomation])
         - computes throughput for each
         - generate bar graph
+
+    If `metrics_port` is passed to `run(...)`, a local Prometheus-style
+    metrics endpoint is served for the duration of the run.
+
+    Results are consumed through `stream_automation(...)`, so the throughput
+    is computed as the records come in (and logged every `progress_interval`
+    seconds). If `results_path` is passed, the records are written there as
+    JSON lines instead of being kept in memory.
+
+    If `checkpoint_dir` is passed, the automations that support it
+    checkpoint their in-flight transfers there. Running again with
+    `resume=True` reattaches to them instead of resubmitting.
+
+    The throughput only counts the successful transfers. FAILED/TIMED_OUT
+    transfers (see `run_timeout`, `file_timeout` and `straggler_factor` in
+    `misc.deadlines.TransferDeadlines`) are reported under "failures".
+
+    With `verify=True`, the destination is checked against the source after
+    each automation (see `misc.verify.verify_transfer`, `verify_sample` and
+    `verify_hash`). Its time goes to `timings["verification"]`.
+
+    With `trials=N`, each automation is run N times and its result holds the
+    mean throughput and objects/sec along with every trial's result.
+    With `reset_destination=True`, the destination bucket (or `reset_prefix`)
+    is emptied before every run (see `misc.reset.reset_bucket`).
+    Its time goes to `timings["reset"]`.
+
+    With `link_probe=True`, the endpoints are probed first (RTT, single and
+    multi-stream throughput, see `misc.probe.probe_link`) and each result
+    reports its "link_efficiency": the throughput as a fraction of the
+    achievable bandwidth. A known `link_capacity_gbps` can be given instead.
+
+    With `analysis=True`, each result also reports the throughput and
+    objects/sec per object size bin, and the per-object latency and
+    bandwidth of its fitted cost model (see `evalit.analysis`).
+
+    With `record_path="run.tar.gz"`, the raw tool outputs of every run
+    (logs, shell outputs, provenance events) are archived there along with
+    the records, so that the run can be replayed offline through the
+    parsers (see `misc.replay`). `graphs=False` skips the graphs.
+
+    With `contention=True` (or a list of automation labels), the automations
+    are started together on the shared link instead of one after another,
+    each into its own destination prefix (`contention_prefix` + label,
+    unless they have a `dest_prefix`). Each result then reports under
+    "contention" its share of the link over time (in `contention_interval`
+    seconds bins), the aggregate throughput and utilization of the link,
+    and Jain's fairness index (see `analysis.link_share`).
     """
 
     def run(self, **kwargs) -> None:
@@ -42,56 +110,449 @@ class StandardAutomationController(AbstractController):
         file_sizes = tuple(map(lambda x: x["size"], filemap.values()))
         logger.debug(f"Total size of all file blobs => {(sum(file_sizes))}")
 
+        metrics_exporter = None
+        if kwargs.get("metrics_port") is not None:
+            metrics_exporter = MetricsExporter(
+                host=kwargs.get("metrics_host", "127.0.0.1"),
+                port=kwargs["metrics_port"],
+            ).start()
+
+        try:
+            controller_result = self._run_automations(
+                file_sizes, metrics_exporter, **kwargs
+            )
+        finally:
+            if metrics_exporter is not None:
+                metrics_exporter.stop()
+
+        logger.info(
+            f"Controller took total {time.time()-controller_start} seconds to run!"
+        )
+        return controller_result
+
+    def _run_automations(
+        self,
+        file_sizes: Tuple[float],
+        metrics_exporter: Optional[MetricsExporter] = None,
+        **kwargs,
+    ) -> Dict[str, dict]:
+        filemap = kwargs.get("filemap", {})
+        results_path = kwargs.get("results_path")
+        writer = ResultWriter(results_path) if results_path else None
+        recorder = (
+            RunRecorder(kwargs["record_path"], filemap=filemap, run_kwargs=kwargs)
+            if kwargs.get("record_path")
+            else None
+        )
         controller_result = {}
+        try:
+            links = {}
+            for group in self._groups(kwargs.get("contention")):
+                prefixes = {a.label: a.dest_prefix for a in group}
+                if len(group) > 1:
+                    for automation in group:
+                        # concurrent automations never write the same keys
+                        automation.dest_prefix = automation.dest_prefix or (
+                            f"{kwargs.get('contention_prefix', 'evalit-contention/')}{automation.label}/"
+                        )
+                try:
+                    controller_result.update(
+                        self._run_group(
+                            group,
+                            file_sizes,
+                            links,
+                            writer,
+                            recorder,
+                            metrics_exporter,
+                            **kwargs,
+                        )
+                    )
+                finally:
+                    for automation in group:
+                        automation.dest_prefix = prefixes[automation.label]
+        finally:
+            if writer is not None:
+                writer.close()
+            if recorder is not None:
+                recorder.close(controller_result)
+        return controller_result
+
+    def _groups(
+        self, contention: Union[bool, Sequence[str], None]
+    ) -> List[List[AbstractAutomation]]:
+        """
+        The automations to run together, in order.
+        With `contention=True` all of them run at once; with a list of
+        labels, those run at once (where the first of them is) and the
+        others one after another.
+        """
+        if not contention:
+            return [[a] for a in self.automations]
+        if contention is True:
+            return [list(self.automations)]
+        selected = set(contention)
+        unknown = selected - {a.label for a in self.automations}
+        if unknown:
+            raise ValueError(f"Unknown automations in contention: {sorted(unknown)}")
+        groups, concurrent = [], []
         for automation in self.automations:
-            results: Tuple[TransferDTO] = automation.run_automation(**kwargs)
-            results = tuple(
-                filter(
-                    lambda r: r.start_time is not None and r.end_time is not None,
+            if automation.label not in selected:
+                groups.append([automation])
+                continue
+            if not concurrent:
+                groups.append(concurrent)
+            concurrent.append(automation)
+        return groups
+
+    def _run_group(
+        self,
+        group: List[AbstractAutomation],
+        file_sizes: Tuple[float],
+        links: Dict[tuple, LinkProbe],
+        writer: Optional[ResultWriter] = None,
+        recorder: Optional[RunRecorder] = None,
+        metrics_exporter: Optional[MetricsExporter] = None,
+        **kwargs,
+    ) -> Dict[str, dict]:
+        """
+        Run the trials of a group of automations started together
+        (usually a single one), and build their results.
+        """
+        filemap = kwargs.get("filemap", {})
+        trials = max(1, int(kwargs.get("trials", 1)))
+        # the link of each automation, probed once per distinct endpoint pair
+        group_links: Dict[str, LinkProbe] = {}
+        for automation in group:
+            if metrics_exporter is not None:
+                automation.metrics = metrics_exporter.scope(automation.label, filemap)
+            if kwargs.get("link_probe"):
+                group_links[automation.label] = self._probe_link(
+                    automation, links, **kwargs
+                )
+        capacity = self._shared_capacity(group_links, **kwargs)
+
+        trial_results = {a.label: [] for a in group}
+        for trial in range(trials):
+            for automation in group:
+                automation.timings = {}
+                if kwargs.get("reset_destination") and not kwargs.get("resume"):
+                    reset = reset_bucket(
+                        automation.config,
+                        prefix=automation.dest_prefix + kwargs.get("reset_prefix", ""),
+                        njobs=kwargs.get("reset_njobs", 16),
+                    )
+                    # reported apart, never part of the transfer time
+                    automation.timings["reset"] = reset["seconds"]
+                if recorder is not None:
+                    automation.recorder = recorder.scope(automation, trial)
+            records = {a.label: [] for a in group} if len(group) > 1 else None
+            try:
+                results = self._stream_group(
+                    group,
+                    file_sizes,
+                    writer,
+                    trial=trial if trials > 1 else None,
+                    records=records,
+                    **kwargs,
+                )
+            finally:
+                for automation in group:
+                    if automation.recorder is not None:
+                        recorder.close_scope(automation, trial, automation.recorder)
+                        automation.recorder = None
+            if records is not None:
+                self._contention(
                     results,
+                    records,
+                    filemap,
+                    capacity,
+                    kwargs.get("contention_interval"),
+                )
+            for automation, result in zip(group, results):
+                trial_results[automation.label].append(result)
+
+        group_result = {}
+        for automation in group:
+            results = trial_results[automation.label]
+            result = results[0] if trials == 1 else self._aggregate_trials(results)
+            link = group_links.get(automation.label)
+            if link is not None:
+                result["link"] = link.summary()
+                result["link_efficiency"] = link.efficiency(result["throughput"])
+            elif kwargs.get("link_capacity_gbps"):
+                result["link_efficiency"] = round(
+                    result["throughput"] / kwargs["link_capacity_gbps"], 3
+                )
+            group_result[automation.label] = result
+        return group_result
+
+    def _stream_group(
+        self,
+        group: List[AbstractAutomation],
+        file_sizes: Tuple[float],
+        writer: Optional[ResultWriter] = None,
+        trial: Optional[int] = None,
+        records: Optional[Dict[str, List[TransferDTO]]] = None,
+        **kwargs,
+    ) -> List[dict]:
+        """
+        `_stream_automation(...)` of every automation of the group,
+        each in its own thread when there are several.
+        """
+        if len(group) == 1:
+            return [
+                self._stream_automation(group[0], file_sizes, writer, trial, **kwargs)
+            ]
+        logger.info(f"Running {[a.label for a in group]} concurrently...")
+        with ThreadPoolExecutor(max_workers=len(group)) as executor:
+            futures = [
+                executor.submit(
+                    self._stream_automation,
+                    automation,
+                    file_sizes,
+                    writer,
+                    trial,
+                    collect=records[automation.label],
+                    **kwargs,
                 )
+                for automation in group
+            ]
+            return [future.result() for future in futures]
+
+    @staticmethod
+    def _contention(
+        results: List[dict],
+        records: Dict[str, List[TransferDTO]],
+        filemap: dict,
+        capacity_gbps: Optional[float] = None,
+        interval: Optional[float] = None,
+    ) -> None:
+        """
+        Share of the link of each automation over time, and how fairly
+        they shared it (see `analysis.link_share`).
+        """
+        from .analysis import link_share
+
+        share = link_share(records, filemap, interval, capacity_gbps)
+        timeline = share["timeline"]
+        for (label, tool), result in zip(share["tools"].items(), results):
+            result["contention"] = dict(
+                tool,
+                concurrent_with=[other for other in records if other != label],
+                jain=share["jain"],
+                aggregate_gbps=share["aggregate_gbps"],
+                utilization=share.get("utilization"),
+                timeline=dict(
+                    t=timeline["t"],
+                    gbps=timeline["gbps"].get(label, []),
+                    share=timeline["share"].get(label, []),
+                    total_gbps=timeline["total_gbps"],
+                    jain=timeline["jain"],
+                ),
             )
-            if self.debug:
-                logger.debug(f"[{automation.__classname__}] Results :: {results}")
+        logger.info(
+            f"Contention: jain = {share['jain']} | aggregate = {share['aggregate_gbps']} Gbps | shares = { {k: v.get('share') for k, v in share['tools'].items()} }"
+        )
 
-            # filter results based on filemap
-            results_filemapped = tuple(filter(lambda r: r.fname in filemap, results))
+    @staticmethod
+    def _shared_capacity(
+        group_links: Dict[str, LinkProbe], **kwargs
+    ) -> Optional[float]:
+        """
+        Capacity (Gbps) of the link shared by the automations of a group,
+        for their contention utilization. `None` when they run over
+        different endpoint pairs, as there's no single link to share.
+        """
+        if not group_links:
+            return kwargs.get("link_capacity_gbps")
+        distinct = {id(link): link for link in group_links.values()}
+        if len(distinct) > 1:
+            logger.info(
+                f"{list(group_links)} run over {len(distinct)} distinct links. "
+                "No shared link utilization."
+            )
+            return None
+        return next(iter(distinct.values())).capacity_gbps
 
-            # in case in some automation, fname are temp ids returned by
-            # the transfer. So, in that case, no file matches.
-            results_filemapped = (
-                results if not results_filemapped else results_filemapped
+    @staticmethod
+    def _probe_link(
+        automation: AbstractAutomation, links: Dict[tuple, LinkProbe], **kwargs
+    ) -> LinkProbe:
+        """
+        Probe the endpoints of the automation, once per distinct
+        source/destination pair.
+        """
+        cfg = automation.config
+        key = tuple(
+            cfg.get(k)
+            for k in (
+                "source_s3_endpoint",
+                "source_s3_bucket",
+                "dest_s3_endpoint",
+                "dest_s3_bucket",
+            )
+        )
+        if key not in links:
+            links[key] = probe_link(
+                cfg,
+                streams=kwargs.get("probe_streams", 16),
+                duration=kwargs.get("probe_duration", 5.0),
             )
+        return links[key]
+
+    @staticmethod
+    def _aggregate_trials(trial_results: List[dict]) -> dict:
+        """
+        Mean throughput and objects/sec over the trials of an automation,
+        along with the result of each trial.
+        """
+        return {
+            "throughput": round(
+                statistics.mean(r["throughput"] for r in trial_results), 3
+            ),
+            "objects_per_sec": round(
+                statistics.mean(r["objects_per_sec"] for r in trial_results), 3
+            ),
+            "trials": trial_results,
+        }
+
+    def _stream_automation(
+        self,
+        automation: AbstractAutomation,
+        file_sizes: Tuple[float],
+        writer: Optional[ResultWriter] = None,
+        trial: Optional[int] = None,
+        collect: Optional[List[TransferDTO]] = None,
+        **kwargs,
+    ) -> dict:
+        """
+        Consume the records of a single automation as they are yielded,
+        keeping a running throughput. The successful records are also
+        appended to `collect`, if given.
 
-            file_sizes_filemapped = tuple(
-                map(lambda r: filemap[r.fname]["size"], results_filemapped)
+        If a `writer` is given, the records are written to it and not kept
+        in memory. The graph is then generated from the written results.
+        """
+        name = automation.label if trial is None else f"{automation.label}-trial{trial}"
+        progress_interval = kwargs.get("progress_interval", 30)
+        tracker = RunningThroughput(kwargs.get("filemap", {}), file_sizes)
+        results = []
+        verify = kwargs.get("verify", False) and automation.verifiable
+        transferred = []
+        last_progress = time.time()
+        for dto in self._automation_records(automation, trial or 0, **kwargs):
+            if automation.recorder is not None:
+                automation.recorder.add_record(dto)
+            counted = tracker.add(dto)
+            if counted and collect is not None:
+                collect.append(dto)
+            if counted and verify:
+                transferred.append(dto.fname)
+            if writer is not None and (counted or dto.failed):
+                writer.write(dto, automation=name)
+            elif counted:
+                results.append(dto)
+            if progress_interval and time.time() - last_progress >= progress_interval:
+                last_progress = time.time()
+                logger.info(
+                    f"[{name}] {tracker.count} files | running throughput = {tracker.throughput()} | objects/sec = {tracker.objects_per_second()}"
+                )
+
+        if self.debug and writer is None:
+            logger.debug(f"[{name}] Results :: {results}")
+
+        if tracker.count and tracker.span <= 0:
+            logger.error("Error while computing throughput!")
+        throughput = tracker.throughput()
+        logger.info(f"[{name}] Throughput = {throughput}")
+        result = {
+            "throughput": throughput,
+            "objects_per_sec": tracker.objects_per_second(),
+        }
+        if tracker.failures:
+            logger.warning(f"[{name}] Failures = {tracker.failures}")
+            result["failures"] = dict(tracker.failures)
+        if verify:
+            report = verify_transfer(
+                automation.config,
+                keys=transferred,
+                sample_fraction=kwargs.get("verify_sample", 0.0),
+                hash_algorithm=kwargs.get("verify_hash", "etag"),
+                njobs=kwargs.get("verify_njobs", 16),
+                dest_prefix=automation.dest_prefix,
             )
-            file_sizes_filemapped = (
-                file_sizes if not file_sizes_filemapped else file_sizes_filemapped
+            result["verification"] = report.summary()
+            # reported apart, never part of the transfer time
+            automation.timings["verification"] = report.seconds
+        elif kwargs.get("verify", False):
+            logger.warning(f"[{name}] Verification isn't supported. Skipping!")
+        if automation.timings:
+            logger.info(f"[{name}] Timings = {automation.timings}")
+            result["timings"] = dict(automation.timings)
+        if kwargs.get("analysis"):
+            self._analyze(
+                result,
+                lambda: results if writer is None else read_results(writer.path, name),
+                kwargs.get("filemap", {}),
             )
 
-            throughput = self.caclulate_throughput(
-                file_sizes_filemapped, results_filemapped
+        if kwargs.get("graphs", True):
+            self.generate_grapgs(
+                name,
+                results
+                if writer is None
+                else filter(lambda d: not d.failed, read_results(writer.path, name)),
             )
-            logger.info(f"[{automation.__classname__}] Throughput = {throughput}")
-            controller_result[automation.__classname__] = {"throughput": throughput}
+        return result
 
-            self.generate_grapgs(automation.__classname__, results)
+    @staticmethod
+    def _analyze(
+        result: dict, records: Callable[[], Iterable[TransferDTO]], filemap: dict
+    ) -> None:
+        """
+        Throughput per object size bin, and the fitted cost model
+        (see `analysis.size_bins` and `analysis.fit_cost_model`).
+        `records` gives a fresh iterable of the records for each pass.
+        """
+        from .analysis import fit_cost_model, size_bins
 
-        logger.info(
-            f"Controller took total {time.time()-controller_start} seconds to run!"
-        )
-        return controller_result
+        result["size_bins"] = size_bins(records(), filemap)
+        result["cost_model"] = fit_cost_model(records(), filemap).summary()
 
-    def generate_grapgs(self, title: str, timesdto: Tuple[TransferDTO]):
-        if not MATPLOTLIB:
+    @staticmethod
+    def _automation_records(
+        automation: AbstractAutomation, trial: int = 0, **kwargs
+    ) -> Iterable[TransferDTO]:
+        """
+        Records of the automation. With `resume=True`, automations that
+        have a checkpoint in `checkpoint_dir` are reattached to instead
+        of being started again.
+        With `replay` (a `misc.replay.RunBundle`), they're parsed from
+        the recorded artifacts of the trial, with the recorded timings.
+        """
+        replay: Optional[RunBundle] = kwargs.get("replay")
+        if replay is not None:
+            artifacts = replay.artifacts(automation.label, trial)
+            automation.timings = dict(artifacts.timings)
+            return automation.replay_automation(artifacts, **kwargs)
+        path = automation.checkpoint_path(kwargs.get("checkpoint_dir"))
+        if kwargs.get("resume") and path is not None and os.path.exists(path):
+            logger.info(f"[{automation.label}] Resuming from {path}")
+            return automation.resume_automation(path, **kwargs)
+        return automation.stream_automation(**kwargs)
+
+    def generate_grapgs(self, title: str, timesdto: Iterable[TransferDTO]):
+        plt = _pyplot()
+        if plt is None:
             logger.warning("Matplotlib not found. Can't generate figure! Halting!")
             return
 
         times = self.dtotimes_to_times(timesdto)
-        for i in range(len(times)):
-            plt.barh(i + 1, times[i][1] - times[i][0], left=times[i][0])
-        plt.savefig(title + ".png")
+        # pyplot isn't thread-safe (concurrent automations)
+        with _PYPLOT_LOCK:
+            for i in range(len(times)):
+                plt.barh(i + 1, times[i][1] - times[i][0], left=times[i][0])
+            plt.savefig(title + ".png")
 
     def caclulate_throughput(
         self, file_sizes: List[int], timesdto: Tuple[TransferDTO]
@@ -99,6 +560,8 @@ class StandardAutomationController(AbstractController):
         """
         Calculate transfer throughput in terms of Gbps
         """
+        import numpy as np
+
         times = self.dtotimes_to_times(timesdto)
         total_volume = sum(file_sizes)
         val = 0
@@ -0,0 +1,800 @@
+"""
+Scale one evaluation across hosts: a coordinator shards the files between
+workers, the workers run the tools on their shard, and stream the transfer
+records back over HTTP. The coordinator merges them into one timeline per
+tool, ie: the aggregate throughput of all the workers together.
+
+The tools run one after another (and each trial of a tool), on all the
+workers at the same time. Shards are balanced by size.
+
+Coordinator (the spec is the one of the `evalit` command, see `evalit.cli`):
+
+    .. code-block:: bash
+
+        export EVALIT_TOKEN=$(openssl rand -hex 16)
+        evalit-distributed coordinator spec.yaml --workers 4 --host 0.0.0.0 -o results.json
+
+Worker, on each transfer host (with the same `EVALIT_TOKEN`):
+
+    .. code-block:: bash
+
+        evalit-distributed worker http://coordinator:8765
+
+Or from python, with worker processes on this host (eg: for testing):
+
+    .. code-block:: python
+
+        coordinator = Coordinator(cfg, tools, filemap, nworkers=4).start()
+        workers = spawn_workers(coordinator.url, 4)
+        results = coordinator.run(trials=2, reset_destination=True)
+
+Protocol (JSON over HTTP):
+
+    - `GET /time`: the coordinator clock, to estimate the worker clock offset
+    - `POST /register`: the worker's shard, the config and the tools
+    - `GET /step?worker=i&step=k`: waits until step `k` starts (or stop)
+    - `POST /records?worker=i&step=k`: JSON lines of records (empty: heartbeat)
+    - `POST /done?worker=i&step=k`: the timings (or error) of the worker
+
+The coordinator listens on 127.0.0.1 unless told otherwise. With a shared
+`token` (`--token` or `EVALIT_TOKEN`), every request must carry it
+(`Authorization: Bearer <token>`). The config (credentials included) is sent
+to the workers as is, unless `share_config=False`, in which case they load
+their own (`--config`). Sharing it from a non-loopback address requires a
+token. The traffic isn't encrypted: only use it on a trusted network.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hmac
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from loguru import logger
+
+from .misc.streaming import (
+    ResultWriter,
+    RunningThroughput,
+    dto_to_record,
+    record_to_dto,
+)
+from .structures import TransferDTO
+
+# seconds a `GET /step` request is held before the worker asks again
+_LONG_POLL = 30.0
+
+
+def shard_files(filemap: Dict[str, dict], nshards: int) -> List[List[str]]:
+    """
+    Split the files into `nshards` shards of about the same total size
+    (largest files first, each to the smallest shard so far).
+    """
+    shards: List[List[str]] = [[] for _ in range(nshards)]
+    sizes = [0.0] * nshards
+    for fname, meta in sorted(
+        filemap.items(), key=lambda item: item[1].get("size", 0), reverse=True
+    ):
+        i = sizes.index(min(sizes))
+        shards[i].append(fname)
+        sizes[i] += meta.get("size", 0)
+    return shards
+
+
+# loopback addresses, where sharing the config without a token is allowed
+_LOOPBACK = ("127.0.0.1", "localhost", "::1")
+
+
+def _request(
+    url: str,
+    data: Optional[bytes] = None,
+    timeout: float = 60.0,
+    token: Optional[str] = None,
+) -> Any:
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    request = urllib.request.Request(
+        url,
+        data=data,
+        method="GET" if data is None else "POST",
+        headers=headers,
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        body = response.read()
+    return json.loads(body) if body else None
+
+
+class _Worker:
+    __slots__ = (
+        "index",
+        "name",
+        "offset",
+        "last_seen",
+        "lost",
+        "stopped",
+        "steps",
+        "received",
+    )
+
+    def __init__(self, index: int, name: str, offset: float) -> None:
+        self.index = index
+        self.name = name
+        # seconds to add to the worker's times to get the coordinator's
+        self.offset = offset
+        self.last_seen = time.time()
+        self.lost = False
+        self.stopped = False
+        # step => result of the worker
+        self.steps: Dict[int, dict] = {}
+        # records received in the current step, to skip the resent ones
+        self.received: set = set()
+
+
+class Coordinator:
+    """
+    Hands out the shards and steps to the workers, and merges the
+    records they stream back.
+
+    Args:
+        `config`: `dict`
+            The endpoints config.
+
+        `tools`: `Sequence[dict]`
+            Tools as in the `evalit` spec, eg: `{"type": "rclone",
+            "name": "rclone-16", "params": {"ntransfers": 16}}`.
+
+        `filemap`: `Dict[str, dict]`
+            The files to transfer and their sizes.
+
+        `nworkers`: `int`
+            Number of workers (and shards) the run waits for.
+
+        `worker_timeout`: `float`
+            Seconds without news from a worker before it's considered lost.
+            Its shard isn't transferred anymore, and the results report it.
+
+        `token`: `str`
+            Shared secret the workers must send with every request.
+            Required to share the config from a non-loopback `host`.
+    """
+
+    def __init__(
+        self,
+        config: Dict[str, str],
+        tools: Sequence[Dict[str, Any]],
+        filemap: Dict[str, dict],
+        nworkers: int,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        worker_timeout: float = 300.0,
+        share_config: bool = True,
+        token: Optional[str] = None,
+    ) -> None:
+        if nworkers < 1:
+            raise ValueError(f"nworkers must be >= 1. Got {nworkers}")
+        if share_config and not token and host not in _LOOPBACK:
+            raise ValueError(
+                f"Sharing the config (credentials) on {host} needs a token!"
+            )
+        names = [tool.get("name", tool["type"]) for tool in tools]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Tool names must be unique. Got {names}")
+        self.config = config
+        self.tools = [dict(tool, name=name) for tool, name in zip(tools, names)]
+        self.filemap = filemap
+        self.nworkers = int(nworkers)
+        self.host = host
+        self.port = int(port)
+        self.worker_timeout = worker_timeout
+        self.share_config = share_config
+        self.token = token
+        self.shards = shard_files(filemap, self.nworkers)
+
+        self.steps: List[Tuple[str, int]] = []
+        self.worker_kwargs: Dict[str, Any] = {}
+        self._workers: Dict[int, _Worker] = {}
+        self._cond = threading.Condition()
+        self._step = -1
+        self._trials = 1
+        self._stopped = False
+        self._tracker: Optional[RunningThroughput] = None
+        self._writer: Optional[ResultWriter] = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> Coordinator:
+        coordinator = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def _reply(self, code: int, payload: Any) -> None:
+                body = json.dumps(payload, default=str).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self, method: str) -> None:
+                if coordinator.token and not hmac.compare_digest(
+                    self.headers.get("Authorization", ""),
+                    f"Bearer {coordinator.token}",
+                ):
+                    self._reply(401, {"error": "Invalid token"})
+                    return
+                url = urlsplit(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                try:
+                    code, payload = coordinator._dispatch(method, url.path, query, body)
+                except (KeyError, ValueError) as e:
+                    code, payload = 400, {"error": str(e)}
+                self._reply(code, payload)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.daemon_threads = True
+        # in case port=0 was used, pick the one assigned by the OS
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Coordinator listening at {self.url}/")
+        return self
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        logger.info("Coordinator stopped.")
+
+    def _dispatch(
+        self, method: str, path: str, query: Dict[str, str], body: bytes
+    ) -> Tuple[int, Any]:
+        if method == "GET" and path == "/time":
+            return 200, {"now": datetime.now().isoformat()}
+        if method == "POST" and path == "/register":
+            return self._register(json.loads(body or b"{}"))
+        worker = self._workers.get(int(query["worker"]))
+        if worker is None:
+            return 404, {"error": f"Unknown worker {query['worker']}"}
+        worker.last_seen = time.time()
+        step = int(query["step"])
+        if method == "GET" and path == "/step":
+            return 200, self._wait_step(worker, step)
+        if method == "POST" and path == "/records":
+            return 200, {"count": self._add_records(worker, step, body)}
+        if method == "POST" and path == "/done":
+            with self._cond:
+                worker.steps.setdefault(step, {}).update(json.loads(body or b"{}"))
+                self._cond.notify_all()
+            return 200, {}
+        return 404, {"error": f"No route {method} {path}"}
+
+    def _register(self, info: Dict[str, Any]) -> Tuple[int, Any]:
+        with self._cond:
+            if len(self._workers) >= self.nworkers:
+                return 409, {"error": f"All the {self.nworkers} shards are taken."}
+            index = len(self._workers)
+            worker = _Worker(
+                index, info.get("name") or f"worker-{index}", info.get("offset", 0.0)
+            )
+            self._workers[index] = worker
+            self._cond.notify_all()
+        logger.info(
+            f"[{worker.name}] registered as worker {index} | {len(self.shards[index])} files | clock offset = {round(worker.offset, 3)}s"
+        )
+        return 200, dict(
+            worker=index,
+            files=self.shards[index],
+            config=self.config if self.share_config else None,
+            tools=self.tools,
+        )
+
+    def _wait_step(self, worker: _Worker, step: int) -> Dict[str, Any]:
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._stopped or self._step >= step, timeout=_LONG_POLL
+            )
+            worker.last_seen = time.time()
+            if self._stopped or step >= len(self.steps) or worker.lost:
+                worker.stopped = True
+                self._cond.notify_all()
+                return {"stop": True}
+            if self._step < step:
+                return {"wait": True}
+            tool, trial = self.steps[step]
+            return dict(step=step, tool=tool, trial=trial, run=self.worker_kwargs)
+
+    def _add_records(self, worker: _Worker, step: int, body: bytes) -> int:
+        offset = timedelta(seconds=worker.offset)
+        dtos = []
+        for line in body.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            dto = record_to_dto(json.loads(line))
+            # on the coordinator's clock
+            dto.start_time = dto.start_time + offset if dto.start_time else None
+            dto.end_time = dto.end_time + offset if dto.end_time else None
+            dtos.append(dto)
+        with self._cond:
+            if step != self._step or self._tracker is None:
+                logger.warning(
+                    f"[{worker.name}] {len(dtos)} records of step {step} ignored (current step is {self._step})"
+                )
+                return 0
+            tool, trial = self.steps[step]
+            result = worker.steps.setdefault(step, {})
+            for dto in dtos:
+                # a batch is resent when its reply was lost
+                key = (dto.fname, dto.start_time, dto.end_time, str(dto.status))
+                if key in worker.received:
+                    continue
+                worker.received.add(key)
+                counted = self._tracker.add(dto)
+                result["files"] = result.get("files", 0) + int(counted)
+                if self._writer is not None and (counted or dto.failed):
+                    self._writer.write(
+                        dto,
+                        automation=tool
+                        if self._trials == 1
+                        else f"{tool}-trial{trial}",
+                        worker=worker.name,
+                    )
+        return len(dtos)
+
+    def _wait_registered(self, timeout: Optional[float] = None) -> None:
+        with self._cond:
+            if not self._cond.wait_for(
+                lambda: len(self._workers) >= self.nworkers, timeout=timeout
+            ):
+                raise TimeoutError(
+                    f"Only {len(self._workers)}/{self.nworkers} workers registered after {timeout}s"
+                )
+
+    def _wait_step_done(self, step: int) -> None:
+        def ready() -> bool:
+            return all(
+                w.lost or "done" in w.steps.get(step, {})
+                for w in self._workers.values()
+            )
+
+        with self._cond:
+            while not self._cond.wait_for(ready, timeout=1.0):
+                for worker in self._workers.values():
+                    if (
+                        not worker.lost
+                        and time.time() - worker.last_seen > self.worker_timeout
+                    ):
+                        logger.error(
+                            f"[{worker.name}] no news for {self.worker_timeout}s. Worker lost!"
+                        )
+                        worker.lost = True
+                if all(w.lost for w in self._workers.values()):
+                    raise RuntimeError("All the workers are lost!")
+
+    def run(self, **kwargs) -> Dict[str, dict]:
+        """
+        Run the tools on all the workers, and merge their records.
+
+        Args:
+            `trials`, `reset_destination`, `reset_prefix`, `reset_njobs`,
+            `results_path`: like `StandardAutomationController.run(...)`.
+
+            `register_timeout`: `float`
+                Seconds to wait for all the workers to register.
+
+        The other keyword arguments are passed to the `stream_automation`
+        of the workers' tools.
+        """
+        from .controller import StandardAutomationController
+        from .misc.reset import reset_bucket
+
+        trials = self._trials = max(1, int(kwargs.pop("trials", 1)))
+        reset = kwargs.pop("reset_destination", False)
+        reset_prefix = kwargs.pop("reset_prefix", "")
+        reset_njobs = kwargs.pop("reset_njobs", 16)
+        results_path = kwargs.pop("results_path", None)
+        register_timeout = kwargs.pop("register_timeout", None)
+        self.worker_kwargs = kwargs
+        self.steps = [
+            (tool["name"], trial) for tool in self.tools for trial in range(trials)
+        ]
+        if self._server is None:
+            self.start()
+
+        logger.info(f"Waiting for {self.nworkers} workers at {self.url}...")
+        self._wait_registered(register_timeout)
+
+        self._writer = ResultWriter(results_path) if results_path else None
+        trial_results: Dict[str, List[dict]] = {tool["name"]: [] for tool in self.tools}
+        try:
+            for step, (tool, trial) in enumerate(self.steps):
+                timings = {}
+                if reset:
+                    timings["reset"] = reset_bucket(
+                        self.config, prefix=reset_prefix, njobs=reset_njobs
+                    )["seconds"]
+                with self._cond:
+                    self._tracker = RunningThroughput(self.filemap)
+                    self._step = step
+                    for worker in self._workers.values():
+                        # the timeout counts from the start of the step
+                        worker.last_seen = time.time()
+                        worker.received = set()
+                    self._cond.notify_all()
+                logger.info(
+                    f"[{tool}] trial {trial} started on {self.nworkers} workers"
+                )
+                self._wait_step_done(step)
+                with self._cond:
+                    result = self._step_result(step, self._tracker)
+                    self._tracker = None
+                if timings:
+                    result["timings"] = timings
+                logger.info(f"[{tool}] Throughput = {result['throughput']}")
+                trial_results[tool].append(result)
+        finally:
+            with self._cond:
+                # the workers waiting for a step stop
+                self._stopped = True
+                self._cond.notify_all()
+                # give them a chance to hear it before the server is stopped
+                self._cond.wait_for(
+                    lambda: all(w.stopped or w.lost for w in self._workers.values()),
+                    timeout=_LONG_POLL,
+                )
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+        return {
+            tool: (
+                results[0]
+                if trials == 1
+                else StandardAutomationController._aggregate_trials(results)
+            )
+            for tool, results in trial_results.items()
+        }
+
+    def _step_result(self, step: int, tracker: RunningThroughput) -> dict:
+        result = {
+            "throughput": tracker.throughput(),
+            "objects_per_sec": tracker.objects_per_second(),
+            "workers": {},
+        }
+        if tracker.failures:
+            result["failures"] = dict(tracker.failures)
+        for worker in self._workers.values():
+            summary = dict(worker.steps.get(step, {}))
+            summary.pop("done", None)
+            if worker.lost and "error" not in summary:
+                summary["error"] = "lost"
+            result["workers"][worker.name] = summary
+        return result
+
+
+class _RecordSender:
+    """
+    Sends the records of a step to the coordinator in batches, from a
+    background thread. An empty batch is sent as a heartbeat when the
+    tool yields nothing for `flush_interval` seconds.
+
+    A failed batch is retried `retries` times with exponential backoff.
+    If it still fails, its records are lost, and `error` is set so that
+    the step is reported as failed.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        token: Optional[str] = None,
+        retries: int = 5,
+        backoff: float = 0.5,
+    ) -> None:
+        self.url = url
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.token = token
+        self.retries = retries
+        self.backoff = backoff
+        self.error: Optional[str] = None
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def send(self, dto: TransferDTO) -> None:
+        self._queue.put(dto)
+
+    def _loop(self) -> None:
+        batch, closed = [], False
+        last_flush = time.time()
+        while not closed:
+            try:
+                dto = self._queue.get(timeout=self.flush_interval)
+                if dto is None:
+                    closed = True
+                else:
+                    batch.append(dto)
+            except queue.Empty:
+                pass
+            if (
+                closed
+                or len(batch) >= self.batch_size
+                or time.time() - last_flush >= self.flush_interval
+            ):
+                self._post(batch)
+                batch, last_flush = [], time.time()
+
+    def _post(self, batch: List[TransferDTO]) -> None:
+        body = "".join(json.dumps(dto_to_record(d)) + "\n" for d in batch)
+        for attempt in range(self.retries + 1):
+            try:
+                _request(self.url, body.encode("utf-8"), token=self.token)
+                return
+            except (OSError, ValueError) as e:
+                if attempt == self.retries:
+                    logger.error(f"{len(batch)} records lost: {e}")
+                    self.error = self.error or f"records lost: {e}"
+                    return
+                delay = min(self.backoff * 2**attempt, 30.0)
+                logger.warning(f"Sending records failed ({e}). Retrying in {delay}s")
+                time.sleep(delay)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+
+def clock_offset(url: str, token: Optional[str] = None) -> float:
+    """
+    Seconds to add to this host's clock (`datetime.now()`, as used for
+    the records) to get the coordinator's.
+    """
+    before = datetime.now()
+    now = datetime.fromisoformat(_request(f"{url}/time", token=token)["now"])
+    after = datetime.now()
+    return (now - (before + (after - before) / 2)).total_seconds()
+
+
+def run_worker(
+    url: str,
+    name: Optional[str] = None,
+    config: Optional[Dict[str, str]] = None,
+    batch_size: int = 500,
+    flush_interval: float = 1.0,
+    token: Optional[str] = None,
+) -> int:
+    """
+    Register to the coordinator at `url` and run the steps it hands out,
+    until it stops. Returns the number of steps run.
+    The `token` defaults to the `EVALIT_TOKEN` environment variable.
+    """
+    from .cli import build_automation
+
+    url = url.rstrip("/")
+    token = token or os.getenv("EVALIT_TOKEN")
+    task = _request(
+        f"{url}/register",
+        json.dumps(dict(name=name, offset=clock_offset(url, token))).encode("utf-8"),
+        token=token,
+    )
+    index, files = task["worker"], tuple(task["files"])
+    config = config or task["config"]
+    if config is None:
+        raise ValueError("The coordinator doesn't share its config. Give one!")
+    tools = {tool["name"]: tool for tool in task["tools"]}
+    logger.info(f"Registered as worker {index} with {len(files)} files")
+
+    step = 0
+    while True:
+        reply = _request(
+            f"{url}/step?worker={index}&step={step}",
+            timeout=2 * _LONG_POLL,
+            token=token,
+        )
+        if reply.get("stop"):
+            break
+        if reply.get("wait"):
+            continue
+        logger.info(f"[{reply['tool']}] trial {reply['trial']} started")
+        done: Dict[str, Any] = dict(done=True)
+        sender = _RecordSender(
+            f"{url}/records?worker={index}&step={step}",
+            batch_size,
+            flush_interval,
+            token,
+        )
+        try:
+            if files:
+                automation = build_automation(tools[reply["tool"]], config, files)
+                automation.timings = {}
+                for dto in automation.stream_automation(**reply["run"]):
+                    sender.send(dto)
+                done["timings"] = dict(automation.timings)
+        except Exception as e:
+            logger.error(f"[{reply['tool']}] failed: {e}")
+            done["error"] = str(e)
+        finally:
+            sender.close()
+        if sender.error is not None:
+            done["error"] = "; ".join(filter(None, (done.get("error"), sender.error)))
+        _request(
+            f"{url}/done?worker={index}&step={step}",
+            json.dumps(done, default=str).encode("utf-8"),
+            token=token,
+        )
+        step += 1
+    logger.info(f"Worker {index} done after {step} steps")
+    return step
+
+
+def spawn_workers(
+    url: str, n: int, token: Optional[str] = None, **popen_kwargs
+) -> List[subprocess.Popen]:
+    """
+    Start `n` worker processes on this host.
+    The `token` is passed through the environment (`EVALIT_TOKEN`).
+    """
+    if token:
+        env = popen_kwargs.get("env") or os.environ
+        popen_kwargs["env"] = dict(env, EVALIT_TOKEN=token)
+    return [
+        subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "evalit.distributed",
+                "worker",
+                url,
+                "--name",
+                f"local-{i}",
+            ],
+            **popen_kwargs,
+        )
+        for i in range(n)
+    ]
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="evalit-distributed",
+        description="Run a benchmark spec over several transfer hosts.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    coordinator = commands.add_parser("coordinator", help="shard and merge")
+    coordinator.add_argument("spec", help="YAML benchmark spec (see `evalit`)")
+    coordinator.add_argument("--workers", "-n", type=int, required=True)
+    coordinator.add_argument(
+        "--host", default="127.0.0.1", help="eg: 0.0.0.0 to accept remote workers"
+    )
+    coordinator.add_argument("--port", type=int, default=8765)
+    coordinator.add_argument(
+        "--local", action="store_true", help="also start the workers on this host"
+    )
+    coordinator.add_argument(
+        "--no-share-config",
+        action="store_true",
+        help="don't send the config (credentials) to the workers",
+    )
+    coordinator.add_argument(
+        "--token",
+        default=os.getenv("EVALIT_TOKEN"),
+        help="shared secret of the workers (default: $EVALIT_TOKEN)",
+    )
+    coordinator.add_argument("--worker-timeout", type=float, default=300.0)
+    coordinator.add_argument("--trials", type=int)
+    coordinator.add_argument("--output", "-o", help="results file (default: stdout)")
+
+    worker = commands.add_parser("worker", help="run the shards")
+    worker.add_argument("url", help="coordinator url, eg: http://host:8765")
+    worker.add_argument("--name", help="default: worker-<index>")
+    worker.add_argument(
+        "--config", help="config yaml (when the coordinator's isn't shared)"
+    )
+    worker.add_argument("--batch-size", type=int, default=500)
+    worker.add_argument(
+        "--token",
+        default=os.getenv("EVALIT_TOKEN"),
+        help="shared secret of the coordinator (default: $EVALIT_TOKEN)",
+    )
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = _parser().parse_args(argv)
+
+    if args.command == "worker":
+        config = None
+        if args.config:
+            from ._base import AbstractAutomation
+
+            config = AbstractAutomation.load_yaml(args.config)
+        run_worker(
+            args.url, args.name, config, batch_size=args.batch_size, token=args.token
+        )
+        return 0
+
+    from .cli import _load_config, load_spec, select_files, write_results
+
+    spec = load_spec(args.spec)
+    cfg = _load_config(spec)
+    _, filemap = select_files(cfg, spec["files"])
+    run_kwargs = dict(spec["run"])
+    if args.trials is not None:
+        run_kwargs["trials"] = args.trials
+
+    coordinator = Coordinator(
+        cfg,
+        spec["tools"],
+        filemap,
+        args.workers,
+        host=args.host,
+        port=args.port,
+        worker_timeout=args.worker_timeout,
+        share_config=not args.no_share_config,
+        token=args.token,
+    ).start()
+    workers = []
+    try:
+        if args.local:
+            workers = spawn_workers(
+                f"http://127.0.0.1:{coordinator.port}", args.workers, args.token
+            )
+        started = datetime.now()
+        start = time.time()
+        results = coordinator.run(**run_kwargs)
+    finally:
+        coordinator.stop()
+        for process in workers:
+            process.wait()
+    document = dict(
+        spec=args.spec,
+        started=started.isoformat(),
+        seconds=time.time() - start,
+        nfiles=len(filemap),
+        nworkers=args.workers,
+        run=run_kwargs,
+        results=results,
+    )
+    if args.output:
+        write_results(args.output, "json", document)
+    else:
+        json.dump(document, sys.stdout, indent=2, default=str)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+from .local_automation import LocalAutomation, get_local_file_map, walk_files
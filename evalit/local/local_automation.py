@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import io
+import mmap
+import os
+import time
+from concurrent.futures import (
+    ALL_COMPLETED,
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+from loguru import logger
+
+from .._base import AbstractAutomation
+from ..misc.s3 import make_s3_client
+from ..structures import TYPE_PATH, TransferDTO, TransferStatus
+
+_MB = 1024 * 1024
+_GB = 1024 * _MB
+
+# S3 multipart uploads need parts of at least 5 MB (except the last one)
+_MIN_PART_SIZE = 5 * _MB
+
+
+def walk_files(root: TYPE_PATH, njobs: int = 8) -> Iterator[Tuple[str, int]]:
+    """
+    Walk the directory tree with `njobs` directories scanned concurrently,
+    which matters on network filesystems where each `scandir` is a round-trip.
+
+    Yields:
+        `(path relative to root, size in bytes)` of every regular file,
+        in no particular order. Symlinks aren't followed.
+    """
+    root = os.fspath(root)
+
+    def _scan(directory: str) -> Tuple[List[Tuple[str, int]], List[str]]:
+        files, subdirs = [], []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    rel = os.path.relpath(entry.path, root)
+                    files.append((rel.replace(os.sep, "/"), entry.stat().st_size))
+        return files, subdirs
+
+    with ThreadPoolExecutor(max_workers=njobs) as executor:
+        pending = {executor.submit(_scan, root)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                pending.update(executor.submit(_scan, d) for d in subdirs)
+                yield from files
+
+
+def get_local_file_map(root: TYPE_PATH, njobs: int = 8) -> Dict[str, dict]:
+    """
+    Same as `AbstractController.get_source_file_map`, for a local directory.
+    The `size` metadata is in GB (GigaBytes).
+    """
+    return {path: dict(size=size / _GB) for path, size in walk_files(root, njobs)}
+
+
+class _MemoryViewReader(io.RawIOBase):
+    """
+    Read-only, seekable file object over a memoryview (eg: a slice of an
+    mmap), so that botocore streams the file's pages to the socket
+    without first copying the part into a bytes object.
+    """
+
+    def __init__(self, view: memoryview) -> None:
+        self._view = view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        n = min(len(buffer), len(self._view) - self._pos)
+        buffer[:n] = self._view[self._pos : self._pos + n]
+        self._pos += n
+        return n
+
+    def read(self, size: int = -1) -> memoryview:
+        # a slice of the view, not a copy: sent and hashed as it is
+        end = len(self._view) if size is None or size < 0 else self._pos + size
+        data = self._view[self._pos : end]
+        self._pos += len(data)
+        return data
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}
+        self._pos = max(0, base[whence] + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def __len__(self) -> int:
+        return len(self._view)
+
+
+class LocalAutomation(AbstractAutomation):
+    """
+    Upload a local (POSIX) directory tree to the destination bucket
+    with boto3, so that disk-to-S3 ingest can be measured through the
+    same controller pipeline as the S3-to-S3 tools.
+
+    Files are memory-mapped and uploaded from `memoryview` slices of the
+    mapping: single PUTs below `multipart_threshold_mb`, multipart
+    uploads of `part_size_mb` parts (uploaded concurrently) above it.
+
+    Only the `dest_*` keys of the config are needed.
+
+    Args:
+        `config`: `str` or `pathlib.Path` or `dict`
+            Yaml config of the destination.
+
+        `files`: `List[str]`
+            Paths (relative to `source_dir`) to upload.
+            Defaults to all the files under `source_dir`.
+
+    Params:
+        `source_dir`: `str`
+            Local directory to upload.
+
+        `reader`: `str`
+            "mmap" (default) or "read", which reads each part into memory
+            with `os.pread` (for comparison, or filesystems without mmap).
+
+        `dest_prefix`: `str`
+            Prefix of the destination keys.
+
+        `njobs`, `walk_jobs`, `part_size_mb`, `multipart_threshold_mb`
+    """
+
+    _CFG_KEYS = {"dest": AbstractAutomation._CFG_KEYS["dest"]}
+    _READERS = ("mmap", "read")
+
+    def __init__(
+        self,
+        config: Union[Dict[str, str], TYPE_PATH],
+        files: Optional[Sequence[TYPE_PATH]] = None,
+        debug: bool = False,
+        **params,
+    ) -> None:
+        super().__init__(
+            config=config, files=files, debug=debug, name=params.get("name")
+        )
+        self.source_dir = params.get("source_dir")
+        if not self.source_dir or not os.path.isdir(self.source_dir):
+            raise ValueError(f"Invalid source_dir={self.source_dir}!")
+        self.reader = params.get("reader", "mmap")
+        if self.reader not in self._READERS:
+            raise ValueError(
+                f"Invalid reader={self.reader}. Expected one of {self._READERS}"
+            )
+        self.dest_prefix = params.get("dest_prefix", "")
+        self.njobs = max(1, int(params.get("njobs", 16)))
+        self.walk_jobs = max(1, int(params.get("walk_jobs", 8)))
+        self.part_size = max(int(params.get("part_size_mb", 64) * _MB), _MIN_PART_SIZE)
+        self.multipart_threshold = int(params.get("multipart_threshold_mb", 64) * _MB)
+
+    @property
+    def verifiable(self) -> bool:
+        # there's no source bucket to verify against
+        return False
+
+    def _files(self) -> Iterator[Tuple[str, int]]:
+        if not self.files:
+            return walk_files(self.source_dir, self.walk_jobs)
+        return (
+            (str(f), os.path.getsize(os.path.join(self.source_dir, str(f))))
+            for f in self.files
+        )
+
+    def run_automation(self, **kwargs) -> Tuple[TransferDTO]:
+        return tuple(self.stream_automation(**kwargs))
+
+    def stream_automation(self, **kwargs) -> Iterator[TransferDTO]:
+        from botocore.config import Config
+
+        start_automation = time.time()
+        # the parts of a file are uploaded on their own pool, so that
+        # the file uploads waiting on them can't starve it
+        client = make_s3_client(
+            self.config, "dest", config=Config(max_pool_connections=2 * self.njobs)
+        )
+        seen = []
+        last_observed = time.time()
+        with ThreadPoolExecutor(max_workers=self.njobs) as executor, ThreadPoolExecutor(
+            max_workers=self.njobs
+        ) as parts:
+            pending: Set[Future] = set()
+
+            def _drain(block: bool) -> Iterator[TransferDTO]:
+                nonlocal pending, last_observed
+                done, pending = wait(
+                    pending, return_when=FIRST_COMPLETED if block else ALL_COMPLETED
+                )
+                for future in done:
+                    dto = future.result()
+                    if self.metrics is not None:
+                        seen.append(dto)
+                    yield dto
+                if self.metrics is not None and time.time() - last_observed >= 1:
+                    last_observed = time.time()
+                    self._observe_progress(seen)
+
+            count = 0
+            for path, size in self._files():
+                count += 1
+                # bounded, so that the walk doesn't run ahead of the uploads
+                while len(pending) >= 2 * self.njobs:
+                    yield from _drain(block=True)
+                pending.add(executor.submit(self._upload, client, parts, path, size))
+            while pending:
+                yield from _drain(block=False)
+
+        self._observe_progress(seen)
+        self.timings["transfer"] = time.time() - start_automation
+        logger.info(
+            f"[{self.label}] Uploaded {count} files from {self.source_dir} "
+            f"in {self.timings['transfer']:.2f} seconds ({self.reader} reader)"
+        )
+
+    def _upload(
+        self, client: Any, parts: ThreadPoolExecutor, path: str, size: int
+    ) -> TransferDTO:
+        dto = TransferDTO(fname=path, transferer="local")
+        dto.start_time = datetime.now()
+        key = self.dest_prefix + path
+        bucket = self.config["dest_s3_bucket"]
+        try:
+            with open(os.path.join(self.source_dir, path), "rb") as f:
+                if size < self.multipart_threshold:
+                    client.put_object(
+                        Bucket=bucket, Key=key, Body=self._read(f, 0, size)
+                    )
+                else:
+                    self._upload_multipart(client, parts, f, bucket, key, size)
+            dto.end_time = datetime.now()
+            dto.nbytes = size
+        except Exception as e:
+            logger.error(f"[{self.label}] Failed to upload {path}: {e}")
+            dto.status = TransferStatus.FAILED
+        return dto
+
+    def _read(self, f, offset: int, size: int) -> Union[bytes, io.RawIOBase]:
+        if size == 0:
+            return b""
+        if self.reader == "read":
+            return os.pread(f.fileno(), size, offset)
+        # mmap offsets must be aligned on the allocation granularity
+        aligned = offset - offset % mmap.ALLOCATIONGRANULARITY
+        mapping = mmap.mmap(
+            f.fileno(), size + offset - aligned, offset=aligned, access=mmap.ACCESS_READ
+        )
+        # the mapping is unmapped once the reader is garbage collected
+        return _MemoryViewReader(memoryview(mapping)[offset - aligned :])
+
+    def _upload_multipart(
+        self,
+        client: Any,
+        parts: ThreadPoolExecutor,
+        f,
+        bucket: str,
+        key: str,
+        size: int,
+    ) -> None:
+        upload_id = client.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+
+        def _part(number: int) -> Dict[str, Any]:
+            offset = (number - 1) * self.part_size
+            body = self._read(f, offset, min(self.part_size, size - offset))
+            response = client.upload_part(
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=number,
+                Body=body,
+            )
+            return dict(PartNumber=number, ETag=response["ETag"])
+
+        nparts = -(-size // self.part_size)
+        try:
+            uploaded = list(parts.map(_part, range(1, nparts + 1)))
+            client.complete_multipart_upload(
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload=dict(Parts=uploaded),
+            )
+        except BaseException:
+            client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+            raise
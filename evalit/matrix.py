@@ -0,0 +1,277 @@
+"""
+Run the tools over a matrix of source/destination endpoint pairs.
+
+Each pair is a full config (like `tests/config.yaml`). The tools of a pair
+run one after another through their own `StandardAutomationController`
+(they share the pair's network path), while pairs that share no network
+path run at the same time:
+
+    .. code-block:: python
+
+        from evalit.matrix import EndpointPair, MatrixRunner
+
+        pairs = [
+            EndpointPair("aws-to-minio", "configs/aws_minio.yaml"),
+            EndpointPair("esa-to-aws", "configs/esa_aws.yaml"),
+        ]
+        tools = {
+            "rclone": lambda cfg, files: RcloneAutomation(cfg, files, ntransfers=16),
+            "native": lambda cfg, files: NativeAutomation(cfg, files, njobs=32),
+        }
+        result = MatrixRunner(pairs, tools).run(trials=3)
+        result.matrix()  # {pair: {tool: throughput}}
+
+The network path of a pair is the set of its endpoint hosts (the AWS region
+when there's no endpoint url), unless given explicitly through `paths`.
+Two pairs conflict when their paths intersect. By default, the paths also
+hold the link of the host running the benchmark ("host"), as tools like
+rclone or native move the data through it, so the pairs run one after
+another. When every tool transfers off this host (eg: NiFi, MFT), pass
+`through_host=False` to run the pairs sharing no endpoint at the same time.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Sequence, Union
+from urllib.parse import urlparse
+
+from loguru import logger
+
+from ._base import AbstractAutomation, AbstractController
+from .structures import TYPE_PATH
+
+TYPE_TOOL = Callable[[Dict[str, str], Sequence[str]], AbstractAutomation]
+
+# network path of the link of the host running the benchmark
+HOST_PATH = "host"
+
+# run arguments that can't be shared by concurrent controllers
+_PER_PAIR_PATHS = ("results_path", "record_path", "checkpoint_dir")
+
+
+def _endpoint_host(cfg: Dict[str, str], side: str) -> str:
+    endpoint = cfg.get(f"{side}_s3_endpoint")
+    if endpoint:
+        return urlparse(endpoint if "//" in endpoint else f"//{endpoint}").hostname
+    return f"aws:{cfg.get(f'{side}_s3_region')}"
+
+
+@dataclass
+class EndpointPair:
+    """
+    A source/destination pair of the matrix.
+
+    Args:
+        `config`: `str` or `dict`
+            The yaml config path (or the config) of the pair.
+
+        `paths`: `Sequence[str]`
+            Names of the network paths the pair uses. Defaults to its
+            endpoint hosts (see `network_paths`).
+
+        `filemap`: `Dict[str, dict]`
+            Files to transfer and their sizes. Defaults to all the
+            source objects (see `AbstractController.get_source_file_map`).
+
+        `through_host`: `bool`
+            Whether the tools move the data through this host, adding the
+            "host" path. Set to `False` for tools running off this host.
+    """
+
+    name: str
+    config: Union[TYPE_PATH, Dict[str, str]]
+    paths: Sequence[str] = ()
+    filemap: Optional[Dict[str, dict]] = None
+    through_host: bool = True
+
+    def __post_init__(self) -> None:
+        if not isinstance(self.config, dict):
+            self.config = AbstractAutomation.load_yaml(self.config)
+
+    @property
+    def network_paths(self) -> FrozenSet[str]:
+        paths = set(self.paths) or {
+            _endpoint_host(self.config, "source"),
+            _endpoint_host(self.config, "dest"),
+        }
+        if self.through_host:
+            paths.add(HOST_PATH)
+        return frozenset(paths)
+
+    def conflicts(self, other: EndpointPair) -> bool:
+        return bool(self.network_paths & other.network_paths)
+
+
+def schedule(pairs: Sequence[EndpointPair]) -> List[List[str]]:
+    """
+    Group the pairs into waves of pairs that share no network path
+    (greedy coloring, in order). Used for planning: the runner starts each
+    pair as soon as its paths are free, without waiting for whole waves.
+    """
+    waves: List[List[EndpointPair]] = []
+    for pair in pairs:
+        for wave in waves:
+            if not any(pair.conflicts(other) for other in wave):
+                wave.append(pair)
+                break
+        else:
+            waves.append([pair])
+    return [[pair.name for pair in wave] for wave in waves]
+
+
+@dataclass
+class MatrixResult:
+    """
+    Results of the matrix run: `results[pair][tool]` is the controller
+    result of the tool on the pair (or `{"error": ...}` if the pair failed).
+    """
+
+    results: Dict[str, Dict[str, dict]] = field(default_factory=dict)
+    seconds: float = 0.0
+    waves: List[List[str]] = field(default_factory=list)
+
+    def matrix(self, metric: str = "throughput") -> Dict[str, Dict[str, Any]]:
+        """
+        `{pair: {tool: metric}}`, `None` where the tool didn't run.
+        """
+        tools = sorted({t for r in self.results.values() for t in r if t != "error"})
+        return {
+            pair: {tool: results.get(tool, {}).get(metric) for tool in tools}
+            for pair, results in self.results.items()
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        return dict(
+            seconds=round(self.seconds, 3),
+            waves=self.waves,
+            throughput=self.matrix("throughput"),
+            objects_per_sec=self.matrix("objects_per_sec"),
+        )
+
+
+def _pair_path(path: str, pair: str) -> str:
+    """
+    `results.jsonl` => `results.<pair>.jsonl`, as concurrent pairs
+    can't share a results file (or checkpoint directory).
+    """
+    if os.path.splitext(path)[1] == "":
+        return os.path.join(path, pair)
+    for ext in (".tar.gz", ".jsonl", ".json"):
+        if path.endswith(ext):
+            return f"{path[: -len(ext)]}.{pair}{ext}"
+    root, ext = os.path.splitext(path)
+    return f"{root}.{pair}{ext}"
+
+
+class MatrixRunner:
+    """
+    Runs every tool on every endpoint pair.
+
+    Args:
+        `pairs`: `Sequence[EndpointPair]`
+            Pair names must be unique.
+
+        `tools`: `Dict[str, Callable[[dict, Sequence[str]], AbstractAutomation]]`
+            Builds the automation of each tool from the config and the
+            files of a pair. The tool name is the label of its result.
+
+        `max_parallel`: `int`
+            Max number of pairs running at the same time
+            (defaults to as many as the paths allow).
+    """
+
+    def __init__(
+        self,
+        pairs: Sequence[EndpointPair],
+        tools: Dict[str, TYPE_TOOL],
+        max_parallel: Optional[int] = None,
+    ) -> None:
+        names = [pair.name for pair in pairs]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Pair names must be unique. Got {names}")
+        if not tools:
+            raise ValueError("MatrixRunner needs at least one tool!")
+        self.pairs = tuple(pairs)
+        self.tools = dict(tools)
+        self.max_parallel = max(1, int(max_parallel or len(self.pairs) or 1))
+
+    def plan(self) -> Dict[str, Any]:
+        return dict(
+            pairs={p.name: sorted(p.network_paths) for p in self.pairs},
+            tools=list(self.tools),
+            waves=schedule(self.pairs),
+        )
+
+    def _run_pair(self, pair: EndpointPair, **kwargs) -> Dict[str, dict]:
+        from .controller import StandardAutomationController
+
+        filemap = pair.filemap
+        if filemap is None:
+            filemap = AbstractController.get_source_file_map(pair.config)
+        automations = []
+        for name, tool in self.tools.items():
+            automation = tool(pair.config, tuple(filemap))
+            automation.name = automation.name or name
+            automations.append(automation)
+        for key in _PER_PAIR_PATHS:
+            if kwargs.get(key):
+                kwargs[key] = _pair_path(str(kwargs[key]), pair.name)
+
+        logger.info(f"[{pair.name}] Running {list(self.tools)}...")
+        return (
+            StandardAutomationController()
+            .add_automations(automations)
+            .run(filemap=filemap, **kwargs)
+        )
+
+    def run(self, **kwargs) -> MatrixResult:
+        """
+        Run the matrix. `kwargs` are passed to the controller run of
+        every pair (see `StandardAutomationController.run`).
+        """
+        if kwargs.pop("metrics_port", None) is not None:
+            logger.warning("metrics_port isn't supported by the matrix runner!")
+        kwargs.setdefault("graphs", False)
+
+        result = MatrixResult(waves=schedule(self.pairs))
+        start = time.time()
+        queued = list(self.pairs)
+        busy: Dict[str, str] = {}
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            running: Dict[Future, EndpointPair] = {}
+            while queued or running:
+                # start every queued pair whose paths are all free, in order
+                for pair in list(queued):
+                    if len(running) >= self.max_parallel:
+                        break
+                    if pair.network_paths & set(busy):
+                        continue
+                    busy.update({path: pair.name for path in pair.network_paths})
+                    queued.remove(pair)
+                    running[executor.submit(self._run_pair, pair, **kwargs)] = pair
+                    logger.info(
+                        f"[{pair.name}] started | running: {[p.name for p in running.values()]}"
+                    )
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pair = running.pop(future)
+                    for path in pair.network_paths:
+                        busy.pop(path, None)
+                    try:
+                        result.results[pair.name] = future.result()
+                    except Exception as e:
+                        logger.error(f"[{pair.name}] failed: {e}")
+                        result.results[pair.name] = {"error": str(e)}
+        result.seconds = time.time() - start
+        # in the order of the pairs
+        result.results = {
+            p.name: result.results[p.name]
+            for p in self.pairs
+            if p.name in result.results
+        }
+        logger.info(f"Matrix of {len(self.pairs)} pairs took {result.seconds} seconds")
+        return result
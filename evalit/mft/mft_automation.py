@@ -1,15 +1,18 @@
 import multiprocessing
 import os
 import time
-from datetime import datetime
-from typing import Dict, List, Optional, Sequence, Tuple, Union
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
 from joblib import Parallel, delayed
 from loguru import logger
 
 from .._base import AbstractAutomation
-from ..misc.shell import ShellExecutor
-from ..structures import TYPE_PATH, TransferDTO
+from ..misc.checkpoint import Checkpoint, dump_timekeeper, load_timekeeper
+from ..misc.deadlines import TransferDeadlines
+from ..misc.parsing import LogPattern, LogScanner, epoch_millis
+from ..misc.replay import TrialArtifacts
+from ..misc.shell import ExecutionDTO, ReplayShellExecutor, ShellExecutor
+from ..structures import TYPE_PATH, TransferDTO, TransferStatus
 
 
 class MFTAutomation(AbstractAutomation):
@@ -20,6 +23,23 @@ class MFTAutomation(AbstractAutomation):
     _LOG_START_PHRASE = "STARTING"
     _LOG_COMPLETE_PHRASE = "COMPLETED"
 
+    # state lines look like "<state> | <epoch millis> | ..."
+    _LOG_SCANNER = LogScanner(
+        [
+            LogPattern(
+                kind,
+                rb"[^|\n]*\|\s*(?P<ts>\d+)",
+                epoch_millis,
+                phrase,
+            )
+            for kind, phrase in (
+                ("start", b"STARTING"),
+                ("end", b"COMPLETED"),
+                ("failed", b"FAILED"),
+            )
+        ]
+    )
+
     def __init__(
         self,
         config: Union[Dict[str, str], TYPE_PATH],
@@ -28,11 +48,14 @@ class MFTAutomation(AbstractAutomation):
         shell_executor: Optional[ShellExecutor] = None,
         njobs: int = 4,
         debug: bool = False,
+        name: Optional[str] = None,
+        dest_prefix: str = "",
     ):
-        super().__init__(config=config, files=files, debug=debug)
+        super().__init__(config=config, files=files, debug=debug, name=name)
 
         assert os.path.exists(mft_dir), f"{mft_dir} path doesn't exist!"
         self.mft_dir = mft_dir
+        self.dest_prefix = dest_prefix
 
         shell_executor = shell_executor or ShellExecutor()
         assert isinstance(shell_executor, ShellExecutor)
@@ -105,10 +128,10 @@ class MFTAutomation(AbstractAutomation):
         self.njobs = njobs
         logger.debug(f"njobs = {njobs}")
 
-    def submit_transfer(
+    def _submit_command(
         self, file_name: str, source_storage_id: str, dest_storage_id: str
-    ):
-        cmd = [
+    ) -> List[str]:
+        return [
             "java",
             "-jar",
             self.mft_dir + "/mft-client.jar",
@@ -121,14 +144,16 @@ class MFTAutomation(AbstractAutomation):
             "-sp",
             file_name,
             "-dp",
-            file_name,
+            f"{self.dest_prefix}{file_name}",
             "-st",
             "S3",
             "-dt",
             "S3",
         ]
 
-        exdto = self.shell_executor(cmd)
+    def _parse_submission(self, exdto: ExecutionDTO, file_name: str) -> Tuple[str, str]:
+        if self.recorder is not None:
+            self.recorder.add_execution(exdto)
 
         # Notes from Nish:
         # to maintain the same previous logic, I just created the original output string
@@ -139,25 +164,137 @@ class MFTAutomation(AbstractAutomation):
 
         return (transfer_id, file_name)
 
-    def run_automation(self, **kwargs) -> Tuple[TransferDTO]:
+    def submit_transfer(
+        self, file_name: str, source_storage_id: str, dest_storage_id: str
+    ):
+        exdto = self.shell_executor(
+            self._submit_command(file_name, source_storage_id, dest_storage_id)
+        )
+        return self._parse_submission(exdto, file_name)
 
+    def _submit_transfers(
+        self,
+        files: Optional[Sequence[str]] = None,
+        checkpoint: Optional[Checkpoint] = None,
+        transfer_id_names: Optional[List[Tuple[str, str]]] = None,
+    ) -> List[Tuple[str, str]]:
+        """
+        Submit the `files` (all by default) in batches of `njobs`, and
+        append their transfer ids to `transfer_id_names`.
+        The ids are checkpointed as each batch returns, so that a resume
+        doesn't submit them again.
+        """
         assert (
             self.source_storage_id and self.dest_storage_id
         ), "Invalid storage ids! Are you sure you have 'source_storage_id' and 'dest_storage_id' in the config?"
 
+        files = self.files if files is None else tuple(files)
+        transfer_id_names = [] if transfer_id_names is None else transfer_id_names
         logger.debug(f"njobs = {self.njobs}")
-        transfer_id_names = Parallel(n_jobs=self.njobs)(
-            delayed(self.submit_transfer)(
-                fname, self.source_storage_id, self.dest_storage_id
-            )
-            for fname in self.files
-        )
-        return self.parse_log(
+        with Parallel(n_jobs=self.njobs) as parallel:
+            for i in range(0, len(files), self.njobs):
+                batch = files[i : i + self.njobs]
+                # only the commands run in the workers, the outputs are parsed here
+                outputs = parallel(
+                    delayed(self.shell_executor)(
+                        self._submit_command(
+                            fname, self.source_storage_id, self.dest_storage_id
+                        )
+                    )
+                    for fname in batch
+                )
+                transfer_id_names.extend(
+                    self._parse_submission(exdto, fname)
+                    for exdto, fname in zip(outputs, batch)
+                )
+                if checkpoint is not None:
+                    checkpoint.update(
+                        transfer_id_names=list(map(list, transfer_id_names)),
+                        force=True,
+                    )
+        return transfer_id_names
+
+    def run_automation(self, **kwargs) -> Tuple[TransferDTO]:
+        return tuple(self.stream_automation(**kwargs))
+
+    def stream_automation(self, **kwargs) -> Iterator[TransferDTO]:
+        """
+        Submit the transfers and yield each record as soon as
+        its transfer state is COMPLETED.
+
+        If `checkpoint_dir` is passed, the submitted transfer ids are
+        checkpointed so that `resume_automation(...)` can reattach to them.
+        """
+        checkpoint = self._open_checkpoint(**kwargs)
+        if checkpoint is not None:
+            checkpoint.update(transfer_id_names=[], force=True)
+        transfer_id_names = self._submit_transfers(checkpoint=checkpoint)
+        if self.recorder is not None:
+            self.recorder.add_json("mft/transfers.json", transfer_id_names)
+        yield from self.iter_log(
             transfer_id_names=transfer_id_names,
             poll_wait_time=kwargs.get("mft_log_poll_time", 5) or 5,
             njobs=kwargs.get("mft_log_parser_njobs", multiprocessing.cpu_count()) or 1,
+            checkpoint=checkpoint,
+            deadlines=TransferDeadlines.from_kwargs(self.files, **kwargs),
         )
 
+    def resume_automation(
+        self, checkpoint: Union[TYPE_PATH, Checkpoint], **kwargs
+    ) -> Tuple[TransferDTO]:
+        """
+        Poll the states of the transfer ids stored in the checkpoint,
+        without submitting them again.
+        The files whose submission wasn't checkpointed are submitted first.
+        """
+        checkpoint = self._load_checkpoint(checkpoint, **kwargs)
+        if checkpoint.done:
+            return load_timekeeper(checkpoint.get("timekeeper", []))
+        transfer_id_names = list(map(tuple, checkpoint["transfer_id_names"]))
+        submitted = set(map(lambda x: x[1], transfer_id_names))
+        pending = [fname for fname in self.files if fname not in submitted]
+        logger.info(
+            f"[{self.__classname__}] Resuming {len(transfer_id_names)} transfers, "
+            f"submitting {len(pending)} more..."
+        )
+        if pending:
+            self._submit_transfers(pending, checkpoint, transfer_id_names)
+        if self.recorder is not None:
+            self.recorder.add_json("mft/transfers.json", transfer_id_names)
+        return tuple(
+            self.iter_log(
+                transfer_id_names=transfer_id_names,
+                poll_wait_time=kwargs.get("mft_log_poll_time", 5) or 5,
+                njobs=kwargs.get("mft_log_parser_njobs", multiprocessing.cpu_count())
+                or 1,
+                checkpoint=checkpoint,
+                deadlines=TransferDeadlines.from_kwargs(self.files, **kwargs),
+            )
+        )
+
+    def replay_automation(
+        self, artifacts: TrialArtifacts, **kwargs
+    ) -> Tuple[TransferDTO]:
+        """
+        Parse the recorded transfer states again: the latest state output
+        of each transfer is served by a `ReplayShellExecutor`.
+        """
+        transfer_id_names = list(map(tuple, artifacts.json("mft/transfers.json")))
+        shell_executor = getattr(self, "shell_executor", None)
+        self.shell_executor = ReplayShellExecutor(artifacts.executions())
+        try:
+            return tuple(
+                self.iter_log(
+                    transfer_id_names=transfer_id_names,
+                    poll_wait_time=0,
+                    njobs=1,
+                    # the final states were recorded: a single poll
+                    deadlines=TransferDeadlines(run_timeout=0),
+                )
+            )
+        finally:
+            self.shell_executor = shell_executor
+
     def parse_log(
         self,
         transfer_id_names: List[str],
@@ -167,16 +304,35 @@ class MFTAutomation(AbstractAutomation):
         """
         Parses the log and returns start/end times for each file transfer.
         """
+        return tuple(self.iter_log(transfer_id_names, poll_wait_time, njobs))
+
+    def iter_log(
+        self,
+        transfer_id_names: List[str],
+        poll_wait_time: int = 5,
+        njobs: int = 1,
+        checkpoint: Optional[Checkpoint] = None,
+        deadlines: Optional[TransferDeadlines] = None,
+    ) -> Iterator[TransferDTO]:
+        """
+        Polls the transfer states and yields the record of each file
+        transfer once it has finished: COMPLETED, FAILED, or TIMED_OUT
+        by the `deadlines`.
+        The partial timekeeper is saved to the `checkpoint` at every poll
+        (subject to the checkpoint interval).
+        """
         nids = len(transfer_id_names)
+        deadlines = deadlines or TransferDeadlines()
 
         timekeeper = {}
+        emitted = set()
         end_counter = 0
         while end_counter < nids:
             logger.debug(
                 f"[{self.__classname__}] log parser polling... {end_counter}/{nids} files transferred!"
             )
             time.sleep(poll_wait_time)
-            end_counter = 0
+            parse_start = time.time()
 
             # get log outputs for all the transfer ids
             outputs = Parallel(n_jobs=njobs)(
@@ -196,26 +352,48 @@ class MFTAutomation(AbstractAutomation):
 
             # parse each log output
             for exdto, (transfer_id, file_name) in zip(outputs, transfer_id_names):
-                for part in exdto.output:
-                    if part.find(self._LOG_START_PHRASE) != -1:
-                        dto = timekeeper.get(
-                            file_name,
-                            TransferDTO(fname=file_name, transferer="mft"),
-                        )
-                        dto.start_time = datetime.fromtimestamp(
-                            int(part.split("|")[1].strip()) / 1000
-                        )
-                        timekeeper[file_name] = dto
+                if self.recorder is not None:
+                    self.recorder.add_execution(exdto)
+                records = self._LOG_SCANNER.scan_bytes(
+                    "\n".join(exdto.output + [""]).encode("utf-8")
+                )
+                for kind, _, t in records.rows():
+                    dto = timekeeper.get(
+                        file_name,
+                        TransferDTO(fname=file_name, transferer="mft"),
+                    )
+                    if kind == "start":
+                        dto.start_time = t
+                    elif kind == "end":
+                        dto.end_time = t
+                        dto.status = None
+                    elif dto.end_time is None:
+                        dto.status = TransferStatus.FAILED
+                    timekeeper[file_name] = dto
 
-                    if part.find(self._LOG_COMPLETE_PHRASE) != -1:
-                        dto = timekeeper.get(
-                            file_name,
-                            TransferDTO(fname=file_name, transferer="mft"),
-                        )
-                        dto.end_time = datetime.fromtimestamp(
-                            int(part.split("|")[1].strip()) / 1000
-                        )
-                        timekeeper[file_name] = dto
-                        end_counter += 1
+            deadlines.apply(
+                timekeeper,
+                expected=map(lambda x: x[1], transfer_id_names),
+                transferer="mft",
+            )
+            finished = tuple(
+                filter(
+                    lambda d: d.finished and d.fname not in emitted,
+                    timekeeper.values(),
+                )
+            )
+            emitted.update(map(lambda d: d.fname, finished))
+            end_counter = len(emitted)
 
-        return tuple(timekeeper.values())
+            self._observe_progress(
+                tuple(timekeeper.values()), lag=time.time() - parse_start
+            )
+            if checkpoint is not None:
+                checkpoint.update(
+                    timekeeper=dump_timekeeper(timekeeper.values()),
+                    done=end_counter >= nids,
+                    force=end_counter >= nids,
+                )
+            yield from finished
+            if deadlines.expired:
+                break
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from loguru import logger
+
+from ..structures import TYPE_PATH, TransferDTO
+from .streaming import dto_to_record, record_to_dto
+
+
+class Checkpoint:
+    """
+    A small JSON state file that lets an automation reattach to its
+    in-flight transfers after the Python process died.
+
+    The state is written atomically (temp file + `os.replace`), so the file
+    on disk is always either the previous or the new complete state.
+    `update(...)` only writes when `interval` seconds have passed since the
+    last write, so it can be called on every parser poll.
+
+    Usage:
+
+        .. code-block:: python
+
+            checkpoint = Checkpoint("/tmp/MFTAutomation.checkpoint.json")
+            checkpoint.update(transfer_id_names=ids, force=True)
+            ...
+            checkpoint = Checkpoint.load("/tmp/MFTAutomation.checkpoint.json")
+            ids = checkpoint["transfer_id_names"]
+    """
+
+    def __init__(
+        self,
+        path: TYPE_PATH,
+        interval: float = 30,
+        state: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.path = str(path)
+        self.interval = float(interval or 0)
+        self.state: Dict[str, Any] = dict(state or {})
+        self._last_save = 0.0
+
+    @classmethod
+    def load(cls, path: TYPE_PATH, interval: float = 30) -> Checkpoint:
+        with open(path) as f:
+            state = json.load(f)
+        logger.info(f"Loaded checkpoint from {path}")
+        return cls(path, interval=interval, state=state)
+
+    def update(self, force: bool = False, **state) -> bool:
+        """
+        Merge `state` into the checkpoint and write it to disk if
+        `interval` seconds have passed (or `force` is set).
+
+        Returns:
+            `True` if the checkpoint was written.
+        """
+        self.state.update(state)
+        if not force and time.time() - self._last_save < self.interval:
+            return False
+        self.save()
+        return True
+
+    def save(self) -> None:
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dirname, prefix=".checkpoint_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._last_save = time.time()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.state.get(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.state[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.state
+
+    @property
+    def done(self) -> bool:
+        """
+        Whether the checkpointed run has finished measuring.
+        """
+        return bool(self.state.get("done", False))
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(path={self.path}, keys={list(self.state)})"
+
+
+def dump_timekeeper(dtos: Iterable[TransferDTO]) -> list:
+    return [dto_to_record(dto) for dto in dtos]
+
+
+def load_timekeeper(records: Iterable[dict]) -> Tuple[TransferDTO]:
+    return tuple(record_to_dto(record) for record in records)
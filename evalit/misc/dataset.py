@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import csv
+import json
+import math
+import random
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from ..structures import TYPE_PATH
+from .delta import TransferPlan
+from .s3 import make_s3_client
+
+_MB = 1024 * 1024
+
+# S3 multipart uploads need parts of at least 5 MB (except the last one)
+_MIN_PART_SIZE = 5 * _MB
+
+_DISTRIBUTIONS = ("fixed", "lognormal", "manifest")
+_CONTENTS = ("random", "compressible")
+
+
+def fixed_sizes(count: int, size: int) -> Iterator[int]:
+    for _ in range(count):
+        yield size
+
+
+def lognormal_sizes(
+    count: int,
+    median: int,
+    sigma: float = 1.0,
+    seed: int = 0,
+    max_size: Optional[int] = None,
+) -> Iterator[int]:
+    """
+    Log-normal object sizes (in bytes) around the `median`,
+    which is what most real-world datasets look like:
+    many small objects and a long tail of large ones.
+    """
+    rng = random.Random(seed)
+    mu = math.log(max(median, 1))
+    for _ in range(count):
+        size = int(rng.lognormvariate(mu, sigma))
+        yield min(size, max_size) if max_size else size
+
+
+def read_manifest(path: TYPE_PATH) -> Iterator[Tuple[str, int]]:
+    """
+    Replay the keys and sizes (in bytes) of a real dataset.
+
+    The manifest is either JSON lines with "Key"/"Size" fields
+    (eg: dumped from `misc.s3.iter_objects`) or a CSV of `key,size` rows.
+    """
+    with open(path, newline="") as f:
+        first = f.readline()
+        f.seek(0)
+        if first.lstrip().startswith("{"):
+            for line in f:
+                if line.strip():
+                    obj = json.loads(line)
+                    yield obj["Key"], int(obj["Size"])
+        else:
+            for row in csv.reader(f):
+                if len(row) < 2 or not row[1].strip().isdigit():
+                    # header/blank rows
+                    continue
+                yield row[0], int(row[1])
+
+
+class ContentPool:
+    """
+    A block of pre-generated bytes that the object bodies are sliced from,
+    so that content is produced at memory speed instead of being
+    generated (or read from local files) for every object.
+
+    Each key starts at a different offset of the pool, so objects
+    don't share content (and ETags) unless they are larger than the pool.
+
+    Args:
+        `content`: `str`
+            "random" (incompressible) or "compressible"
+            (roughly 4:1, a quarter random bytes and the rest repeated text)
+    """
+
+    def __init__(
+        self, content: str = "random", size: int = 16 * _MB, seed: int = 0
+    ) -> None:
+        if content not in _CONTENTS:
+            raise ValueError(f"Invalid content={content}. Expected one of {_CONTENTS}")
+        rng = random.Random(seed)
+        if content == "random":
+            pool = rng.getrandbits(size * 8).to_bytes(size, "little")
+        else:
+            filler = b"evalit synthetic dataset " * 128
+            blocks = []
+            for _ in range(size // 4096 + 1):
+                blocks.append(rng.getrandbits(1024 * 8).to_bytes(1024, "little"))
+                blocks.append(filler[:3072])
+            pool = b"".join(blocks)[:size]
+        # doubled, so that any slice of up to `size` bytes is contiguous
+        self._pool = memoryview(pool + pool)
+        self.size = size
+        self.content = content
+
+    def chunks(
+        self, key: str, size: int, chunk_size: int = 8 * _MB, start: int = 0
+    ) -> Iterator[memoryview]:
+        """
+        Stream the body of `key` (of `size` bytes) from `start`, chunk by chunk.
+        """
+        offset = (zlib.crc32(key.encode("utf-8")) + start) % self.size
+        chunk_size = min(chunk_size, self.size)
+        while size > 0:
+            n = min(size, chunk_size)
+            yield self._pool[offset : offset + n]
+            offset = (offset + n) % self.size
+            size -= n
+
+    def read(self, key: str, size: int, start: int = 0) -> bytes:
+        """
+        `size` bytes of the body of `key`, starting at `start`.
+        """
+        offset = (zlib.crc32(key.encode("utf-8")) + start) % self.size
+        if size <= self.size:
+            return self._pool[offset : offset + size].tobytes()
+        return b"".join(self.chunks(key, size, start=start))
+
+
+class _MultipartUpload:
+    __slots__ = ("key", "upload_id", "parts", "pending")
+
+    def __init__(self, key: str, upload_id: str, nparts: int) -> None:
+        self.key = key
+        self.upload_id = upload_id
+        self.parts: List[Optional[Dict[str, Any]]] = [None] * nparts
+        self.pending = nparts
+
+
+def _iter_objects(
+    distribution: str,
+    count: int,
+    size: int,
+    sigma: float,
+    manifest: Optional[TYPE_PATH],
+    prefix: str,
+    seed: int,
+) -> Iterator[Tuple[str, int]]:
+    if distribution == "manifest":
+        if not manifest:
+            raise ValueError("distribution=manifest needs a manifest path!")
+        for key, nbytes in read_manifest(manifest):
+            yield prefix + key, nbytes
+        return
+    sizes = (
+        fixed_sizes(count, size)
+        if distribution == "fixed"
+        else lognormal_sizes(count, size, sigma=sigma, seed=seed)
+    )
+    width = len(str(max(count - 1, 0)))
+    for i, nbytes in enumerate(sizes):
+        yield f"{prefix}{i:0{width}d}.bin", nbytes
+
+
+def generate_dataset(
+    cfg: Dict[str, str],
+    distribution: str = "fixed",
+    count: int = 1000,
+    size_mb: float = 1.0,
+    sigma: float = 1.0,
+    manifest: Optional[TYPE_PATH] = None,
+    prefix: str = "synthetic/",
+    content: str = "random",
+    side: str = "source",
+    njobs: int = 32,
+    part_size_mb: int = 64,
+    seed: int = 0,
+    create_bucket: bool = False,
+) -> TransferPlan:
+    """
+    Populate the bucket of the config with a synthetic dataset.
+
+    Bodies are sliced from an in-memory `ContentPool` and streamed
+    straight to S3: objects smaller than `part_size_mb` with a single
+    PutObject, larger ones as multipart uploads whose parts are uploaded
+    in parallel with the other objects, `njobs` requests at a time.
+    Nothing is written to local disk.
+
+    Args:
+        `distribution`: `str`
+            "fixed" (`count` objects of `size_mb`), "lognormal"
+            (`count` objects with a median of `size_mb` and `sigma`)
+            or "manifest" (the keys/sizes of `manifest`,
+            see `read_manifest(...)`)
+
+        `content`: `str`
+            "random" or "compressible" (see `ContentPool`)
+
+        `side`: `str`
+            "source" or "dest" bucket of the config
+
+    Returns:
+        The generated objects as a `misc.delta.TransferPlan`, which can be
+        passed as the `files` of any automation and provides the `filemap()`.
+    """
+    if distribution not in _DISTRIBUTIONS:
+        raise ValueError(
+            f"Invalid distribution={distribution}. Expected one of {_DISTRIBUTIONS}"
+        )
+
+    from botocore.config import Config
+
+    client = make_s3_client(
+        cfg, side, config=Config(max_pool_connections=max(10, njobs))
+    )
+    bucket = cfg[f"{side}_s3_bucket"]
+    if create_bucket:
+        try:
+            client.create_bucket(Bucket=bucket)
+        except (
+            client.exceptions.BucketAlreadyOwnedByYou,
+            client.exceptions.BucketAlreadyExists,
+        ):
+            pass
+
+    part_size = max(int(part_size_mb * _MB), _MIN_PART_SIZE)
+    pool = ContentPool(content, size=max(16 * _MB, part_size), seed=seed)
+    objects = _iter_objects(
+        distribution, count, int(size_mb * _MB), sigma, manifest, prefix, seed
+    )
+
+    plan = TransferPlan()
+    uploads: Dict[str, _MultipartUpload] = {}
+    pending: Set[Future] = set()
+
+    def _put(key: str, nbytes: int) -> None:
+        client.put_object(Bucket=bucket, Key=key, Body=pool.read(key, nbytes))
+
+    def _upload_part(upload: _MultipartUpload, number: int, nbytes: int) -> None:
+        response = client.upload_part(
+            Bucket=bucket,
+            Key=upload.key,
+            UploadId=upload.upload_id,
+            PartNumber=number,
+            Body=pool.read(upload.key, nbytes, start=(number - 1) * part_size),
+        )
+        upload.parts[number - 1] = dict(PartNumber=number, ETag=response["ETag"])
+
+    def _requests() -> Iterator[Tuple[Any, tuple]]:
+        for key, nbytes in objects:
+            plan.add(dict(Key=key, Size=nbytes))
+            if nbytes < part_size:
+                yield _put, (key, nbytes)
+                continue
+            nparts = math.ceil(nbytes / part_size)
+            upload_id = client.create_multipart_upload(Bucket=bucket, Key=key)[
+                "UploadId"
+            ]
+            upload = uploads[key] = _MultipartUpload(key, upload_id, nparts)
+            for number in range(1, nparts + 1):
+                yield _upload_part, (
+                    upload,
+                    number,
+                    min(part_size, nbytes - (number - 1) * part_size),
+                )
+
+    def _complete(future: Future) -> None:
+        # raises the error of the request, if any
+        future.result()
+        upload = future.upload
+        if upload is None:
+            return
+        upload.pending -= 1
+        if not upload.pending:
+            client.complete_multipart_upload(
+                Bucket=bucket,
+                Key=upload.key,
+                UploadId=upload.upload_id,
+                MultipartUpload=dict(Parts=upload.parts),
+            )
+            del uploads[upload.key]
+
+    start = time.time()
+    logger.info(f"Generating {distribution} dataset in s3://{bucket}/{prefix}")
+    try:
+        with ThreadPoolExecutor(max_workers=njobs) as executor:
+            for func, args in _requests():
+                # bounded, so that only the in-flight bodies are held in memory
+                while len(pending) >= 2 * njobs:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        _complete(future)
+                future = executor.submit(func, *args)
+                future.upload = args[0] if func is _upload_part else None
+                pending.add(future)
+            for future in wait(pending).done:
+                _complete(future)
+    except BaseException:
+        for upload in uploads.values():
+            client.abort_multipart_upload(
+                Bucket=bucket, Key=upload.key, UploadId=upload.upload_id
+            )
+        raise
+
+    elapsed = max(time.time() - start, 1e-9)
+    logger.info(
+        f"Generated {len(plan)} objects ({plan.nbytes/_MB:.2f} MB) in {elapsed:.2f} seconds | "
+        f"{len(plan)*3600/elapsed:.0f} objects/hour | "
+        f"{plan.nbytes*8/elapsed/1e9:.3f} Gbps"
+    )
+    plan.missing = len(plan)
+    return plan
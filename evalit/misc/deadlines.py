@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import statistics
+import time
+from typing import Dict, Iterable, List, Optional
+
+from loguru import logger
+
+from ..structures import TransferDTO, TransferStatus
+
+# defaults of the run deadline derived from the sizes of the files
+# (see `TransferDeadlines.from_kwargs`): only meant to stop the parsers
+# that would otherwise wait forever, never a healthy run
+DEFAULT_MIN_THROUGHPUT_GBPS = 0.01
+DEFAULT_RUN_TIMEOUT_GRACE = 900.0
+
+
+class TransferDeadlines:
+    """
+    Bounds the parser loops of the automations, which otherwise wait
+    until every file has completed.
+
+    - `run_timeout`: seconds after which all the unfinished transfers
+    are TIMED_OUT and the parser stops.
+    - `file_timeout`: seconds a single transfer may stay in flight,
+    counted from when the parser first saw it start.
+    - `straggler_factor`: once `min_samples` transfers have completed,
+    in-flight transfers taking longer than `straggler_factor` times the
+    median completion time are considered stragglers and TIMED_OUT.
+
+    In-flight times are measured with the local clock at each poll, so
+    they don't depend on the clock of the tool that wrote the log.
+
+    With `from_kwargs(...)`, the `run_timeout` defaults to the time the
+    files of the `filemap` take at `min_throughput_gbps` (0.01 Gbps by
+    default) plus `run_timeout_grace` seconds (900 by default).
+    Pass `run_timeout=None` to opt out. The straggler detection stays
+    opt-in: in a run of mixed sizes, the large files would look like
+    stragglers to the median.
+
+    Usage:
+
+        .. code-block:: python
+
+            deadlines = TransferDeadlines.from_kwargs(**kwargs)
+            while not all_done and not deadlines.expired:
+                ...
+                deadlines.apply(timekeeper, expected=files, transferer="nifi")
+    """
+
+    def __init__(
+        self,
+        run_timeout: Optional[float] = None,
+        file_timeout: Optional[float] = None,
+        straggler_factor: Optional[float] = None,
+        min_samples: int = 5,
+    ) -> None:
+        self.run_timeout = run_timeout
+        self.file_timeout = file_timeout
+        self.straggler_factor = straggler_factor
+        self.min_samples = max(1, int(min_samples))
+        self.start = time.time()
+
+        # first time (local clock) each transfer was seen in flight
+        self._first_seen: Dict[str, float] = {}
+        self._timed_out: Dict[str, TransferDTO] = {}
+
+    @classmethod
+    def from_kwargs(
+        cls, expected: Optional[Iterable[str]] = None, **kwargs
+    ) -> TransferDeadlines:
+        """
+        Deadlines from the run kwargs, with the `run_timeout` derived from
+        the sizes of the `expected` files (all the `filemap` by default)
+        unless one is passed (see `size_timeout(...)`).
+        """
+        if "run_timeout" in kwargs:
+            run_timeout = kwargs["run_timeout"]
+        else:
+            run_timeout = cls.size_timeout(
+                kwargs.get("filemap") or {},
+                expected,
+                min_throughput_gbps=kwargs.get(
+                    "min_throughput_gbps", DEFAULT_MIN_THROUGHPUT_GBPS
+                ),
+                grace=kwargs.get("run_timeout_grace", DEFAULT_RUN_TIMEOUT_GRACE),
+            )
+        return cls(
+            run_timeout=run_timeout,
+            file_timeout=kwargs.get("file_timeout"),
+            straggler_factor=kwargs.get("straggler_factor"),
+            min_samples=kwargs.get("straggler_min_samples", 5),
+        )
+
+    @staticmethod
+    def size_timeout(
+        filemap: Dict[str, dict],
+        files: Optional[Iterable[str]] = None,
+        min_throughput_gbps: float = DEFAULT_MIN_THROUGHPUT_GBPS,
+        grace: float = DEFAULT_RUN_TIMEOUT_GRACE,
+    ) -> Optional[float]:
+        """
+        Seconds to transfer the `files` of the `filemap` (sizes in GB) at
+        `min_throughput_gbps`, plus `grace`. `None` without a `filemap`.
+        """
+        if not filemap or not min_throughput_gbps:
+            return None
+        files = list(map(str, files or ()))
+        sizes = (
+            [filemap.get(f, {}).get("size", 0) for f in files]
+            if files
+            else [v["size"] for v in filemap.values()]
+        )
+        return round(sum(sizes) * 8 / min_throughput_gbps + grace, 1)
+
+    @property
+    def expired(self) -> bool:
+        """
+        Whether the run deadline has passed.
+        """
+        return (
+            self.run_timeout is not None
+            and time.time() - self.start >= self.run_timeout
+        )
+
+    def _file_limit(self, timekeeper: Dict[str, TransferDTO]) -> Optional[float]:
+        limits = []
+        if self.file_timeout is not None:
+            limits.append(self.file_timeout)
+        if self.straggler_factor is not None:
+            durations = [
+                (d.end_time - d.start_time).total_seconds()
+                for d in timekeeper.values()
+                if d.start_time is not None and d.end_time is not None
+            ]
+            if len(durations) >= self.min_samples:
+                limits.append(self.straggler_factor * statistics.median(durations))
+        return min(limits) if limits else None
+
+    def apply(
+        self,
+        timekeeper: Dict[str, TransferDTO],
+        expected: Iterable[str] = (),
+        transferer: str = "",
+    ) -> List[TransferDTO]:
+        """
+        Mark the transfers past their deadline as TIMED_OUT, in place.
+
+        Transfers timed out in a previous call stay TIMED_OUT (parsers may
+        rebuild the timekeeper at every poll), unless they've completed since.
+        When the run deadline has passed, the `expected` files that were
+        never seen are added to the timekeeper as TIMED_OUT too.
+
+        Returns:
+            The transfers timed out by this call.
+        """
+        now = time.time()
+        for fname, dto in self._timed_out.items():
+            current = timekeeper.get(fname)
+            if current is None:
+                timekeeper[fname] = dto
+            elif current.end_time is None and current.status is None:
+                current.status = TransferStatus.TIMED_OUT
+
+        limit = self._file_limit(timekeeper)
+        expired = self.expired
+        newly = []
+        for fname, dto in timekeeper.items():
+            if dto.finished:
+                continue
+            if dto.start_time is not None:
+                self._first_seen.setdefault(fname, now)
+            elapsed = now - self._first_seen.get(fname, now)
+            if expired or (
+                limit is not None and fname in self._first_seen and elapsed > limit
+            ):
+                dto.status = TransferStatus.TIMED_OUT
+                newly.append(dto)
+
+        if expired:
+            for fname in expected:
+                if fname not in timekeeper:
+                    dto = TransferDTO(
+                        fname=fname,
+                        transferer=transferer,
+                        status=TransferStatus.TIMED_OUT,
+                    )
+                    timekeeper[fname] = dto
+                    newly.append(dto)
+
+        for dto in newly:
+            self._timed_out[dto.fname] = dto
+        if newly:
+            reason = "run deadline" if expired else f"in flight > {limit:.1f} seconds"
+            logger.warning(
+                f"{len(newly)} transfers timed out ({reason}): {[d.fname for d in newly][:10]}"
+            )
+        return newly
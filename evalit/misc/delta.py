@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+from ..structures import TYPE_PATH
+from .s3 import is_multipart_etag, iter_objects, make_s3_client, prefetch
+
+_GB = 1024 * 1024 * 1024
+
+
+@dataclass
+class TransferPlan:
+    """
+    The exact set of source objects to transfer, as computed by
+    `plan_delta(...)`.
+
+    It iterates over the keys to transfer, so it can be passed directly
+    as the `files` of any automation.
+    """
+
+    # keys to transfer, in listing order
+    keys: List[str] = field(default_factory=list)
+
+    # sizes (in bytes) of the keys to transfer
+    sizes: List[int] = field(default_factory=list)
+
+    # number of objects per outcome of the join
+    missing: int = 0
+    changed: int = 0
+    unchanged: int = 0
+    extra: int = 0
+
+    def add(self, obj: Dict[str, Any]) -> None:
+        self.keys.append(obj["Key"])
+        self.sizes.append(obj["Size"])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self.sizes)
+
+    def filemap(self) -> Dict[str, dict]:
+        """
+        Filemap of the planned objects (sizes in GB), as expected by
+        `controller.StandardAutomationController.run(filemap=...)`.
+        """
+        return {k: dict(size=s / _GB) for k, s in zip(self.keys, self.sizes)}
+
+    def write(self, path: TYPE_PATH) -> None:
+        """
+        Write the planned keys, one per line.
+        """
+        with open(path, "w") as f:
+            for key in self.keys:
+                f.write(key + "\n")
+
+    def summary(self) -> Dict[str, int]:
+        return dict(
+            transfer=len(self.keys),
+            missing=self.missing,
+            changed=self.changed,
+            unchanged=self.unchanged,
+            extra=self.extra,
+            nbytes=self.nbytes,
+        )
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+def _sorted(objects: Iterable[Dict[str, Any]], side: str) -> Iterator[Dict[str, Any]]:
+    """
+    Pass through the listing, checking that the keys are ascending,
+    which the merge join relies on.
+    """
+    last = None
+    for obj in objects:
+        if last is not None and obj["Key"] <= last:
+            raise ValueError(
+                f"{side} listing isn't sorted by key: {obj['Key']!r} after {last!r}"
+            )
+        last = obj["Key"]
+        yield obj
+
+
+def same_object(
+    src: Dict[str, Any], dest: Dict[str, Any], compare_etag: bool = True
+) -> bool:
+    """
+    Whether the listed source and destination objects look identical:
+    same size and, when comparable, same ETag.
+    """
+    if src["Size"] != dest["Size"]:
+        return False
+    if not compare_etag:
+        return True
+    src_etag, dest_etag = src.get("ETag"), dest.get("ETag")
+    if not src_etag or not dest_etag:
+        return True
+    if is_multipart_etag(src_etag) or is_multipart_etag(dest_etag):
+        # depends on the part size of each upload, so only the size is compared
+        return True
+    return src_etag == dest_etag
+
+
+def merge_listings(
+    source: Iterable[Dict[str, Any]], dest: Iterable[Dict[str, Any]]
+) -> Iterator[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]:
+    """
+    Full outer merge join of two listings sorted by key.
+
+    Only one object of each listing is held at a time, so the listings
+    can be lazy iterators over tens of millions of keys
+    (see `misc.s3.iter_objects`).
+
+    Yields:
+        `(source object, dest object)` pairs, with `None` for the side
+        where the key doesn't exist.
+    """
+    source = _sorted(source, "source")
+    dest = _sorted(dest, "dest")
+
+    src_obj = next(source, None)
+    dest_obj = next(dest, None)
+    while src_obj is not None or dest_obj is not None:
+        if dest_obj is None or (
+            src_obj is not None and src_obj["Key"] < dest_obj["Key"]
+        ):
+            yield src_obj, None
+            src_obj = next(source, None)
+        elif src_obj is None or src_obj["Key"] > dest_obj["Key"]:
+            yield None, dest_obj
+            dest_obj = next(dest, None)
+        else:
+            yield src_obj, dest_obj
+            src_obj = next(source, None)
+            dest_obj = next(dest, None)
+
+
+def plan_delta(
+    source: Iterable[Dict[str, Any]],
+    dest: Iterable[Dict[str, Any]],
+    compare_etag: bool = True,
+) -> TransferPlan:
+    """
+    Join the source and destination listings (both sorted by key) in a
+    single streaming merge pass (see `merge_listings(...)`), and plan the
+    objects that are missing at the destination or differ in size/ETag.
+
+    Args:
+        `source`, `dest`: `Iterable[Dict[str, Any]]`
+            Listings of dicts with "Key", "Size" and (optionally) "ETag".
+
+        `compare_etag`: `bool`
+            Compare the single-part ETags (MD5) on top of the sizes.
+            Multipart ETags are never compared.
+    """
+    plan = TransferPlan()
+    for src_obj, dest_obj in merge_listings(source, dest):
+        if src_obj is None:
+            plan.extra += 1
+        elif dest_obj is None:
+            plan.missing += 1
+            plan.add(src_obj)
+        elif same_object(src_obj, dest_obj, compare_etag):
+            plan.unchanged += 1
+        else:
+            plan.changed += 1
+            plan.add(src_obj)
+    return plan
+
+
+def plan_transfer(
+    cfg: Dict[str, str],
+    prefix: str = "",
+    compare_etag: bool = True,
+    page_size: int = 1000,
+) -> TransferPlan:
+    """
+    List the source and destination buckets of the config and plan
+    the objects to transfer. See `plan_delta(...)`.
+    """
+    start = time.time()
+    # both listings are fetched in parallel
+    source = prefetch(
+        iter_objects(
+            make_s3_client(cfg, "source"),
+            cfg["source_s3_bucket"],
+            prefix=prefix,
+            page_size=page_size,
+        )
+    )
+    dest = prefetch(
+        iter_objects(
+            make_s3_client(cfg, "dest"),
+            cfg["dest_s3_bucket"],
+            prefix=prefix,
+            page_size=page_size,
+        )
+    )
+    plan = plan_delta(source, dest, compare_etag=compare_etag)
+    logger.info(
+        f"Planned transfer in {time.time()-start:.2f} seconds: {plan.summary()}"
+    )
+    return plan
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Sequence
+
+from loguru import logger
+
+from ..structures import TransferDTO
+
+_GB = 1024 * 1024 * 1024
+
+
+class AutomationMetrics:
+    """
+    Holds live metrics for a single automation.
+
+    The automation parsers call `observe(...)` with the transfer records
+    detected so far. All the values are recomputed from these records,
+    so the parsers don't need to track deltas themselves.
+    """
+
+    def __init__(self, name: str, filemap: Optional[Dict[str, dict]] = None) -> None:
+        self.name = name
+        self.filemap = filemap or {}
+        self._lock = threading.Lock()
+
+        self.files_completed = 0
+        self.bytes_moved = 0
+        self.throughput_gbps = 0.0
+        self.inflight = 0
+        self.parse_lag = 0.0
+
+    def observe(
+        self, dtos: Sequence[TransferDTO], lag: Optional[float] = None
+    ) -> AutomationMetrics:
+        """
+        Update the metrics from the transfer records detected so far.
+
+        Args:
+            `dtos`: `Sequence[TransferDTO]`
+                All the records the parser has seen until now.
+
+            `lag`: `float`
+                Seconds the parser spent in its latest pass.
+        """
+        completed = tuple(filter(lambda d: d.end_time is not None, dtos))
+        inflight = tuple(
+            filter(lambda d: d.start_time is not None and d.end_time is None, dtos)
+        )
+        size_gb = sum(
+            map(lambda d: self.filemap.get(d.fname, {}).get("size", 0), completed)
+        )
+
+        throughput = 0.0
+        timed = tuple(filter(lambda d: d.start_time is not None, completed))
+        if timed:
+            window = (
+                max(map(lambda d: d.end_time, timed))
+                - min(map(lambda d: d.start_time, timed))
+            ).total_seconds()
+            throughput = size_gb * 8 / window if window > 0 else 0.0
+
+        with self._lock:
+            self.files_completed = len(completed)
+            self.bytes_moved = int(size_gb * _GB)
+            self.throughput_gbps = round(throughput, 3)
+            self.inflight = len(inflight)
+            if lag is not None:
+                self.parse_lag = float(lag)
+        return self
+
+    def samples(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "evalit_files_completed_total": self.files_completed,
+                "evalit_bytes_moved_total": self.bytes_moved,
+                "evalit_throughput_gbps": self.throughput_gbps,
+                "evalit_inflight_transfers": self.inflight,
+                "evalit_parse_loop_lag_seconds": self.parse_lag,
+            }
+
+
+class MetricsExporter:
+    """
+    A minimal Prometheus-compatible metrics endpoint.
+
+    The exporter serves the text exposition format at `/metrics`
+    from a background thread, so that long controller runs can be
+    scraped while they are still going.
+
+    Usage:
+
+        .. code-block:: python
+
+            exporter = MetricsExporter(port=9464).start()
+            metrics = exporter.scope("RcloneAutomation", filemap)
+            metrics.observe(dtos, lag=0.1)
+            exporter.stop()
+    """
+
+    _HELP = {
+        "evalit_files_completed_total": (
+            "counter",
+            "Number of files whose transfer has completed.",
+        ),
+        "evalit_bytes_moved_total": (
+            "counter",
+            "Bytes moved by the completed transfers.",
+        ),
+        "evalit_throughput_gbps": (
+            "gauge",
+            "Aggregate throughput (Gbps) over the completed transfers.",
+        ),
+        "evalit_inflight_transfers": (
+            "gauge",
+            "Number of transfers started but not completed yet.",
+        ),
+        "evalit_parse_loop_lag_seconds": (
+            "gauge",
+            "Seconds spent by the latest log parser pass.",
+        ),
+    }
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9464) -> None:
+        self.host = host
+        self.port = int(port)
+        self._scopes: Dict[str, AutomationMetrics] = {}
+        self._server = None
+        self._thread = None
+        self._start_time = time.time()
+
+    def scope(
+        self, name: str, filemap: Optional[Dict[str, dict]] = None
+    ) -> AutomationMetrics:
+        """
+        Get (or create) the metrics holder for the given automation name.
+        """
+        if name not in self._scopes:
+            self._scopes[name] = AutomationMetrics(name, filemap=filemap)
+        return self._scopes[name]
+
+    def render(self) -> str:
+        """
+        Render all the metrics in the Prometheus text format.
+        """
+        lines = []
+        for metric, (mtype, text) in self._HELP.items():
+            lines.append(f"# HELP {metric} {text}")
+            lines.append(f"# TYPE {metric} {mtype}")
+            for name, scope in self._scopes.items():
+                value = scope.samples()[metric]
+                lines.append(f'{metric}{{automation="{name}"}} {value}')
+        lines.append("# TYPE evalit_uptime_seconds gauge")
+        lines.append(f"evalit_uptime_seconds {round(time.time()-self._start_time, 3)}")
+        return "\n".join(lines) + "\n"
+
+    def start(self) -> MetricsExporter:
+        exporter = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        # in case port=0 was used, pick the one assigned by the OS
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Metrics exporter listening at http://{self.host}:{self.port}/")
+        return self
+
+    def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        logger.info("Metrics exporter stopped.")
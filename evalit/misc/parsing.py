@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import mmap
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from ..structures import TYPE_PATH
+
+
+class TimestampCache:
+    """
+    Decodes log timestamps, caching the `datetime` per distinct
+    second-prefix (eg: "2022/03/09 03:05:32"). A log has only a few
+    distinct seconds compared to its number of lines, so `strptime`
+    runs once per second instead of once per line.
+
+    Args:
+        `fmt`: `str`
+            `strptime` format of the second-prefix.
+
+        `prefix_len`: `int`
+            Length (in bytes) of the second-prefix.
+
+        `frac_sep`: `bytes`
+            Separator before the fractional seconds, if any (eg: b",").
+    """
+
+    def __init__(
+        self,
+        fmt: str,
+        prefix_len: int,
+        frac_sep: Optional[bytes] = None,
+        maxsize: int = 1 << 16,
+    ) -> None:
+        self.fmt = fmt
+        self.prefix_len = prefix_len
+        self.frac_sep = frac_sep
+        self.maxsize = maxsize
+        self._cache: Dict[bytes, datetime] = {}
+
+    def __call__(self, stamp: bytes) -> datetime:
+        prefix = stamp[: self.prefix_len]
+        base = self._cache.get(prefix)
+        if base is None:
+            if len(self._cache) >= self.maxsize:
+                self._cache.clear()
+            base = datetime.strptime(prefix.decode("ascii"), self.fmt)
+            self._cache[prefix] = base
+
+        if self.frac_sep is None or len(stamp) <= self.prefix_len + 1:
+            return base
+        if stamp[self.prefix_len : self.prefix_len + 1] != self.frac_sep:
+            return base
+        frac = stamp[self.prefix_len + 1 : self.prefix_len + 7]
+        return base + timedelta(microseconds=int(frac.ljust(6, b"0")))
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+def epoch_millis(stamp: bytes) -> datetime:
+    """
+    Decode epoch milliseconds (eg: MFT state timestamps) to local time.
+    """
+    return datetime.fromtimestamp(int(stamp) / 1000)
+
+
+@dataclass
+class LogPattern:
+    """
+    A precompiled pattern for a single kind of log event.
+
+    The regex is matched from the start of a line. It must have a `ts`
+    named group for the timestamp, and optionally a `name` named group
+    for the file name.
+
+    `anchor` is a literal that every matching line contains (eg: the
+    log phrase). Only the lines containing it are matched against the
+    regex, and finding it runs at memory speed.
+    """
+
+    kind: str
+    regex: bytes
+    decoder: Callable[[bytes], datetime]
+    anchor: bytes
+    compiled: re.Pattern = field(init=False, repr=False)
+    has_name: bool = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.compiled = re.compile(self.regex)
+        self.has_name = "name" in self.compiled.groupindex
+
+
+@dataclass
+class LogRecords:
+    """
+    Columnar records emitted by the `LogScanner`.
+    All the columns are in the order the events appear in the log.
+    """
+
+    kinds: List[str] = field(default_factory=list)
+    names: List[Optional[str]] = field(default_factory=list)
+    times: List[datetime] = field(default_factory=list)
+
+    # byte offset right after the last complete line scanned
+    offset: int = 0
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def extend(self, other: LogRecords) -> LogRecords:
+        self.kinds.extend(other.kinds)
+        self.names.extend(other.names)
+        self.times.extend(other.times)
+        self.offset = other.offset
+        return self
+
+    def rows(self) -> Iterator[Tuple[str, Optional[str], datetime]]:
+        return zip(self.kinds, self.names, self.times)
+
+
+class LogScanner:
+    """
+    A log parsing engine shared by the automations.
+
+    Log files are memory-mapped and scanned in newline-aligned chunks.
+    Within a chunk, the anchor literal of each `LogPattern` is searched
+    with `find` (instead of running Python code on every line), and only
+    those lines are matched against the precompiled regex. Timestamps are
+    decoded only for the matching lines, through the pattern decoder
+    (usually a `TimestampCache`).
+
+    Scanning stops at the last complete line, and the returned offset
+    can be passed back to `scan(...)` to incrementally parse a log
+    that is still being written.
+
+    Usage:
+
+        .. code-block:: python
+
+            scanner = LogScanner([
+                LogPattern("end", rb"(?P<ts>\\S+ \\S+) .*Copied", decoder, b"Copied"),
+            ])
+            records = scanner.scan("rclone.log")
+            records = scanner.scan("rclone.log", offset=records.offset)
+    """
+
+    def __init__(
+        self, patterns: Sequence[LogPattern], chunk_size: int = 64 * 1024 * 1024
+    ) -> None:
+        self.patterns = tuple(patterns)
+        self.chunk_size = int(chunk_size)
+
+    @staticmethod
+    def _find_matches(buffer, start: int, end: int, pattern: LogPattern) -> List:
+        matches = []
+        anchor, match = pattern.anchor, pattern.compiled.match
+        pos = buffer.find(anchor, start, end)
+        while pos != -1:
+            # the first line of the chunk starts at `start`, not after a newline
+            line_start = max(buffer.rfind(b"\n", start, pos) + 1, start)
+            line_end = buffer.find(b"\n", pos, end)
+            line_end = end if line_end == -1 else line_end
+            m = match(buffer, line_start, line_end)
+            if m is not None:
+                matches.append((line_start, pattern, m))
+            pos = buffer.find(anchor, line_end, end)
+        return matches
+
+    def _scan_buffer(self, buffer, start: int, end: int, records: LogRecords) -> None:
+        matches = []
+        for pattern in self.patterns:
+            matches.extend(self._find_matches(buffer, start, end, pattern))
+        if len(self.patterns) > 1:
+            matches.sort(key=lambda x: x[0])
+
+        kinds, names, times = records.kinds, records.names, records.times
+        for _, pattern, m in matches:
+            kinds.append(pattern.kind)
+            names.append(
+                m.group("name").decode("utf-8", errors="replace").strip()
+                if pattern.has_name
+                else None
+            )
+            times.append(pattern.decoder(m.group("ts")))
+
+    def scan_bytes(self, data: bytes, offset: int = 0) -> LogRecords:
+        """
+        Scan in-memory log content (up to its last complete line).
+        """
+        records = LogRecords(offset=offset)
+        end = data.rfind(b"\n") + 1
+        if end <= offset:
+            return records
+        self._scan_buffer(data, offset, end, records)
+        records.offset = end
+        return records
+
+    def scan_lines(self, lines: Iterable[str]) -> LogRecords:
+        """
+        Scan log lines coming from any reader.
+        """
+        data = "".join(map(lambda l: l if l.endswith("\n") else l + "\n", lines))
+        return self.scan_bytes(data.encode("utf-8"))
+
+    def scan(self, path: TYPE_PATH, offset: int = 0) -> LogRecords:
+        """
+        Scan the log file from the byte `offset` up to its last complete line.
+        If the file is smaller than the offset (eg: it was rotated),
+        it's scanned from the beginning.
+        """
+        records = LogRecords(offset=offset)
+        if not os.path.exists(path):
+            return records
+
+        size = os.path.getsize(path)
+        if size < offset:
+            offset = 0
+            records.offset = 0
+        if size == offset:
+            return records
+
+        with open(path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mm:
+            last = mm.rfind(b"\n", offset, size) + 1
+            start = offset
+            while start < last:
+                end = min(start + self.chunk_size, last)
+                if end < last:
+                    # align the chunk to the line boundary
+                    newline = mm.rfind(b"\n", start, end)
+                    end = newline + 1 if newline != -1 else mm.find(b"\n", end) + 1
+                self._scan_buffer(mm, start, end, records)
+                start = end
+            records.offset = max(start, offset)
+        return records
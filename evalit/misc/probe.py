@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import math
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Callable, Dict
+
+from loguru import logger
+
+from .reset import reset_bucket
+from .s3 import iter_objects, make_s3_client
+
+_MB = 1024 * 1024
+
+_PROBE_PREFIX = "evalit-probe/"
+
+
+@dataclass
+class EndpointProbe:
+    """
+    What the path between this host and a single endpoint can carry.
+    """
+
+    endpoint: str = ""
+
+    # median round-trip of a small request (HEAD)
+    rtt_ms: float = 0.0
+
+    # throughput of a single stream of sequential requests,
+    # and of `streams` concurrent ones
+    single_stream_gbps: float = 0.0
+    multi_stream_gbps: float = 0.0
+    streams: int = 0
+
+    @property
+    def bdp_bytes(self) -> int:
+        """
+        Bandwidth-delay product: the bytes that must be in flight
+        to fill the path.
+        """
+        return int(self.multi_stream_gbps * 1e9 / 8 * self.rtt_ms / 1000)
+
+    @property
+    def suggested_streams(self) -> int:
+        """
+        Concurrent streams needed to fill the path, as a single stream
+        only keeps about `single_stream_gbps * rtt` bytes in flight.
+        """
+        if self.single_stream_gbps <= 0:
+            return 1
+        return max(1, math.ceil(self.multi_stream_gbps / self.single_stream_gbps))
+
+    def summary(self) -> Dict[str, Any]:
+        return dict(
+            endpoint=self.endpoint,
+            rtt_ms=round(self.rtt_ms, 3),
+            single_stream_gbps=round(self.single_stream_gbps, 3),
+            multi_stream_gbps=round(self.multi_stream_gbps, 3),
+            streams=self.streams,
+            bdp_mb=round(self.bdp_bytes / _MB, 3),
+            suggested_streams=self.suggested_streams,
+        )
+
+
+@dataclass
+class LinkProbe:
+    """
+    Probe of the source (reads) and destination (writes) endpoints.
+    The achievable bandwidth of a transfer is bound by the slowest side.
+    """
+
+    source: EndpointProbe = field(default_factory=EndpointProbe)
+    dest: EndpointProbe = field(default_factory=EndpointProbe)
+
+    @property
+    def capacity_gbps(self) -> float:
+        return min(self.source.multi_stream_gbps, self.dest.multi_stream_gbps)
+
+    def efficiency(self, throughput: float) -> float:
+        """
+        Throughput (Gbps) as a fraction of the achievable bandwidth.
+
+        The probe keeps at most `streams` chunks in flight, which can be
+        less than the bandwidth-delay product of a long fat path. So the
+        capacity is a lower bound, and the efficiency is clamped to 1.
+        """
+        if self.capacity_gbps <= 0:
+            return 0.0
+        if throughput > self.capacity_gbps:
+            logger.warning(
+                f"Throughput of {throughput} Gbps is above the probed capacity "
+                f"of {self.capacity_gbps:.3f} Gbps. Probe with more streams!"
+            )
+        return round(min(1.0, throughput / self.capacity_gbps), 3)
+
+    def summary(self) -> Dict[str, Any]:
+        return dict(
+            source=self.source.summary(),
+            dest=self.dest.summary(),
+            capacity_gbps=round(self.capacity_gbps, 3),
+        )
+
+
+def _median_ms(request: Callable[[], Any], samples: int) -> float:
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        request()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def _saturate(request: Callable[[int], int], streams: int, duration: float) -> float:
+    """
+    Issue requests back to back on `streams` threads for `duration` seconds.
+
+    Returns:
+        The throughput in Gbps.
+    """
+    nbytes = [0] * streams
+    deadline = time.perf_counter() + duration
+
+    def _stream(i: int) -> None:
+        n = 0
+        while time.perf_counter() < deadline:
+            nbytes[i] += request(n * streams + i)
+            n += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=streams) as executor:
+        for future in [executor.submit(_stream, i) for i in range(streams)]:
+            future.result()
+    return sum(nbytes) * 8 / (time.perf_counter() - start) / 1e9
+
+
+def probe_source(
+    cfg: Dict[str, str],
+    streams: int = 16,
+    duration: float = 5.0,
+    chunk_size_mb: int = 8,
+    samples: int = 10,
+) -> EndpointProbe:
+    """
+    Probe the source endpoint with ranged GETs of its largest object
+    (among the first listed ones).
+    """
+    from botocore.config import Config
+
+    client = make_s3_client(
+        cfg, "source", config=Config(max_pool_connections=max(10, streams))
+    )
+    bucket = cfg["source_s3_bucket"]
+    objects = list(islice(iter_objects(client, bucket), 1000))
+    if not objects:
+        raise ValueError(f"Can't probe the source. s3://{bucket} is empty!")
+    obj = max(objects, key=lambda o: o["Size"])
+    if obj["Size"] < chunk_size_mb * _MB:
+        logger.warning(
+            f"Largest probed object is {obj['Size']} bytes. "
+            "The throughput will be bound by the request latency!"
+        )
+    chunk_size = min(chunk_size_mb * _MB, max(obj["Size"], 1))
+    nchunks = max(1, obj["Size"] // chunk_size)
+
+    def _get(i: int) -> int:
+        offset = (i % nchunks) * chunk_size
+        body = client.get_object(
+            Bucket=bucket,
+            Key=obj["Key"],
+            Range=f"bytes={offset}-{offset + chunk_size - 1}",
+        )["Body"]
+        n = 0
+        for chunk in body.iter_chunks(chunk_size=_MB):
+            n += len(chunk)
+        return n
+
+    probe = EndpointProbe(endpoint=cfg["source_s3_endpoint"] or "", streams=streams)
+    probe.rtt_ms = _median_ms(
+        lambda: client.head_object(Bucket=bucket, Key=obj["Key"]), samples
+    )
+    probe.single_stream_gbps = _saturate(_get, 1, duration)
+    probe.multi_stream_gbps = _saturate(_get, streams, duration)
+    return probe
+
+
+def probe_dest(
+    cfg: Dict[str, str],
+    streams: int = 16,
+    duration: float = 5.0,
+    chunk_size_mb: int = 8,
+    samples: int = 10,
+) -> EndpointProbe:
+    """
+    Probe the destination endpoint with PUTs of `chunk_size_mb` objects
+    under "evalit-probe/", which are deleted afterwards.
+
+    Each stream uploads its own random chunk, so that endpoints which
+    compress or deduplicate (eg: all zeros) don't inflate the throughput.
+    """
+    from botocore.config import Config
+
+    client = make_s3_client(
+        cfg, "dest", config=Config(max_pool_connections=max(10, streams))
+    )
+    bucket = cfg["dest_s3_bucket"]
+    # generated upfront, to keep `os.urandom` out of the timed requests
+    bodies = [os.urandom(chunk_size_mb * _MB) for _ in range(max(1, streams))]
+
+    def _put(i: int) -> int:
+        body = bodies[i % len(bodies)]
+        client.put_object(Bucket=bucket, Key=f"{_PROBE_PREFIX}{i}", Body=body)
+        return len(body)
+
+    probe = EndpointProbe(endpoint=cfg["dest_s3_endpoint"] or "", streams=streams)
+    try:
+        probe.rtt_ms = _median_ms(lambda: client.head_bucket(Bucket=bucket), samples)
+        probe.single_stream_gbps = _saturate(_put, 1, duration)
+        probe.multi_stream_gbps = _saturate(_put, streams, duration)
+    finally:
+        reset_bucket(cfg, "dest", prefix=_PROBE_PREFIX, njobs=streams)
+    return probe
+
+
+def probe_link(
+    cfg: Dict[str, str],
+    streams: int = 16,
+    duration: float = 5.0,
+    chunk_size_mb: int = 8,
+    samples: int = 10,
+) -> LinkProbe:
+    """
+    Measure what the configured source and destination endpoints can carry:
+    request RTT, single-stream and saturated (`streams` concurrent requests,
+    for `duration` seconds each) throughput, and the bandwidth-delay product.
+    """
+    start = time.time()
+    link = LinkProbe(
+        source=probe_source(cfg, streams, duration, chunk_size_mb, samples),
+        dest=probe_dest(cfg, streams, duration, chunk_size_mb, samples),
+    )
+    logger.info(f"Probed the link in {time.time()-start:.2f} seconds: {link.summary()}")
+    return link
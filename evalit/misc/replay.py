@@ -0,0 +1,523 @@
+"""
+Record the raw artifacts of a run, and replay them offline.
+
+With `StandardAutomationController.run(record_path="run.tar.gz", ...)`,
+everything the automations get from their tools (the rclone log, the
+`ShellExecutor` outputs of the MFT client, the session lines of the NiFi
+logs or its provenance events) is archived in a compressed bundle, along
+with the records, timings, filemap and run arguments.
+
+`replay(...)` feeds those artifacts back through the `parse_log` methods
+of the automations and the controller, without any transfer (and without
+the tools installed), so that new analytics can be computed over past runs:
+
+    .. code-block:: python
+
+        from evalit.misc.replay import replay
+
+        results = replay("runs/2022-03-09.tar.gz", analysis=True)
+
+Bundle layout:
+
+    manifest.json               automations (type, state, redacted config)
+    run.json                    run arguments, `filemap.json`, `results.json`
+    <label>/files.json          files of the automation
+    <label>/trial<i>/records.jsonl, shell.jsonl, <tool artifacts>
+    <label>/trial<i>/<child>/files.json, records.jsonl, ...
+                                children of a composite automation
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+from dataclasses import asdict
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple, Type
+
+from loguru import logger
+
+from ..registry import find_automation, get_automation
+from ..structures import TYPE_PATH, TransferDTO
+from .checkpoint import load_timekeeper
+from .shell import ExecutionDTO
+from .streaming import dto_to_record
+
+if TYPE_CHECKING:
+    from .._base import AbstractAutomation
+
+BUNDLE_VERSION = 1
+
+_REDACTED = "<redacted>"
+_SECRET_HINTS = ("token", "secret", "password")
+
+# run arguments that need the endpoints or the tools, never replayed
+_LIVE_KWARGS = (
+    "record_path",
+    "replay",
+    "verify",
+    "reset_destination",
+    "link_probe",
+    "metrics_port",
+    "checkpoint_dir",
+    "resume",
+    "results_path",
+)
+
+
+def _is_secret(key: str) -> bool:
+    return any(hint in key.lower() for hint in _SECRET_HINTS)
+
+
+def _json_safe(value: Any) -> bool:
+    try:
+        json.dumps(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def redact_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: _REDACTED if _is_secret(k) else v for k, v in config.items()}
+
+
+def automation_state(automation: AbstractAutomation) -> Dict[str, Any]:
+    """
+    The JSON-serializable attributes of the automation (its parameters),
+    enough to re-parse its artifacts. Secrets are left out.
+    """
+    state = {}
+    for key, value in vars(automation).items():
+        if key in ("config", "files", "metrics", "timings", "recorder", "name"):
+            continue
+        if _is_secret(key) or not _json_safe(value):
+            continue
+        state[key] = value
+    return state
+
+
+def _automation_type(automation: AbstractAutomation) -> str:
+    cls = automation.__class__
+    return find_automation(cls.__name__) or f"{cls.__module__}:{cls.__qualname__}"
+
+
+def _automation_class(target: str) -> Type[AbstractAutomation]:
+    if ":" not in target:
+        return get_automation(target)
+    import importlib
+
+    module_name, _, attr = target.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def _automation_entry(automation: AbstractAutomation) -> Dict[str, Any]:
+    return dict(
+        label=automation.label,
+        type=_automation_type(automation),
+        config=redact_config(automation.config),
+        state=automation_state(automation),
+    )
+
+
+def _rebuild_automation(entry: Dict[str, Any], files: List[str]) -> AbstractAutomation:
+    """
+    Rebuild a recorded automation from its manifest entry. The constructor
+    isn't run, as it may need the tool (eg: `MFTAutomation` registers the
+    storages with the MFT client).
+    """
+    from .._base import AbstractAutomation
+
+    cls = _automation_class(entry["type"])
+    automation = cls.__new__(cls)
+    AbstractAutomation.__init__(
+        automation, config=entry["config"], files=files, name=entry["label"]
+    )
+    vars(automation).update(entry["state"])
+    return automation
+
+
+class TrialRecorder:
+    """
+    Collects the artifacts of a single trial of an automation.
+    Attached to the automation as `automation.recorder` by the controller.
+
+    Tool outputs are kept as raw as possible, so that the parsers can be
+    changed later and re-run over them:
+
+    - `add_file(...)`/`add_bytes(...)`: tool logs
+    - `add_execution(...)`: `ShellExecutor` outputs (the latest one of
+    each distinct command, eg: the last state of each MFT transfer)
+    - `add_json(...)`: tool responses (eg: NiFi provenance events)
+    """
+
+    def __init__(self, recorder: RunRecorder, prefix: str, secrets: Iterable[str]):
+        self.recorder = recorder
+        self.prefix = prefix
+        self.secrets = tuple(filter(None, map(str, secrets)))
+        self.artifacts: List[str] = []
+        self._executions: Dict[Tuple[str, ...], ExecutionDTO] = {}
+        self._records = tempfile.TemporaryFile(mode="w+b")
+        self._lock = threading.Lock()
+        self._children: Dict[str, Tuple[AbstractAutomation, TrialRecorder]] = {}
+
+    def _name(self, name: str) -> str:
+        with self._lock:
+            if name not in self.artifacts:
+                self.artifacts.append(name)
+        return f"{self.prefix}/{name}"
+
+    def _redact(self, arg: str) -> str:
+        for secret in self.secrets:
+            arg = arg.replace(secret, _REDACTED)
+        return arg
+
+    def add_file(self, name: str, path: TYPE_PATH) -> None:
+        self.recorder.add_file(self._name(name), path)
+
+    def add_bytes(self, name: str, data: bytes) -> None:
+        self.recorder.add_bytes(self._name(name), data)
+
+    def add_json(self, name: str, obj: Any) -> None:
+        self.add_bytes(name, json.dumps(obj, default=str).encode("utf-8"))
+
+    def add_execution(self, exdto: ExecutionDTO) -> None:
+        exdto = ExecutionDTO(
+            cmd=list(map(self._redact, map(str, exdto.cmd))),
+            output=list(exdto.output),
+            errors=list(exdto.errors),
+            status_code=exdto.status_code,
+        )
+        with self._lock:
+            self._executions.pop(tuple(exdto.cmd), None)
+            self._executions[tuple(exdto.cmd)] = exdto
+
+    def add_record(self, dto: TransferDTO) -> None:
+        line = json.dumps(dto_to_record(dto)) + "\n"
+        with self._lock:
+            self._records.write(line.encode("utf-8"))
+
+    def scope(self, automation: AbstractAutomation) -> TrialRecorder:
+        """
+        Recorder for a child automation of this one (eg: the children of a
+        `composite.CompositeAutomation`), in `<prefix>/<child label>/`.
+        Its files and state are recorded as they are now, and its artifacts
+        and records are written when this trial is closed.
+        """
+        secrets = (v for k, v in automation.config.items() if _is_secret(k))
+        scope = TrialRecorder(
+            self.recorder,
+            f"{self.prefix}/{automation.label}",
+            self.secrets + tuple(secrets),
+        )
+        scope.add_json("files.json", list(map(str, automation.files)))
+        with self._lock:
+            self._children[automation.label] = (automation, scope)
+        return scope
+
+    def close(self, timings: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        """
+        Write the records and executions to the bundle, with the ones of
+        the children.
+
+        Returns:
+            The manifest entry of the trial.
+        """
+        children = {
+            label: dict(
+                _automation_entry(automation), **scope.close(automation.timings)
+            )
+            for label, (automation, scope) in self._children.items()
+        }
+        if self._executions:
+            self.add_bytes(
+                "shell.jsonl",
+                "".join(
+                    json.dumps(asdict(exdto)) + "\n"
+                    for exdto in self._executions.values()
+                ).encode("utf-8"),
+            )
+        self.recorder.add_fileobj(self._name("records.jsonl"), self._records)
+        self._records.close()
+        entry = dict(timings=dict(timings or {}), artifacts=list(self.artifacts))
+        if children:
+            entry["children"] = children
+        return entry
+
+
+class RunRecorder:
+    """
+    Writes the artifacts of a controller run to a `.tar.gz` bundle.
+
+    The manifest is written last, on `close(...)`: a bundle without one
+    is from a run that didn't finish.
+    """
+
+    def __init__(
+        self,
+        path: TYPE_PATH,
+        filemap: Optional[Dict[str, dict]] = None,
+        run_kwargs: Optional[Dict[str, Any]] = None,
+        compresslevel: int = 6,
+    ) -> None:
+        self.path = str(path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._tar = tarfile.open(self.path, "w:gz", compresslevel=compresslevel)
+        self._lock = threading.Lock()
+        self.manifest = dict(
+            version=BUNDLE_VERSION, created=datetime.now().isoformat(), automations=[]
+        )
+        self._entries: Dict[str, Dict[str, Any]] = {}
+
+        run_kwargs = {
+            k: v
+            for k, v in (run_kwargs or {}).items()
+            if k not in ("filemap", "record_path", "replay") and _json_safe(v)
+        }
+        self.add_json("run.json", run_kwargs)
+        self.add_json("filemap.json", filemap or {})
+        logger.info(f"Recording the run to {self.path}")
+
+    def add_fileobj(self, name: str, fileobj: io.IOBase) -> None:
+        fileobj.seek(0, io.SEEK_END)
+        info = tarfile.TarInfo(name)
+        info.size = fileobj.tell()
+        info.mtime = int(time.time())
+        fileobj.seek(0)
+        with self._lock:
+            self._tar.addfile(info, fileobj)
+
+    def add_bytes(self, name: str, data: bytes) -> None:
+        self.add_fileobj(name, io.BytesIO(data))
+
+    def add_json(self, name: str, obj: Any) -> None:
+        self.add_bytes(name, json.dumps(obj, default=str).encode("utf-8"))
+
+    def add_file(self, name: str, path: TYPE_PATH) -> None:
+        if not os.path.exists(path):
+            logger.warning(f"Artifact {path} doesn't exist. Not recorded!")
+            return
+        with self._lock:
+            self._tar.add(str(path), arcname=name, recursive=False)
+
+    def scope(self, automation: AbstractAutomation, trial: int) -> TrialRecorder:
+        """
+        Recorder for a trial of the automation.
+        """
+        label = automation.label
+        if label not in self._entries:
+            self._entries[label] = dict(_automation_entry(automation), trials={})
+            self.manifest["automations"].append(self._entries[label])
+            self.add_json(f"{label}/files.json", list(map(str, automation.files)))
+        secrets = (v for k, v in automation.config.items() if _is_secret(k))
+        return TrialRecorder(self, f"{label}/trial{trial}", secrets)
+
+    def close_scope(
+        self,
+        automation: AbstractAutomation,
+        trial: int,
+        scope: TrialRecorder,
+    ) -> None:
+        self._entries[automation.label]["trials"][str(trial)] = scope.close(
+            automation.timings
+        )
+
+    def close(self, results: Optional[Dict[str, Any]] = None) -> None:
+        if results is not None:
+            self.add_json("results.json", results)
+        self.add_json("manifest.json", self.manifest)
+        self._tar.close()
+        logger.info(f"Run recorded to {self.path}")
+
+
+class TrialArtifacts:
+    """
+    The recorded artifacts of a single trial, read from a `RunBundle`.
+    """
+
+    def __init__(self, root: str, entry: Dict[str, Any]) -> None:
+        self.root = root
+        self.names = tuple(entry.get("artifacts", []))
+        self.timings = dict(entry.get("timings", {}))
+        self._children: Dict[str, Dict[str, Any]] = dict(entry.get("children", {}))
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names
+
+    def path(self, name: str) -> str:
+        if name not in self.names:
+            raise KeyError(f"No artifact {name} in {self.root}")
+        return os.path.join(self.root, name)
+
+    def json(self, name: str) -> Any:
+        with open(self.path(name)) as f:
+            return json.load(f)
+
+    def executions(self) -> List[ExecutionDTO]:
+        if "shell.jsonl" not in self.names:
+            return []
+        with open(self.path("shell.jsonl")) as f:
+            return [ExecutionDTO(**json.loads(line)) for line in f if line.strip()]
+
+    def records(self) -> Tuple[TransferDTO]:
+        with open(self.path("records.jsonl")) as f:
+            return load_timekeeper(json.loads(line) for line in f if line.strip())
+
+    @property
+    def children(self) -> Tuple[str]:
+        """
+        Labels of the recorded child automations (see `TrialRecorder.scope`).
+        """
+        return tuple(self._children)
+
+    def child(self, label: str) -> TrialArtifacts:
+        if label not in self._children:
+            raise KeyError(f"No child {label} in {self.root}. Got {self.children}")
+        return TrialArtifacts(os.path.join(self.root, label), self._children[label])
+
+    def child_automation(self, label: str) -> AbstractAutomation:
+        """
+        Rebuild the recorded child automation, with its files of the trial
+        (see `RunBundle.automation(...)`).
+        """
+        return _rebuild_automation(
+            self._children[label], self.child(label).json("files.json")
+        )
+
+
+class RunBundle:
+    """
+    A recorded run, extracted to a temporary directory
+    (removed on `close()`).
+
+    Usage:
+
+        .. code-block:: python
+
+            with RunBundle("run.tar.gz") as bundle:
+                artifacts = bundle.artifacts("rclone-16", trial=0)
+                log = artifacts.path("rclone.log")
+    """
+
+    def __init__(self, path: TYPE_PATH) -> None:
+        self.path = str(path)
+        self.root = tempfile.mkdtemp(prefix="evalit_replay_")
+        try:
+            self._extract()
+            self.manifest = self._load("manifest.json")
+        except Exception:
+            self.close()
+            raise
+        if self.manifest.get("version", 0) > BUNDLE_VERSION:
+            logger.warning(
+                f"{self.path} is from a newer version (bundle version={self.manifest['version']})"
+            )
+        self.run_kwargs: Dict[str, Any] = self._load("run.json")
+        self.filemap: Dict[str, dict] = self._load("filemap.json")
+        self.results: Optional[Dict[str, Any]] = (
+            self._load("results.json")
+            if os.path.exists(os.path.join(self.root, "results.json"))
+            else None
+        )
+        self._entries = {e["label"]: e for e in self.manifest["automations"]}
+
+    def _extract(self) -> None:
+        with tarfile.open(self.path, "r:gz") as tar:
+            for member in tar:
+                name = os.path.normpath(member.name)
+                if not member.isfile() or os.path.isabs(name) or name.startswith(".."):
+                    logger.warning(f"Skipping {member.name} in {self.path}")
+                    continue
+                target = os.path.join(self.root, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with tar.extractfile(member) as src, open(target, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+        if not os.path.exists(os.path.join(self.root, "manifest.json")):
+            raise ValueError(f"{self.path} has no manifest. Did the run finish?")
+
+    def _load(self, name: str) -> Any:
+        with open(os.path.join(self.root, name)) as f:
+            return json.load(f)
+
+    @property
+    def labels(self) -> Tuple[str]:
+        return tuple(self._entries)
+
+    def ntrials(self, label: str) -> int:
+        return len(self._entries[label]["trials"])
+
+    def artifacts(self, label: str, trial: int = 0) -> TrialArtifacts:
+        if label not in self._entries:
+            raise KeyError(f"No automation {label} in {self.path}. Got {self.labels}")
+        trials = self._entries[label]["trials"]
+        if str(trial) not in trials:
+            raise KeyError(f"No trial {trial} of {label} in {self.path}")
+        return TrialArtifacts(
+            os.path.join(self.root, label, f"trial{trial}"), trials[str(trial)]
+        )
+
+    def automation(self, label: str) -> AbstractAutomation:
+        """
+        Rebuild the recorded automation for replaying, from its state.
+        See `_rebuild_automation(...)`.
+        """
+        with open(os.path.join(self.root, label, "files.json")) as f:
+            files = json.load(f)
+        return _rebuild_automation(self._entries[label], files)
+
+    def automations(self) -> List[AbstractAutomation]:
+        return [self.automation(label) for label in self.labels]
+
+    def close(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self) -> RunBundle:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def replay(
+    path: TYPE_PATH,
+    automations: Optional[List[AbstractAutomation]] = None,
+    **kwargs,
+) -> Dict[str, dict]:
+    """
+    Replay a recorded run through the controller: the recorded tool
+    artifacts are parsed again by the automations, and the results
+    computed as for a live run (with the recorded trials, filemap and
+    run arguments, which `kwargs` override).
+
+    Verification, destination reset, link probe and checkpoints need the
+    endpoints and are skipped.
+
+    Args:
+        `automations`: `List[AbstractAutomation]`
+            Automations to parse the artifacts with, matched by label.
+            By default, the recorded automations are rebuilt
+            (see `RunBundle.automation(...)`).
+    """
+    from ..controller import StandardAutomationController
+
+    with RunBundle(path) as bundle:
+        automations = automations or bundle.automations()
+        run_kwargs = {
+            k: v for k, v in bundle.run_kwargs.items() if k not in _LIVE_KWARGS
+        }
+        # graphs are slow for many runs: opt-in
+        run_kwargs.setdefault("graphs", False)
+        run_kwargs.update(kwargs)
+        run_kwargs.setdefault("filemap", bundle.filemap)
+        run_kwargs["trials"] = max(bundle.ntrials(a.label) for a in automations)
+        logger.info(f"Replaying {path} ({len(automations)} automations)")
+        return (
+            StandardAutomationController()
+            .add_automations(automations)
+            .run(replay=bundle, **run_kwargs)
+        )
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Set
+
+from loguru import logger
+
+from .s3 import iter_objects, make_s3_client
+
+# maximum number of keys of a single DeleteObjects request
+_DELETE_BATCH = 1000
+
+
+def _batches(objects: Iterator[Dict[str, Any]], size: int) -> Iterator[List[str]]:
+    batch = []
+    for obj in objects:
+        batch.append(obj["Key"])
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _iter_uploads(client: Any, bucket: str, prefix: str) -> Iterator[Dict[str, str]]:
+    paginator = client.get_paginator("list_multipart_uploads")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for upload in page.get("Uploads", []):
+            yield dict(Key=upload["Key"], UploadId=upload["UploadId"])
+
+
+def reset_bucket(
+    cfg: Dict[str, str],
+    side: str = "dest",
+    prefix: str = "",
+    njobs: int = 16,
+    abort_uploads: bool = True,
+) -> Dict[str, Any]:
+    """
+    Empty the bucket (or only `prefix`) of the config, so that every trial
+    transfers to the same empty destination.
+
+    The objects are listed page by page and deleted in batches of 1000 keys
+    (`DeleteObjects`), `njobs` batches at a time while the listing goes on.
+    Multipart uploads left open by failed runs are aborted too, as their
+    parts are billed and some tools resume them.
+
+    Returns:
+        dict with the number of "deleted" objects, "errors",
+        "aborted_uploads" and the "seconds" the reset took.
+    """
+    from botocore.config import Config
+
+    start = time.time()
+    client = make_s3_client(
+        cfg, side, config=Config(max_pool_connections=max(10, njobs))
+    )
+    bucket = cfg[f"{side}_s3_bucket"]
+    result = dict(deleted=0, errors=0, aborted_uploads=0)
+    lock = threading.Lock()
+
+    def _delete(keys: List[str]) -> None:
+        response = client.delete_objects(
+            Bucket=bucket,
+            Delete=dict(Objects=[dict(Key=k) for k in keys], Quiet=True),
+        )
+        errors = response.get("Errors", [])
+        for error in errors[:5]:
+            logger.error(f"Failed to delete {error['Key']}: {error.get('Message')}")
+        with lock:
+            result["errors"] += len(errors)
+            result["deleted"] += len(keys) - len(errors)
+
+    def _abort(upload: Dict[str, str]) -> None:
+        client.abort_multipart_upload(Bucket=bucket, **upload)
+        with lock:
+            result["aborted_uploads"] += 1
+
+    pending: Set[Future] = set()
+    with ThreadPoolExecutor(max_workers=njobs) as executor:
+
+        def _submit(func, arg) -> None:
+            nonlocal pending
+            # bounded, so that the listing doesn't run ahead of the deletes
+            while len(pending) >= 2 * njobs:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(executor.submit(func, arg))
+
+        if abort_uploads:
+            for upload in _iter_uploads(client, bucket, prefix):
+                _submit(_abort, upload)
+        for keys in _batches(iter_objects(client, bucket, prefix), _DELETE_BATCH):
+            _submit(_delete, keys)
+        for future in wait(pending).done:
+            future.result()
+
+    result["seconds"] = time.time() - start
+    logger.info(
+        f"Reset s3://{bucket}/{prefix} in {result['seconds']:.2f} seconds: {result}"
+    )
+    return result
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import queue
+import threading
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from loguru import logger
+
+_SIDES = ("source", "dest")
+
+
+def make_s3_client(cfg: Dict[str, str], side: str = "source", **client_kwargs) -> Any:
+    """
+    Build a boto3 s3 client for the source or destination of the config.
+
+    Args:
+        `cfg`: `Dict[str, str]`
+            Config with the `<side>_token`, `<side>_secret`,
+            `<side>_s3_endpoint` and `<side>_s3_region` keys.
+
+        `side`: `str`
+            "source" or "dest"
+    """
+    if side not in _SIDES:
+        raise ValueError(f"Invalid side={side}. Expected one of {_SIDES}")
+
+    # importing at runtime, as boto3 is only needed by the s3 helpers
+    import boto3
+
+    logger.debug(f"Boto3 version: {boto3.__version__}")
+    return boto3.client(
+        "s3",
+        aws_access_key_id=cfg[f"{side}_token"],
+        aws_secret_access_key=cfg[f"{side}_secret"],
+        endpoint_url=cfg[f"{side}_s3_endpoint"],
+        region_name=cfg[f"{side}_s3_region"],
+        **client_kwargs,
+    )
+
+
+def iter_objects(
+    client: Any,
+    bucket: str,
+    prefix: str = "",
+    page_size: int = 1000,
+    start_after: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily list all the objects of the bucket, page by page.
+
+    S3 returns the keys in ascending (UTF-8 binary) order, so the objects
+    are yielded sorted by key.
+
+    Yields:
+        dicts like `{"Key": ..., "Size": ..., "ETag": ...}`
+    """
+    paginator = client.get_paginator("list_objects_v2")
+    params = dict(
+        Bucket=bucket, Prefix=prefix, PaginationConfig={"PageSize": page_size}
+    )
+    if start_after:
+        params["StartAfter"] = start_after
+    for page in paginator.paginate(**params):
+        for obj in page.get("Contents", []):
+            yield {
+                "Key": obj["Key"],
+                "Size": obj["Size"],
+                "ETag": obj.get("ETag", "").strip('"'),
+            }
+
+
+def is_multipart_etag(etag: Optional[str]) -> bool:
+    """
+    Multipart uploads have ETags like "<md5 of the part md5s>-<nparts>",
+    which depend on the part size and aren't comparable across uploads.
+    """
+    return bool(etag) and "-" in etag
+
+
+def prefetch(iterator: Iterable[Any], maxsize: int = 10000) -> Iterator[Any]:
+    """
+    Consume the iterator (eg: a listing) in a background thread, keeping
+    up to `maxsize` items ahead. Wrapping both the source and destination
+    listings lets them be fetched in parallel while they're joined.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    done = object()
+    stop = threading.Event()
+    error = []
+
+    def _put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce():
+        try:
+            for item in iterator:
+                if not _put(item):
+                    return
+        except BaseException as e:
+            error.append(e)
+        finally:
+            _put(done)
+
+    thread = threading.Thread(target=_produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                break
+            yield item
+    finally:
+        # in case the consumer stopped early
+        stop.set()
+        thread.join()
+    if error:
+        raise error[0]
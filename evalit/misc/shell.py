@@ -58,4 +58,22 @@ class ShellExecutor:
             (out, err) = proc.communicate()
             exdto.output = out.decode("utf-8").split("\n")
             exdto.errros = err
+            exdto.status_code = proc.returncode
         return exdto
+
+
+class ReplayShellExecutor(ShellExecutor):
+    """
+    Serves recorded executions (see `misc.replay`) instead of running
+    the commands: each command gets the latest output recorded for it.
+    """
+
+    def __init__(self, executions: List[ExecutionDTO]):
+        super().__init__()
+        self.executions = {tuple(exdto.cmd): exdto for exdto in executions}
+
+    def __call__(self, commands: List[str]):
+        exdto = self.executions.get(tuple(map(str, commands)))
+        if exdto is None:
+            raise KeyError(f"No recorded execution for command = {commands}")
+        return copy.deepcopy(exdto)
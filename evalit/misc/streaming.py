@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import json
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional, Sequence, TextIO
+
+from loguru import logger
+
+from ..structures import TYPE_PATH, TransferDTO, TransferStatus
+
+_GB = 1024 * 1024 * 1024
+_EPOCH = datetime(1970, 1, 1)
+
+
+def dto_to_record(dto: TransferDTO, **extra) -> Dict[str, Any]:
+    """
+    Convert a `TransferDTO` to a JSON-serializable dict.
+    Times are stored in ISO format.
+    """
+    record = dict(extra)
+    record.update(
+        fname=dto.fname,
+        transferer=dto.transferer,
+        start_time=dto.start_time.isoformat() if dto.start_time else None,
+        end_time=dto.end_time.isoformat() if dto.end_time else None,
+        nbytes=dto.nbytes,
+        status=TransferStatus(dto.status).value if dto.status is not None else None,
+    )
+    return record
+
+
+def record_to_dto(record: Dict[str, Any]) -> TransferDTO:
+    """
+    Inverse of `dto_to_record(...)`.
+    """
+
+    def _parse(t):
+        return datetime.fromisoformat(t) if t else None
+
+    return TransferDTO(
+        fname=record["fname"],
+        transferer=record["transferer"],
+        start_time=_parse(record.get("start_time")),
+        end_time=_parse(record.get("end_time")),
+        nbytes=record.get("nbytes"),
+        status=TransferStatus(record["status"]) if record.get("status") else None,
+    )
+
+
+class _Window:
+    """
+    Aggregates (count, volume, time span) of a set of transfers.
+    """
+
+    __slots__ = ("count", "volume", "tmin", "tmax")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.volume = 0.0
+        self.tmin = float("inf")
+        self.tmax = float("-inf")
+
+    def add(self, start: float, end: float, volume: float) -> None:
+        self.count += 1
+        self.volume += volume
+        self.tmin = min(self.tmin, start, end)
+        self.tmax = max(self.tmax, start, end)
+
+    @property
+    def span(self) -> float:
+        return self.tmax - self.tmin if self.count else 0.0
+
+
+class RunningThroughput:
+    """
+    Computes the throughput (Gbps) of a stream of transfer records
+    in constant memory, as records are added one at a time.
+
+    The result is the same as computing it over all the records at once
+    with `StandardAutomationController`: the volume comes from the filemap
+    sizes, or from the bytes reported by the tool when no name matches the
+    filemap, or from all the `file_sizes` otherwise.
+
+    Only the successful transfers are counted. The FAILED/TIMED_OUT ones
+    are tallied in `failures`.
+
+    Usage:
+
+        .. code-block:: python
+
+            tracker = RunningThroughput(filemap)
+            for dto in automation.stream_automation():
+                tracker.add(dto)
+                logger.info(tracker.throughput())
+    """
+
+    def __init__(
+        self,
+        filemap: Optional[Dict[str, dict]] = None,
+        file_sizes: Optional[Sequence[float]] = None,
+    ) -> None:
+        self.filemap = filemap or {}
+        self.total_size = sum(file_sizes) if file_sizes is not None else None
+        self._mapped = _Window()
+        self._unmapped = _Window()
+        self._unmapped_nbytes = True
+        self.skipped = 0
+        self.failures: Dict[str, int] = {}
+
+    def add(self, dto: TransferDTO) -> bool:
+        """
+        Add a single record. Failed records and records without
+        start/end times are not counted in the throughput.
+
+        Returns:
+            `True` if the record was counted.
+        """
+        if dto.failed:
+            key = TransferStatus(dto.status).value
+            self.failures[key] = self.failures.get(key, 0) + 1
+            return False
+        if dto.start_time is None or dto.end_time is None:
+            self.skipped += 1
+            return False
+        start = (dto.start_time - _EPOCH).total_seconds()
+        end = (dto.end_time - _EPOCH).total_seconds()
+        if dto.fname in self.filemap:
+            self._mapped.add(start, end, self.filemap[dto.fname]["size"])
+        else:
+            self._unmapped_nbytes = self._unmapped_nbytes and dto.nbytes is not None
+            self._unmapped.add(start, end, (dto.nbytes or 0) / _GB)
+        return True
+
+    @property
+    def count(self) -> int:
+        """
+        Number of records counted in the throughput.
+        """
+        return self._mapped.count or self._unmapped.count
+
+    @property
+    def volume(self) -> float:
+        """
+        Volume (in GB) counted in the throughput.
+        """
+        if self._mapped.count:
+            return self._mapped.volume
+        if self._unmapped.count and self._unmapped_nbytes:
+            return self._unmapped.volume
+        return self.total_size if self.total_size is not None else 0.0
+
+    @property
+    def span(self) -> float:
+        """
+        Seconds between the earliest start and the latest end.
+        """
+        return (self._mapped if self._mapped.count else self._unmapped).span
+
+    def throughput(self) -> float:
+        """
+        Throughput in Gbps of the records added so far.
+        """
+        span = self.span
+        if span <= 0:
+            return 0.0
+        return round(self.volume * 8 / span, 3)
+
+    def objects_per_second(self) -> float:
+        """
+        Number of transfers completed per second, which matters more than
+        the throughput for datasets of many small objects.
+        """
+        span = self.span
+        if span <= 0:
+            return 0.0
+        return round(self.count / span, 3)
+
+
+class ResultWriter:
+    """
+    Writes transfer records to a JSON lines file, one record per line,
+    as they are produced. Each line is flushed so that the file can be
+    tailed while the run is still going.
+    """
+
+    def __init__(self, path: TYPE_PATH, mode: str = "w") -> None:
+        self.path = path
+        self._file: Optional[TextIO] = open(path, mode)
+        self._lock = threading.Lock()
+        logger.info(f"Writing results to {path}")
+
+    def write(self, dto: TransferDTO, **extra) -> None:
+        line = json.dumps(dto_to_record(dto, **extra)) + "\n"
+        # concurrent automations share the writer
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> ResultWriter:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def read_results(
+    path: TYPE_PATH, automation: Optional[str] = None
+) -> Iterator[TransferDTO]:
+    """
+    Lazily read back the records written by `ResultWriter`,
+    optionally only the ones of the given automation.
+    """
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if automation is not None and record.get("automation") != automation:
+                continue
+            yield record_to_dto(record)
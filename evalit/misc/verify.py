@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import hashlib
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from loguru import logger
+
+from .delta import merge_listings, same_object
+from .s3 import is_multipart_etag, iter_objects, make_s3_client, prefetch
+
+_MB = 1024 * 1024
+
+try:
+    import google_crc32c
+
+    def _crc32c_update(crc: int, data: bytes) -> int:
+        return google_crc32c.extend(crc, data)
+
+    CRC32C = True
+except ModuleNotFoundError:
+    try:
+        import crc32c as _crc32c
+
+        def _crc32c_update(crc: int, data: bytes) -> int:
+            return _crc32c.crc32c(data, crc)
+
+        CRC32C = True
+    except ModuleNotFoundError:
+        CRC32C = False
+
+_HASH_ALGORITHMS = ("etag", "crc32c")
+
+
+@dataclass
+class VerificationReport:
+    """
+    Outcome of `verify_transfer(...)`.
+    """
+
+    # number of objects compared through the listings
+    checked: int = 0
+
+    # keys missing at the destination, or differing in size/ETag
+    missing: List[str] = field(default_factory=list)
+    mismatched: List[str] = field(default_factory=list)
+
+    # number of objects re-hashed, and the ones whose content differs
+    sampled: int = 0
+    hash_mismatched: List[str] = field(default_factory=list)
+
+    # keys that couldn't be re-hashed
+    errors: List[str] = field(default_factory=list)
+
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not (self.missing or self.mismatched or self.hash_mismatched)
+
+    def summary(self) -> Dict[str, Any]:
+        return dict(
+            ok=self.ok,
+            checked=self.checked,
+            missing=len(self.missing),
+            mismatched=len(self.mismatched),
+            sampled=self.sampled,
+            hash_mismatched=len(self.hash_mismatched),
+            errors=len(self.errors),
+        )
+
+
+def is_sampled(key: str, fraction: float) -> bool:
+    """
+    Deterministic sampling of the keys, so that reruns re-hash
+    the same objects.
+    """
+    if fraction <= 0:
+        return False
+    if fraction >= 1:
+        return True
+    return zlib.crc32(key.encode("utf-8")) % 10000 < fraction * 10000
+
+
+def _iter_body(client: Any, bucket: str, key: str, chunk_size: int):
+    body = client.get_object(Bucket=bucket, Key=key)["Body"]
+    try:
+        yield from body.iter_chunks(chunk_size=chunk_size)
+    finally:
+        body.close()
+
+
+def streaming_etag(chunks: Iterable[bytes], part_size: Optional[int] = None) -> str:
+    """
+    Compute the S3 ETag of a stream without holding it in memory:
+    the MD5 of the content, or for multipart objects (`part_size` given)
+    the MD5 of the concatenated part MD5s followed by "-<nparts>".
+    """
+    if not part_size:
+        md5 = hashlib.md5()
+        for chunk in chunks:
+            md5.update(chunk)
+        return md5.hexdigest()
+
+    digests = []
+    part, filled = hashlib.md5(), 0
+    for chunk in chunks:
+        view = memoryview(chunk)
+        while view:
+            n = min(len(view), part_size - filled)
+            part.update(view[:n])
+            filled += n
+            view = view[n:]
+            if filled == part_size:
+                digests.append(part.digest())
+                part, filled = hashlib.md5(), 0
+    if filled or not digests:
+        digests.append(part.digest())
+    return f"{hashlib.md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+
+
+def streaming_crc32c(chunks: Iterable[bytes]) -> int:
+    if not CRC32C:
+        raise ModuleNotFoundError(
+            "CRC32C verification needs the google-crc32c or crc32c package!"
+        )
+    crc = 0
+    for chunk in chunks:
+        crc = _crc32c_update(crc, chunk)
+    return crc
+
+
+def _rehash(
+    source: Any,
+    dest: Any,
+    cfg: Dict[str, str],
+    dest_obj: Dict[str, Any],
+    algorithm: str,
+    chunk_size: int,
+    dest_prefix: str = "",
+) -> bool:
+    """
+    Re-hash a single object. Returns `True` if the contents match.
+
+    With "etag", only the source is streamed: its ETag is computed with
+    the part size of the destination upload and compared to the ETag the
+    destination computed from the bytes it received.
+    With "crc32c", both sides are streamed and their CRC32C compared.
+    """
+    key = dest_obj["Key"]
+    dest_key = dest_prefix + key
+    source_chunks = _iter_body(source, cfg["source_s3_bucket"], key, chunk_size)
+    if algorithm == "crc32c":
+        dest_chunks = _iter_body(dest, cfg["dest_s3_bucket"], dest_key, chunk_size)
+        return streaming_crc32c(source_chunks) == streaming_crc32c(dest_chunks)
+
+    part_size = None
+    if is_multipart_etag(dest_obj["ETag"]):
+        # the first part tells the part size used by the upload
+        part_size = dest.head_object(
+            Bucket=cfg["dest_s3_bucket"], Key=dest_key, PartNumber=1
+        )["ContentLength"]
+    return streaming_etag(source_chunks, part_size) == dest_obj["ETag"]
+
+
+def verify_transfer(
+    cfg: Dict[str, str],
+    keys: Optional[Iterable[str]] = None,
+    prefix: str = "",
+    sample_fraction: float = 0.0,
+    hash_algorithm: str = "etag",
+    njobs: int = 16,
+    chunk_size_mb: int = 8,
+    dest_prefix: str = "",
+) -> VerificationReport:
+    """
+    Verify that the destination matches the source.
+
+    The source and destination are listed in parallel and joined on key
+    (see `misc.delta.merge_listings`): every source object must exist at
+    the destination with the same size and (single-part) ETag.
+    Then `sample_fraction` of the matching objects are re-hashed by
+    streaming them in `chunk_size_mb` chunks, `njobs` at a time.
+
+    Args:
+        `keys`: `Iterable[str]`
+            Only verify these keys (eg: the ones an automation transferred).
+            Defaults to all the source objects.
+
+        `hash_algorithm`: `str`
+            "etag" (multipart-style MD5 ETag) or "crc32c"
+            (needs the optional google-crc32c/crc32c package).
+
+        `dest_prefix`: `str`
+            Prefix under which the source keys were copied
+            (see `AbstractAutomation.dest_prefix`).
+    """
+    if hash_algorithm not in _HASH_ALGORITHMS:
+        raise ValueError(
+            f"Invalid hash_algorithm={hash_algorithm}. Expected one of {_HASH_ALGORITHMS}"
+        )
+    if hash_algorithm == "crc32c" and sample_fraction > 0 and not CRC32C:
+        raise ModuleNotFoundError(
+            "CRC32C verification needs the google-crc32c or crc32c package!"
+        )
+
+    start = time.time()
+    from botocore.config import Config
+
+    client_config = Config(max_pool_connections=max(10, njobs))
+    source = make_s3_client(cfg, "source", config=client_config)
+    dest = make_s3_client(cfg, "dest", config=client_config)
+
+    wanted = set(map(str, keys)) if keys is not None else None
+    source_objects = prefetch(iter_objects(source, cfg["source_s3_bucket"], prefix))
+    if wanted is not None:
+        source_objects = filter(lambda o: o["Key"] in wanted, source_objects)
+    dest_objects = prefetch(
+        iter_objects(dest, cfg["dest_s3_bucket"], dest_prefix + prefix)
+    )
+    if dest_prefix:
+        # joined on the source keys (the order is kept)
+        dest_objects = map(
+            lambda o: dict(o, Key=o["Key"][len(dest_prefix) :]), dest_objects
+        )
+
+    report = VerificationReport()
+    samples = []
+    for src_obj, dest_obj in merge_listings(source_objects, dest_objects):
+        if src_obj is None:
+            continue
+        report.checked += 1
+        if dest_obj is None:
+            report.missing.append(src_obj["Key"])
+        elif not same_object(src_obj, dest_obj):
+            report.mismatched.append(src_obj["Key"])
+        elif is_sampled(src_obj["Key"], sample_fraction):
+            samples.append(dest_obj)
+
+    if samples:
+        logger.info(f"Re-hashing {len(samples)} objects ({hash_algorithm})...")
+
+        def _check(dest_obj) -> Optional[bool]:
+            try:
+                return _rehash(
+                    source,
+                    dest,
+                    cfg,
+                    dest_obj,
+                    hash_algorithm,
+                    chunk_size_mb * _MB,
+                    dest_prefix=dest_prefix,
+                )
+            except Exception as e:
+                logger.error(f"Failed to re-hash {dest_obj['Key']}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=njobs) as executor:
+            for dest_obj, matched in zip(samples, executor.map(_check, samples)):
+                if matched is None:
+                    report.errors.append(dest_obj["Key"])
+                    continue
+                report.sampled += 1
+                if not matched:
+                    report.hash_mismatched.append(dest_obj["Key"])
+
+    report.seconds = time.time() - start
+    log = logger.info if report.ok else logger.warning
+    log(f"Verification took {report.seconds:.2f} seconds: {report.summary()}")
+    return report
@@ -0,0 +1 @@
+from .native_automation import NativeAutomation
@@ -0,0 +1,447 @@
+from __future__ import annotations
+
+import json
+import re
+import socket
+import tarfile
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from loguru import logger
+
+from .._base import AbstractAutomation
+from ..misc.s3 import iter_objects, make_s3_client
+from ..structures import TYPE_PATH, TransferDTO, TransferStatus
+
+_MB = 1024 * 1024
+_TAR_BLOCK = 512
+
+# S3 multipart uploads need parts of at least 5 MB (except the last one)
+_MIN_PART_SIZE = 5 * _MB
+
+
+def _tar_member(key: str, data: bytes) -> Tuple[bytes, bytes]:
+    """
+    Tar header and (padded) payload of a single archive member.
+    PAX headers are used so that long keys are kept as they are.
+    """
+    info = tarfile.TarInfo(name=key)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    header = info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8")
+    padding = b"\0" * (-len(data) % _TAR_BLOCK)
+    return header, padding
+
+
+class _BundleUpload:
+    """
+    A single bundle: a tar archive assembled in memory and uploaded as
+    one multipart object, part by part, while the next part is filled.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        bucket: str,
+        key: str,
+        part_size: int,
+        executor: ThreadPoolExecutor,
+        max_pending: int,
+    ) -> None:
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size, _MIN_PART_SIZE)
+        self.executor = executor
+        self.max_pending = max(1, max_pending)
+
+        self.upload_id = client.create_multipart_upload(Bucket=bucket, Key=key)[
+            "UploadId"
+        ]
+        self.buffer = bytearray()
+        self.offset = 0
+        self.index: List[Dict[str, Any]] = []
+
+        # (part future, records whose bytes are in the part)
+        self._parts: List[Tuple[Future, List[TransferDTO]]] = []
+        self._members: List[TransferDTO] = []
+        self._aborted = False
+
+    def add(self, key: str, data: bytes, dto: TransferDTO) -> None:
+        header, padding = _tar_member(key, data)
+        self.index.append(
+            dict(key=key, offset=self.offset + len(header), size=len(data))
+        )
+        self.buffer += header
+        self.buffer += data
+        self.buffer += padding
+        self.offset += len(header) + len(data) + len(padding)
+        self._members.append(dto)
+        if len(self.buffer) >= self.part_size:
+            self._flush()
+
+    def _upload_part(self, part_number: int, body: bytes) -> Tuple[dict, datetime]:
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        return dict(PartNumber=part_number, ETag=response["ETag"]), datetime.now()
+
+    def _flush(self) -> None:
+        # bound the memory held by the parts being uploaded
+        pending = [f for f, _ in self._parts if not f.done()]
+        if len(pending) >= self.max_pending:
+            wait(pending[: len(pending) - self.max_pending + 1])
+
+        part_number = len(self._parts) + 1
+        future = self.executor.submit(
+            self._upload_part, part_number, bytes(self.buffer)
+        )
+        self._parts.append((future, self._members))
+        self.buffer = bytearray()
+        self._members = []
+
+    def complete(self) -> List[TransferDTO]:
+        """
+        Upload the last part and complete the multipart upload.
+        Each record ends when the part holding its bytes was uploaded.
+        """
+        # end-of-archive marker
+        self.buffer += b"\0" * (2 * _TAR_BLOCK)
+        self._flush()
+
+        dtos, parts = [], []
+        try:
+            for future, members in self._parts:
+                part, end_time = future.result()
+                parts.append(part)
+                for dto in members:
+                    dto.end_time = end_time
+                dtos.extend(members)
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except Exception:
+            self.abort()
+            raise
+        return dtos
+
+    def abort(self) -> None:
+        if self._aborted:
+            return
+        self._aborted = True
+        wait([f for f, _ in self._parts])
+        self.client.abort_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+        )
+
+    def members(self) -> List[TransferDTO]:
+        return [dto for _, members in self._parts for dto in members] + self._members
+
+
+class NativeAutomation(AbstractAutomation):
+    """
+    s3-s3 transfer component using boto3 directly (no external tool).
+
+    Two modes are available:
+        - "object": every object is copied on its own
+        (GET streamed into a managed upload), `njobs` at a time.
+        - "bundle": objects up to `bundle_threshold_mb` are packed into tar
+        archives assembled in memory, each uploaded as a single multipart
+        object of `part_size_mb` parts. A byte-offset index
+        (`<bundle>.index.json`) is written next to each archive, so that
+        any object can be fetched back with a ranged GET or unpacked with
+        `tar`. Larger objects are copied as in "object" mode.
+        The archive keys hold a unique session id, so concurrent runs
+        (eg: distributed workers) never overwrite each other's archives.
+        The indexes are read back once uploaded, and the records of a
+        bundle whose index doesn't match are marked as FAILED.
+
+    In "bundle" mode, a record starts when its object is fetched and ends
+    when the part holding its bytes is uploaded, so objects/sec and Gbps
+    are comparable with "object" mode.
+
+    Note:
+        Extra params passed through `**params` are:
+            - mode ("object" or "bundle")
+            - njobs (number of concurrent GETs/copies)
+            - part_size_mb (multipart part size)
+            - upload_concurrency (number of concurrent part uploads)
+            - bundle_threshold_mb (max size of an object to be bundled)
+            - bundle_size_mb (max size of a single archive)
+            - bundle_prefix (destination prefix of the archives)
+            - dest_prefix (prefix of the destination keys, archives included)
+            - name (label in the controller results)
+    """
+
+    _MODES = ("object", "bundle")
+
+    def __init__(
+        self,
+        config: Union[Dict[str, str], TYPE_PATH],
+        files: Optional[Sequence[TYPE_PATH]] = None,
+        debug: bool = False,
+        **params,
+    ) -> None:
+        super().__init__(
+            config=config, files=files, debug=debug, name=params.get("name")
+        )
+        self.mode = params.get("mode", "object")
+        if self.mode not in self._MODES:
+            raise ValueError(f"Invalid mode={self.mode}. Expected one of {self._MODES}")
+        self.njobs = max(1, int(params.get("njobs", 16)))
+        self.part_size_mb = params.get("part_size_mb", 64)
+        self.upload_concurrency = max(1, int(params.get("upload_concurrency", 4)))
+        self.bundle_threshold_mb = params.get("bundle_threshold_mb", 8)
+        self.bundle_size_mb = params.get("bundle_size_mb", 4096)
+        self.bundle_prefix = params.get("bundle_prefix", "evalit-bundles/")
+        self.dest_prefix = params.get("dest_prefix", "")
+
+    @property
+    def verifiable(self) -> bool:
+        # bundled objects only exist inside the archives
+        return self.mode != "bundle"
+
+    def _clients(self) -> Tuple[Any, Any]:
+        from botocore.config import Config
+
+        client_config = Config(
+            max_pool_connections=self.njobs + self.upload_concurrency
+        )
+        return (
+            make_s3_client(self.config, "source", config=client_config),
+            make_s3_client(self.config, "dest", config=client_config),
+        )
+
+    def _source_objects(self, source: Any) -> List[Dict[str, Any]]:
+        """
+        The source objects to transfer (all of them if no `files`).
+        """
+        objects = iter_objects(source, self.config["source_s3_bucket"])
+        if self.files:
+            wanted = set(map(str, self.files))
+            objects = filter(lambda o: o["Key"] in wanted, objects)
+        return list(objects)
+
+    def run_automation(self, **kwargs) -> Tuple[TransferDTO]:
+        start_automation = time.time()
+        source, dest = self._clients()
+
+        objects = self._source_objects(source)
+        self.timings["listing"] = time.time() - start_automation
+        logger.info(
+            f"[{self.label}] {len(objects)} objects to transfer in {self.mode} mode"
+        )
+
+        transfer_start = time.time()
+        if self.mode == "bundle":
+            threshold = self.bundle_threshold_mb * _MB
+            small = [o for o in objects if o["Size"] <= threshold]
+            large = [o for o in objects if o["Size"] > threshold]
+            vals = self._copy_bundled(source, dest, small) + self._copy_objects(
+                source, dest, large
+            )
+        else:
+            vals = self._copy_objects(source, dest, objects)
+        self.timings["transfer"] = time.time() - transfer_start
+        logger.debug(
+            f"Delta time for {self.__classname__} = {time.time() - start_automation}"
+        )
+        return tuple(vals)
+
+    def _copy_object(self, source: Any, dest: Any, key: str) -> TransferDTO:
+        from boto3.s3.transfer import TransferConfig
+
+        dto = TransferDTO(fname=key, transferer="native")
+        dto.start_time = datetime.now()
+        try:
+            response = source.get_object(
+                Bucket=self.config["source_s3_bucket"], Key=key
+            )
+            dest.upload_fileobj(
+                response["Body"],
+                self.config["dest_s3_bucket"],
+                self.dest_prefix + key,
+                Config=TransferConfig(
+                    multipart_threshold=self.part_size_mb * _MB,
+                    multipart_chunksize=self.part_size_mb * _MB,
+                    max_concurrency=self.upload_concurrency,
+                    use_threads=True,
+                ),
+            )
+            dto.end_time = datetime.now()
+            dto.nbytes = response.get("ContentLength")
+        except Exception as e:
+            logger.error(f"[{self.label}] Failed to copy {key}: {e}")
+            dto.status = TransferStatus.FAILED
+        return dto
+
+    def _copy_objects(
+        self, source: Any, dest: Any, objects: Sequence[Dict[str, Any]]
+    ) -> List[TransferDTO]:
+        if not objects:
+            return []
+        with ThreadPoolExecutor(max_workers=self.njobs) as executor:
+            return list(
+                executor.map(
+                    lambda o: self._copy_object(source, dest, o["Key"]), objects
+                )
+            )
+
+    def _fetch_many(
+        self, source: Any, objects: Iterable[Dict[str, Any]], executor
+    ) -> Iterator[Tuple[Dict[str, Any], Optional[bytes], TransferDTO]]:
+        """
+        GET the objects concurrently, keeping at most `2 * njobs`
+        objects in memory, and yield them in order.
+        """
+
+        def _fetch(obj):
+            dto = TransferDTO(fname=obj["Key"], transferer="native")
+            dto.start_time = datetime.now()
+            try:
+                response = source.get_object(
+                    Bucket=self.config["source_s3_bucket"], Key=obj["Key"]
+                )
+                data = response["Body"].read()
+                dto.nbytes = len(data)
+                return obj, data, dto
+            except Exception as e:
+                logger.error(f"[{self.label}] Failed to fetch {obj['Key']}: {e}")
+                dto.status = TransferStatus.FAILED
+                return obj, None, dto
+
+        window = deque()
+        for obj in objects:
+            window.append(executor.submit(_fetch, obj))
+            if len(window) >= 2 * self.njobs:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+    def _split_bundles(
+        self, objects: Sequence[Dict[str, Any]]
+    ) -> List[List[Dict[str, Any]]]:
+        bundles, current, size = [], [], 0
+        for obj in objects:
+            if current and size + obj["Size"] > self.bundle_size_mb * _MB:
+                bundles.append(current)
+                current, size = [], 0
+            current.append(obj)
+            size += obj["Size"] + 2 * _TAR_BLOCK
+        if current:
+            bundles.append(current)
+        return bundles
+
+    def _copy_bundled(
+        self, source: Any, dest: Any, objects: Sequence[Dict[str, Any]]
+    ) -> List[TransferDTO]:
+        if not objects:
+            return []
+        session = self._bundle_session()
+        dest_bucket = self.config["dest_s3_bucket"]
+
+        vals, uploaded = [], []
+        with ThreadPoolExecutor(max_workers=self.njobs) as fetcher, ThreadPoolExecutor(
+            max_workers=self.upload_concurrency
+        ) as uploader:
+            for i, bundle_objects in enumerate(self._split_bundles(objects)):
+                key = f"{self.dest_prefix}{self.bundle_prefix}{session}-{i:05d}.tar"
+                bundle = _BundleUpload(
+                    dest,
+                    dest_bucket,
+                    key,
+                    part_size=self.part_size_mb * _MB,
+                    executor=uploader,
+                    max_pending=self.upload_concurrency + 1,
+                )
+                failed = []
+                try:
+                    for obj, data, dto in self._fetch_many(
+                        source, bundle_objects, fetcher
+                    ):
+                        if data is None:
+                            failed.append(dto)
+                            continue
+                        bundle.add(obj["Key"], data, dto)
+                    bundled = bundle.complete()
+                except Exception as e:
+                    logger.error(f"[{self.label}] Failed to upload bundle {key}: {e}")
+                    bundle.abort()
+                    bundled = bundle.members()
+                    for dto in bundled:
+                        dto.status = TransferStatus.FAILED
+                else:
+                    dest.put_object(
+                        Bucket=dest_bucket,
+                        Key=f"{key}.index.json",
+                        Body=json.dumps(
+                            dict(
+                                bundle=key,
+                                session=session,
+                                format="tar",
+                                objects=bundle.index,
+                            )
+                        ).encode("utf-8"),
+                        ContentType="application/json",
+                    )
+                    uploaded.append((key, bundled))
+                    logger.info(
+                        f"[{self.label}] Uploaded {len(bundled)} objects in {key} ({bundle.offset} bytes)"
+                    )
+                vals.extend(bundled)
+                vals.extend(failed)
+        for key, bundled in uploaded:
+            self._check_bundle_index(dest, key, session, bundled)
+        return vals
+
+    def _bundle_session(self) -> str:
+        """
+        Unique id of a bundling session: the time (for sorting), the
+        label and host (for reading), and a random part (for uniqueness).
+        """
+        origin = re.sub(r"[^\w.-]+", "_", f"{self.label}-{socket.gethostname()}")
+        return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{origin}-{uuid.uuid4().hex}"
+
+    def _check_bundle_index(
+        self, dest: Any, key: str, session: str, bundled: List[TransferDTO]
+    ) -> bool:
+        """
+        Read back the index of an uploaded bundle and check that it lists
+        the bundled records. Otherwise, they're marked as FAILED.
+        """
+        try:
+            index = json.loads(
+                dest.get_object(
+                    Bucket=self.config["dest_s3_bucket"], Key=f"{key}.index.json"
+                )["Body"].read()
+            )
+            indexed = [o["key"] for o in index["objects"]]
+            missing = set(dto.fname for dto in bundled) - set(indexed)
+            ok = (
+                index.get("session") == session
+                and len(indexed) == len(bundled)
+                and not missing
+            )
+            error = (
+                f"session {index.get('session')} | {len(indexed)} objects indexed "
+                f"for {len(bundled)} records, {len(missing)} of them missing"
+            )
+        except Exception as e:
+            ok, error = False, str(e)
+        if not ok:
+            logger.error(f"[{self.label}] Invalid index of {key}: {error}")
+            for dto in bundled:
+                dto.status = TransferStatus.FAILED
+        return ok
@@ -1,13 +1,16 @@
+import copy
+import hashlib
+import heapq
 import os
 import random
+import re
 import string
-import tempfile
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Dict, Optional, Sequence, Tuple, Union
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
-import requests
 import urllib3
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -15,16 +18,144 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 from loguru import logger
 
 from .._base import AbstractAutomation
-from ..structures import TYPE_PATH, TransferDTO
+from ..misc.checkpoint import Checkpoint, dump_timekeeper, load_timekeeper
+from ..misc.deadlines import TransferDeadlines
+from ..misc.delta import TransferPlan
+from ..misc.parsing import LogPattern, LogRecords, LogScanner, TimestampCache
+from ..misc.replay import TrialArtifacts
+from ..structures import TYPE_PATH, TransferDTO, TransferStatus
+from .nifi_client import NifiClient
+from .node_logs import (
+    TYPE_EVENT,
+    FileLogSource,
+    NodeLogSource,
+    as_log_sources,
+    estimate_clock_offsets,
+    measure_clock_offsets,
+    parse_clock,
+)
+
+_EPOCH = datetime(1970, 1, 1)
+
+# UTC offsets (hours) of the zone abbreviations NiFi may suffix its dates with
+_ZONE_OFFSETS = {
+    "UTC": 0,
+    "GMT": 0,
+    "Z": 0,
+    "EST": -5,
+    "EDT": -4,
+    "CST": -6,
+    "CDT": -5,
+    "MST": -7,
+    "MDT": -6,
+    "PST": -8,
+    "PDT": -7,
+    "CET": 1,
+    "CEST": 2,
+    "EET": 2,
+    "EEST": 3,
+}
+
+
+def _to_utc(dt: datetime) -> datetime:
+    """
+    Aware UTC datetime. Naive datetimes are in the local time of this host
+    (like the `TransferDTO` times).
+    """
+    return dt.astimezone(timezone.utc)
+
+
+def _to_local(dt: datetime) -> datetime:
+    """
+    Naive local time of this host, like the other tools' records.
+    """
+    return dt.astimezone().replace(tzinfo=None)
+
+
+class _RecordedProvenance:
+    """
+    Stands in for the `NifiClient` when replaying the provenance events
+    recorded during a session (see `NifiAutomation.replay_automation`).
+    """
+
+    def __init__(self, queries: List[Dict[str, Any]]) -> None:
+        self.events = {
+            (q["processor_id"], q["event_type"]): q["events"] for q in queries
+        }
+
+    def map(self, func, items) -> List[Any]:
+        return list(map(func, items))
+
+    def query_provenance(
+        self, search_terms: Dict[str, str], end_date: Optional[str] = None, **kwargs
+    ) -> List[Dict[str, Any]]:
+        # all the events of a query were recorded together: no older pages
+        if end_date is not None:
+            return []
+        return self.events.get(
+            (search_terms["ProcessorID"], search_terms["EventType"]), []
+        )
 
 
 class NifiAutomation(AbstractAutomation):
+    """
+    This is the s3-s3 data transfer automation component for Apache NiFi.
+
+    All the calls to the NiFi api go through `nifi_client.NifiClient`,
+    which keeps pooled connections alive and runs independent
+    deletions/updates concurrently.
+
+    Note:
+        Extra params passed through `**params` are:
+            - njobs (number of concurrent api calls while setting up the flow)
+            - max_retries (retries for transient api errors)
+
+            - reuse_flow (if `True`, the flow is deployed once in its own
+            process group and reused across runs. See `_deploy_cached_flow`)
+            - process_group_name (name of the isolated process group used
+            with `reuse_flow`)
+            - timing_source ("log" to scrape the LogMessage processors output
+            from `nifi-app.log`, or "provenance" to use the millisecond
+            FETCH/SEND provenance events of FetchS3Object/PutS3Object)
+            - log_processors (if `False`, the LogMessage processors are
+            removed from the flow. Only valid with "provenance" timing)
+            - provenance_batch_size (max events per provenance query)
+            - listing_mode ("bucket" to list the whole source bucket,
+            "prefix" to list only the prefixes of `files`, or "files" to feed
+            the exact `files` list to FetchS3Object. See `_scope_listing`.
+            Defaults to "files" when `files` is a `misc.delta.TransferPlan`)
+            - list_shards (max number of parallel ListS3 in "prefix" mode)
+            - dest_prefix (prefix of the destination keys)
+            - node_logs (list of log paths or `node_logs.NodeLogSource` for
+            each node of a NiFi cluster. Defaults to `nifi_dir/logs/nifi-app.log`)
+            - clock_sync (if `True`, the default, the node clocks are measured
+            against this host through the system diagnostics before parsing
+            the logs. See `node_logs.measure_clock_offsets`)
+
+        The time taken to set up the flow is stored in
+        `timings["setup"]`, separately from `timings["transfer"]`.
+        `timings["listing"]` holds the time until the first object was listed.
+
+        The parsers are bounded with `run_timeout` (derived from the sizes
+        in the `filemap` by default), `file_timeout` and `straggler_factor`
+        passed to `run_automation(...)`. See `misc.deadlines.TransferDeadlines`.
+
+        With `checkpoint_dir` passed to `run_automation(...)`, the session
+        (uuid, processor ids, start time) and the log offsets are checkpointed.
+        See `resume_automation(...)`.
+    """
+
     _RESOURCES_CFG = {
         "template": "nifi-s3.xml",
         "log": "logs/nifi-app.log",
     }
     _LOG_START_PHRASE = "Starting the data transfer"
     _LOG_COMPLETE_PHRASE = "Completed the transfer"
+    _FINGERPRINT_TAG = "evalit-template-fingerprint"
+    _LOG_PROCESSORS = ("Started transfer", "Completed transfer", "Completed download")
+    _TIMING_SOURCES = ("log", "provenance")
+    _LISTING_MODES = ("bucket", "prefix", "files")
+    _SCOPING_PREFIX = "evalit "
 
     def __init__(
         self,
@@ -36,7 +167,9 @@ class NifiAutomation(AbstractAutomation):
         debug: bool = False,
         **params,
     ) -> None:
-        super().__init__(config=config, files=files, debug=debug)
+        super().__init__(
+            config=config, files=files, debug=debug, name=params.get("name")
+        )
         self.nifi_url = nifi_url
 
         assert os.path.exists(nifi_dir), f"{nifi_dir} path doesn't exist!"
@@ -46,361 +179,834 @@ class NifiAutomation(AbstractAutomation):
             assert os.path.exists(xml_conf), f"{xml_conf} path doesn't exist!"
         self.xml_conf = xml_conf
 
-    def run_automation(self, **kwargs):
-        start_automation = time.time()
-        logger.info(f"Running automation for {self.__classname__}")
-
-        random_string = lambda string_length: "".join(
-            random.choice(string.ascii_lowercase) for i in range(string_length)
+        self.njobs = params.get("njobs", 8)
+        self.max_retries = params.get("max_retries", 3)
+        self.reuse_flow = bool(params.get("reuse_flow", False))
+        self.process_group_name = params.get("process_group_name", "evalit")
+        self.timing_source = params.get("timing_source", "log")
+        if self.timing_source not in self._TIMING_SOURCES:
+            raise ValueError(
+                f"Invalid timing_source={self.timing_source}. Expected one of {self._TIMING_SOURCES}"
+            )
+        self.log_processors = bool(params.get("log_processors", True))
+        if not self.log_processors and self.timing_source == "log":
+            raise ValueError("log_processors=False requires timing_source='provenance'")
+        self.provenance_batch_size = params.get("provenance_batch_size", 1000)
+        self.node_logs = params.get("node_logs")
+        self.clock_sync = bool(params.get("clock_sync", True))
+        # a transfer plan lists the exact objects to copy
+        self.listing_mode = params.get(
+            "listing_mode", "files" if isinstance(files, TransferPlan) else "bucket"
         )
+        if self.listing_mode not in self._LISTING_MODES:
+            raise ValueError(
+                f"Invalid listing_mode={self.listing_mode}. Expected one of {self._LISTING_MODES}"
+            )
+        self.list_shards = int(params.get("list_shards", 1))
+        self.dest_prefix = params.get("dest_prefix", "")
 
-        # nifi_url = "https://localhost:8443/nifi-api"
-        nifi_url = self.nifi_url
-        template_file = self.xml_conf or (
-            Path(__file__)
-            .parent.joinpath(self._RESOURCES_CFG["template"])
-            .absolute()
-            .as_posix()
+        # per-node clock offsets (in seconds) estimated by the log parser,
+        # and how each was obtained (see `parse_log`)
+        self.clock_offsets: Dict[str, float] = {}
+        self.clock_sources: Dict[str, str] = {}
+
+    def _get_client(self) -> NifiClient:
+        return NifiClient(
+            self.nifi_url,
+            verify=False,
+            njobs=self.njobs,
+            max_retries=self.max_retries,
+            debug=self.debug,
         )
-        logger.debug(f"Using template: {template_file}")
 
-        log_file_location = os.path.join(self.nifi_dir, self._RESOURCES_CFG["log"])
-        logger.debug(f"log_file_location = {log_file_location}")
+    def _deploy_flow(self, client: NifiClient, template_file: str) -> Tuple[str, Dict]:
+        """
+        Reset the root process group and instantiate the template in it.
 
-        source_token = self.config["source_token"]
-        source_secret = self.config["source_secret"]
-        source_s3_endpoint = self.config["source_s3_endpoint"]
-        source_s3_bucket = self.config["source_s3_bucket"]
-        source_s3_region = self.config["source_s3_region"]
+        Returns:
+            tuple of (process group id, map from processor name to processor)
+        """
+        process_group_id = client.root_process_group_id()
 
-        dest_token = self.config["dest_token"]
-        dest_secret = self.config["dest_secret"]
-        dest_s3_endpoint = self.config["dest_s3_endpoint"]
-        dest_s3_bucket = self.config["dest_s3_bucket"]
-        dest_s3_region = self.config["dest_s3_region"]
+        # Stopping the process group before resetting the template
+        client.set_process_group_state(process_group_id, "STOPPED")
 
-        total_files = len(self.files)
+        # Deleting the existing flow
+        nconnections, nprocessors = client.clear_process_group(process_group_id)
+        logger.debug(f"Deleted {nconnections} connections and {nprocessors} processors")
 
-        session_uuid = random_string(10)
-        logger.info(f"Session UUID: {session_uuid}")
+        # Deletes all template files
+        client.delete_templates()
 
-        r = requests.get(
-            nifi_url + "/flow/process-groups/root?uiOnly=true", verify=False
-        )
-        process_group_id = r.json()["processGroupFlow"]["id"]
+        # Upload the template file
+        template_id = client.upload_template(process_group_id, template_file)
+        template_flow = client.instantiate_template(process_group_id, template_id)
 
-        # Stopping the process group before resetting the template
+        processor_name_map = {}
+        for processor in template_flow["processors"]:
+            processor_name_map[processor["component"]["name"]] = processor
+        return process_group_id, processor_name_map
 
-        logger.info(f"Stopping process group = {process_group_id}")
-        update_process_group_json = {
-            "id": process_group_id,
-            "state": "STOPPED",
-            "disconnectedNodeAcknowledged": "false",
-        }
-        r = requests.put(
-            nifi_url + "/flow/process-groups/" + process_group_id,
-            json=update_process_group_json,
-            verify=False,
-        )
-        logger.debug(f"Status = {r.status_code}")
+    @staticmethod
+    def template_fingerprint(template_file: TYPE_PATH) -> str:
+        """
+        Fingerprint of the template content, used to find
+        an already deployed flow.
+        """
+        with open(template_file, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()[:16]
 
-        # Deleting the existing flow
+    def _deploy_cached_flow(
+        self, client: NifiClient, template_file: str
+    ) -> Tuple[str, Dict]:
+        """
+        Find the flow deployed for the template in the isolated process group
+        (named `process_group_name`), and only deploy it if it's missing or
+        its fingerprint is stale. Nothing outside that process group is touched.
 
-        r = requests.get(
-            nifi_url + "/flow/process-groups/" + process_group_id, verify=False
-        )
+        When the flow is reused, its queues are dropped and the ListS3 state
+        is cleared, so the next run starts from scratch.
 
-        process_groups_json = r.json()
-        old_connections = process_groups_json["processGroupFlow"]["flow"]["connections"]
+        Returns:
+            tuple of (process group id, map from processor name to processor)
+        """
+        fingerprint = self.template_fingerprint(template_file)
+        if not self.log_processors:
+            fingerprint += "-nolog"
+        tag = f"{self._FINGERPRINT_TAG}={fingerprint}"
+        root_id = client.root_process_group_id()
 
-        for connection in old_connections:
-            if self.debug:
-                print("Deleting connection " + connection["id"])
-            r = requests.delete(
-                nifi_url + "/connections/" + connection["id"],
-                params={"version": str(connection["revision"]["version"])},
-                verify=False,
-            )
-            if self.debug:
-                print("Status", r.status_code)
+        process_group = None
+        for child in client.list_child_process_groups(root_id):
+            if child["component"]["name"] == self.process_group_name:
+                process_group = child
+                break
 
-        old_processors = process_groups_json["processGroupFlow"]["flow"]["processors"]
-        for processor in old_processors:
-            if self.debug:
-                print("Deleting processor ", processor["id"])
-            r = requests.delete(
-                nifi_url + "/processors/" + processor["id"],
-                params={"version": str(processor["revision"]["version"])},
-                verify=False,
+        if process_group is not None:
+            process_group_id = process_group["id"]
+            client.set_process_group_state(process_group_id, "STOPPED")
+            if tag in (process_group["component"].get("comments") or ""):
+                logger.info(
+                    f"Reusing deployed flow (fingerprint={fingerprint}) in process group = {process_group_id}"
+                )
+                flow = client.get_process_group_flow(process_group_id)
+                client.map(lambda c: client.drop_queue(c["id"]), flow["connections"])
+                processor_name_map = {
+                    p["component"]["name"]: p for p in flow["processors"]
+                }
+                processor_name_map = self._remove_scoping_processors(
+                    client, process_group_id, processor_name_map
+                )
+                if "ListS3" in processor_name_map:
+                    client.clear_processor_state(processor_name_map["ListS3"]["id"])
+                return process_group_id, processor_name_map
+
+            logger.info(
+                f"Stale flow in process group = {process_group_id}. Removing..."
             )
-            if self.debug:
-                print("Status", r.status_code)
+            client.clear_process_group(process_group_id)
+            client.delete_component("process-groups", process_group)
 
-        # Deletes all template files
+        process_group_id = client.create_process_group(
+            root_id, self.process_group_name, comments=tag
+        )["id"]
+        template_id = client.upload_template(process_group_id, template_file)
+        template_flow = client.instantiate_template(process_group_id, template_id)
+        # the flow is instantiated. We don't need to keep the template around.
+        client.request("DELETE", f"/templates/{template_id}")
 
-        r = requests.get(nifi_url + "/flow/templates", verify=False)
-        templates = r.json()["templates"]
+        processor_name_map = {}
+        for processor in template_flow["processors"]:
+            processor_name_map[processor["component"]["name"]] = processor
+        return process_group_id, processor_name_map
 
-        for template in templates:
-            if self.debug:
-                print(
-                    "Deleting template ", template["id"], template["template"]["name"]
-                )
-            requests.delete(nifi_url + "/templates/" + template["id"], verify=False)
+    def _remove_log_processors(
+        self, client: NifiClient, process_group_id: str, processor_name_map: Dict
+    ) -> Dict:
+        """
+        Take the LogMessage processors (and their connections) out of the flow.
 
-            # Upload the template file
+        Returns:
+            map from processor name to processor without the log processors
+        """
+        log_processors = tuple(
+            processor_name_map[name]
+            for name in self._LOG_PROCESSORS
+            if name in processor_name_map
+        )
+        if not log_processors:
+            return processor_name_map
+        log_ids = set(processor["id"] for processor in log_processors)
 
-        template_upload_json = {
-            "template": (
-                template_file,
-                open(template_file, "rb"),
-                "multipart/form-data",
+        connections = tuple(
+            filter(
+                lambda c: c["destinationId"] in log_ids,
+                client.get_process_group_flow(process_group_id)["connections"],
             )
-        }
-        r = requests.post(
-            nifi_url + "/process-groups/" + process_group_id + "/templates/upload",
-            files=template_upload_json,
-            verify=False,
         )
+        client.map(lambda c: client.delete_component("connections", c), connections)
+        # with their revision, not to rely on the conflict retries
+        client.map(lambda p: client.delete_component("processors", p), log_processors)
+        logger.info(f"Removed {len(log_ids)} log processors from the flow")
+        return {
+            name: processor
+            for name, processor in processor_name_map.items()
+            if processor["id"] not in log_ids
+        }
 
-        print("Template successfully uploaded")
-        id_pos = r.text.find("<id>")
-        id_end_pos = r.text.find("</id>")
-        template_id = r.text[id_pos + 4 : id_end_pos]
-        print("Template id: " + template_id)
-
-        template_load_json = {
-            "templateId": template_id,
-            "originX": 611.2981057221397,
-            "originY": 85.35885905334999,
-            "disconnectedNodeAcknowledged": "false",
+    @staticmethod
+    def _processor_config(properties: Dict[str, str], **config) -> Dict[str, Any]:
+        """
+        Build the processor config json.
+        """
+        processor_config = {
+            "schedulingPeriod": "0 sec",
+            "executionNode": "ALL",
+            "penaltyDuration": "30 sec",
+            "yieldDuration": "1 sec",
+            "bulletinLevel": "WARN",
+            "schedulingStrategy": "TIMER_DRIVEN",
+            "comments": "",
+            "autoTerminatedRelationships": [],
+            "properties": properties,
         }
-        r = requests.post(
-            nifi_url + "/process-groups/" + process_group_id + "/template-instance",
-            json=template_load_json,
-            verify=False,
-        )
+        processor_config.update(config)
+        return processor_config
 
-        template_json = r.json()
-        processor_name_map = {}
-        for processor in template_json["flow"]["processors"]:
-            processor_name_map[processor["component"]["name"]] = processor
+    @classmethod
+    def _processor_component(
+        cls,
+        processor: Dict[str, Any],
+        name: str,
+        properties: Dict[str, str],
+        **config,
+    ) -> Dict[str, Any]:
+        """
+        Build the component json used to update a processor.
+        """
+        return {
+            "id": processor["id"],
+            "name": name,
+            "config": cls._processor_config(properties, **config),
+            "state": "STOPPED",
+        }
 
-        # Updating the credentials
-
-        list_s3_processor = processor_name_map["ListS3"]
-        list_s3_update_json = {
-            "component": {
-                "id": list_s3_processor["id"],
-                "name": "ListS3",
-                "config": {
-                    "schedulingPeriod": "0 sec",
-                    "executionNode": "PRIMARY",
-                    "penaltyDuration": "30 sec",
-                    "yieldDuration": "1 sec",
-                    "bulletinLevel": "WARN",
-                    "schedulingStrategy": "TIMER_DRIVEN",
-                    "comments": "",
-                    "autoTerminatedRelationships": [],
-                    "properties": {
-                        "Bucket": source_s3_bucket,
-                        "Access Key": source_token,
-                        "Secret Key": source_secret,
-                        "Endpoint Override URL": source_s3_endpoint,
-                        "Region": source_s3_region,
-                    },
-                },
-                "state": "STOPPED",
-            },
-            "revision": {"version": list_s3_processor["revision"]["version"]},
-            "disconnectedNodeAcknowledged": "false",
+    def _s3_properties(self, side: str) -> Dict[str, str]:
+        """
+        S3 processor properties for the "source" or "dest" side of the config.
+        """
+        return {
+            "Bucket": self.config[f"{side}_s3_bucket"],
+            "Access Key": self.config[f"{side}_token"],
+            "Secret Key": self.config[f"{side}_secret"],
+            "Endpoint Override URL": self.config[f"{side}_s3_endpoint"],
+            "Region": self.config[f"{side}_s3_region"],
         }
 
-        if self.debug:
-            print("Updating ListS3 processor")
-        r = requests.put(
-            nifi_url + "/processors/" + list_s3_processor["id"],
-            json=list_s3_update_json,
-            verify=False,
+    def _processor_updates(
+        self, processor_name_map: Dict[str, Dict], session_uuid: str
+    ) -> Tuple[Tuple[Dict, Dict]]:
+        """
+        Build all the processor updates (credentials, buckets and log messages)
+        for the session.
+
+        Returns:
+            tuple of (processor, component json)
+        """
+        source_properties = self._s3_properties("source")
+        dest_properties = self._s3_properties("dest")
+        if self.dest_prefix:
+            dest_properties["Object Key"] = f"{self.dest_prefix}${{filename}}"
+        s3_config = dict(
+            concurrentlySchedulableTaskCount="10",
+            runDurationMillis=0,
+            autoTerminatedRelationships=["failure"],
         )
-        if self.debug:
-            print("Status", r.status_code)
-
-        fetch_s3_processor = processor_name_map["FetchS3Object"]
-        fetch_s3_update_json = {
-            "component": {
-                "id": fetch_s3_processor["id"],
-                "name": "FetchS3Object",
-                "config": {
-                    "concurrentlySchedulableTaskCount": "10",
-                    "schedulingPeriod": "0 sec",
-                    "executionNode": "ALL",
-                    "penaltyDuration": "30 sec",
-                    "yieldDuration": "1 sec",
-                    "bulletinLevel": "WARN",
-                    "schedulingStrategy": "TIMER_DRIVEN",
-                    "comments": "",
-                    "runDurationMillis": 0,
-                    "autoTerminatedRelationships": ["failure"],
-                    "properties": {
-                        "Bucket": source_s3_bucket,
-                        "Access Key": source_token,
-                        "Secret Key": source_secret,
-                        "Endpoint Override URL": source_s3_endpoint,
-                        "Region": source_s3_region,
-                    },
+        # without the log processors, nothing consumes PutS3Object's
+        # "success" anymore, and NiFi won't start it unless it's terminated
+        put_config = dict(
+            s3_config,
+            autoTerminatedRelationships=(
+                ["failure"] if self.log_processors else ["failure", "success"]
+            ),
+        )
+        log_config = dict(
+            concurrentlySchedulableTaskCount="1",
+            runDurationMillis=0,
+            autoTerminatedRelationships=["success"],
+        )
+
+        list_properties = dict(source_properties, prefix=self._listing_prefixes()[0])
+
+        updates = [
+            ("ListS3", list_properties, dict(executionNode="PRIMARY")),
+            ("FetchS3Object", source_properties, s3_config),
+            ("PutS3Object", dest_properties, put_config),
+            (
+                "Started transfer",
+                {
+                    "log-message": f"{self._LOG_START_PHRASE} {session_uuid} ${{filename}}"
                 },
-                "state": "STOPPED",
-            },
-            "revision": {"version": fetch_s3_processor["revision"]["version"]},
-            "disconnectedNodeAcknowledged": "false",
-        }
+                log_config,
+            ),
+            (
+                "Completed transfer",
+                {
+                    "log-message": f"{self._LOG_COMPLETE_PHRASE} {session_uuid} ${{filename}}"
+                },
+                log_config,
+            ),
+        ]
+        return tuple(
+            (
+                processor_name_map[name],
+                self._processor_component(
+                    processor_name_map[name], name, properties, **config
+                ),
+            )
+            for name, properties, config in updates
+            if name in processor_name_map
+        )
 
-        print("Updating FetchS3Object processor")
-        r = requests.put(
-            nifi_url + "/processors/" + fetch_s3_processor["id"],
-            json=fetch_s3_update_json,
-            verify=False,
+    def _listing_prefixes(self) -> Tuple[str]:
+        """
+        Prefixes to list in the "prefix" listing mode.
+
+        Files are grouped by their top-level "directory", and each group is
+        listed through the longest common prefix of its keys. If there are more
+        groups than `list_shards`, the closest adjacent groups are merged.
+        In other modes, the whole bucket is listed (empty prefix).
+        """
+        if self.listing_mode != "prefix" or not self.files:
+            return ("",)
+
+        groups = {}
+        for fname in sorted(map(str, self.files)):
+            groups.setdefault(fname.split("/", 1)[0], []).append(fname)
+        prefixes = list(map(os.path.commonprefix, groups.values()))
+
+        # merge the adjacent prefixes sharing the longest common prefix,
+        # so that the merged shards list as few extra objects as possible
+        nshards = max(1, self.list_shards)
+        while len(prefixes) > nshards:
+            shared = [
+                len(os.path.commonprefix(prefixes[i : i + 2]))
+                for i in range(len(prefixes) - 1)
+            ]
+            i = shared.index(max(shared))
+            prefixes[i : i + 2] = [os.path.commonprefix(prefixes[i : i + 2])]
+        return tuple(prefixes)
+
+    def _remove_scoping_processors(
+        self, client: NifiClient, process_group_id: str, processor_name_map: Dict
+    ) -> Dict:
+        """
+        Remove the processors added by `_scope_listing` in an earlier run
+        (of a reused flow), along with their connections.
+        """
+        scoping_ids = set(
+            processor["id"]
+            for name, processor in processor_name_map.items()
+            if name.startswith(self._SCOPING_PREFIX)
         )
-        print("Status", r.status_code)
-
-        put_s3_processor = processor_name_map["PutS3Object"]
-        put_s3_update_json = {
-            "component": {
-                "id": put_s3_processor["id"],
-                "name": "PutS3Object",
-                "config": {
-                    "concurrentlySchedulableTaskCount": "10",
-                    "schedulingPeriod": "0 sec",
-                    "executionNode": "ALL",
-                    "penaltyDuration": "30 sec",
-                    "yieldDuration": "1 sec",
-                    "bulletinLevel": "WARN",
-                    "schedulingStrategy": "TIMER_DRIVEN",
-                    "comments": "",
-                    "runDurationMillis": 0,
-                    "autoTerminatedRelationships": ["failure"],
-                    "properties": {
-                        "Bucket": dest_s3_bucket,
-                        "Access Key": dest_token,
-                        "Secret Key": dest_secret,
-                        "Endpoint Override URL": dest_s3_endpoint,
-                        "Region": dest_s3_region,
-                    },
-                },
-                "state": "STOPPED",
-            },
-            "revision": {"version": put_s3_processor["revision"]["version"]},
-            "disconnectedNodeAcknowledged": "false",
-        }
+        if not scoping_ids:
+            return processor_name_map
 
-        print("Updating PutS3Object processor")
-        r = requests.put(
-            nifi_url + "/processors/" + put_s3_processor["id"],
-            json=put_s3_update_json,
-            verify=False,
+        connections = tuple(
+            filter(
+                lambda c: c["sourceId"] in scoping_ids
+                or c["destinationId"] in scoping_ids,
+                client.get_process_group_flow(process_group_id)["connections"],
+            )
         )
-        print("Status", r.status_code)
-
-        print("Updating Start trnsfer log processor")
-        start_log_processor = processor_name_map["Started transfer"]
-        start_log_update_json = {
-            "component": {
-                "id": start_log_processor["id"],
-                "name": "Started transfer",
-                "config": {
-                    "concurrentlySchedulableTaskCount": "1",
-                    "schedulingPeriod": "0 sec",
-                    "executionNode": "ALL",
-                    "penaltyDuration": "30 sec",
-                    "yieldDuration": "1 sec",
-                    "bulletinLevel": "WARN",
-                    "schedulingStrategy": "TIMER_DRIVEN",
-                    "comments": "",
-                    "runDurationMillis": 0,
-                    "autoTerminatedRelationships": ["success"],
-                    "properties": {
-                        "log-message": f"{self._LOG_START_PHRASE} "
-                        + session_uuid
-                        + " ${filename}"
-                    },
-                },
-                "state": "STOPPED",
-            },
-            "revision": {"version": start_log_processor["revision"]["version"]},
-            "disconnectedNodeAcknowledged": "false",
-        }
-        r = requests.put(
-            nifi_url + "/processors/" + start_log_processor["id"],
-            json=start_log_update_json,
-            verify=False,
+        client.map(lambda c: client.delete_component("connections", c), connections)
+        client.map(
+            lambda i: client.delete_component("processors", {"id": i}), scoping_ids
         )
-        print("Status", r.status_code)
-
-        print("Updating Start trnsfer log processor")
-        complete_log_processor = processor_name_map["Completed transfer"]
-        complete_log_update_json = {
-            "component": {
-                "id": complete_log_processor["id"],
-                "name": "Completed transfer",
-                "config": {
-                    "concurrentlySchedulableTaskCount": "1",
-                    "schedulingPeriod": "0 sec",
-                    "executionNode": "ALL",
-                    "penaltyDuration": "30 sec",
-                    "yieldDuration": "1 sec",
-                    "bulletinLevel": "WARN",
-                    "schedulingStrategy": "TIMER_DRIVEN",
-                    "comments": "",
-                    "runDurationMillis": 0,
-                    "autoTerminatedRelationships": ["success"],
-                    "properties": {
-                        "log-message": f"{self._LOG_COMPLETE_PHRASE} "
-                        + session_uuid
-                        + " ${filename}"
-                    },
-                },
-                "state": "STOPPED",
-            },
-            "revision": {"version": complete_log_processor["revision"]["version"]},
-            "disconnectedNodeAcknowledged": "false",
+        return {
+            name: processor
+            for name, processor in processor_name_map.items()
+            if processor["id"] not in scoping_ids
         }
-        r = requests.put(
-            nifi_url + "/processors/" + complete_log_processor["id"],
-            json=complete_log_update_json,
-            verify=False,
+
+    def _scope_listing(
+        self, client: NifiClient, process_group_id: str, processor_name_map: Dict
+    ) -> None:
+        """
+        Scope the listing of the flow to the requested files.
+
+        - "bucket": ListS3 lists the whole source bucket (default)
+        - "prefix": ListS3 lists only the common prefix of the files. With
+        `list_shards` > 1, extra ListS3 processors list the other prefix shards
+        in parallel.
+        - "files": ListS3 is disabled, and the exact file list is fed to
+        FetchS3Object through GenerateFlowFile -> SplitText -> ExtractText.
+        """
+        list_s3 = processor_name_map["ListS3"]
+        targets = [processor_name_map["FetchS3Object"]["id"]]
+        if "Started transfer" in processor_name_map:
+            targets.append(processor_name_map["Started transfer"]["id"])
+
+        if self.listing_mode == "files":
+            client.set_processor_state(list_s3, "DISABLED")
+        elif list_s3["component"].get("state") == "DISABLED":
+            client.set_processor_state(list_s3, "STOPPED")
+
+        sources = []
+        if self.listing_mode == "prefix":
+            source_properties = self._s3_properties("source")
+            for i, prefix in enumerate(self._listing_prefixes()[1:]):
+                processor = client.create_processor(
+                    process_group_id,
+                    "org.apache.nifi.processors.aws.s3.ListS3",
+                    f"{self._SCOPING_PREFIX}ListS3 {i + 1}",
+                    self._processor_config(
+                        dict(source_properties, prefix=prefix),
+                        executionNode="PRIMARY",
+                    ),
+                    position=(200.0 + 400 * i, -200.0),
+                )
+                sources.append((processor["id"], ["success"]))
+            logger.info(f"Listing prefixes = {self._listing_prefixes()}")
+
+        if self.listing_mode == "files":
+            generator = client.create_processor(
+                process_group_id,
+                "org.apache.nifi.processors.standard.GenerateFlowFile",
+                f"{self._SCOPING_PREFIX}GenerateFlowFile",
+                self._processor_config(
+                    {
+                        "File Size": "0B",
+                        "Batch Size": "1",
+                        "Data Format": "Text",
+                        "Unique FlowFiles": "false",
+                        "generate-ff-custom-text": "\n".join(map(str, self.files)),
+                    },
+                    # runs once per session
+                    schedulingPeriod="1000 day",
+                    executionNode="PRIMARY",
+                ),
+                position=(200.0, -400.0),
+            )
+            splitter = client.create_processor(
+                process_group_id,
+                "org.apache.nifi.processors.standard.SplitText",
+                f"{self._SCOPING_PREFIX}SplitText",
+                self._processor_config(
+                    {
+                        "Line Split Count": "1",
+                        "Header Line Count": "0",
+                        "Remove Trailing Newlines": "true",
+                    },
+                    autoTerminatedRelationships=["failure", "original"],
+                ),
+                position=(600.0, -400.0),
+            )
+            extractor = client.create_processor(
+                process_group_id,
+                "org.apache.nifi.processors.standard.ExtractText",
+                f"{self._SCOPING_PREFIX}ExtractText",
+                # the first capture group goes to the `filename` attribute,
+                # which FetchS3Object/PutS3Object use as the object key
+                self._processor_config(
+                    {"filename": "^(.+)$"},
+                    autoTerminatedRelationships=["unmatched"],
+                ),
+                position=(1000.0, -400.0),
+            )
+            client.create_connection(
+                process_group_id, generator["id"], splitter["id"], ["success"]
+            )
+            client.create_connection(
+                process_group_id, splitter["id"], extractor["id"], ["splits"]
+            )
+            sources.append((extractor["id"], ["matched"]))
+            logger.info(f"Feeding {len(self.files)} files straight to FetchS3Object")
+
+        client.map(
+            lambda args: client.create_connection(process_group_id, *args),
+            [
+                (source_id, target_id, relationships)
+                for source_id, relationships in sources
+                for target_id in targets
+            ],
         )
-        print("Updating Complete trnsfer log processor")
-
-        # Starting the process group
-        #
-        print("Starting process group")
-        update_process_group_json = {
-            "id": process_group_id,
-            "state": "RUNNING",
-            "disconnectedNodeAcknowledged": "false",
-        }
-        r = requests.put(
-            nifi_url + "/flow/process-groups/" + process_group_id,
-            json=update_process_group_json,
-            verify=False,
+
+    def _count_completed(self, timekeeper: Dict[str, TransferDTO]) -> int:
+        """
+        Number of finished (completed, failed or timed out) transfers among
+        the requested files (or among all the transfers if no files were
+        requested).
+        """
+        wanted = set(map(str, self.files))
+        return len(
+            tuple(
+                filter(
+                    lambda d: d.finished and (not wanted or d.fname in wanted),
+                    timekeeper.values(),
+                )
+            )
+        )
+
+    def run_automation(self, **kwargs):
+        start_automation = time.time()
+        logger.info(f"Running automation for {self.__classname__}")
+
+        random_string = lambda string_length: "".join(
+            random.choice(string.ascii_lowercase) for i in range(string_length)
         )
-        print("Status", r.status_code)
 
-        vals = self.parse_log(
-            log=log_file_location,
-            nfiles=len(self.files),
-            session_uuid=session_uuid,
-            poll_wait_time=kwargs.get("nifi_log_poll_time", 5) or 5,
+        template_file = self.xml_conf or (
+            Path(__file__)
+            .parent.joinpath(self._RESOURCES_CFG["template"])
+            .absolute()
+            .as_posix()
         )
+        logger.debug(f"Using template: {template_file}")
+
+        session_uuid = random_string(10)
+        logger.info(f"Session UUID: {session_uuid}")
+
+        with self._get_client() as client:
+            deploy = self._deploy_cached_flow if self.reuse_flow else self._deploy_flow
+            process_group_id, processor_name_map = deploy(client, template_file)
+            if not self.log_processors:
+                processor_name_map = self._remove_log_processors(
+                    client, process_group_id, processor_name_map
+                )
+
+            # Updating the credentials and log messages
+            updates = self._processor_updates(processor_name_map, session_uuid)
+            responses = client.map(lambda u: client.update_processor(*u), updates)
+            for (processor, component), r in zip(updates, responses):
+                logger.debug(f"Updated {component['name']}. Status = {r.status_code}")
+
+            self._scope_listing(client, process_group_id, processor_name_map)
+
+            # Starting the process group
+            session_start = datetime.now(timezone.utc)
+            client.set_process_group_state(process_group_id, "RUNNING")
+
+            transfer_start = time.time()
+            self.timings["setup"] = transfer_start - start_automation
+            logger.info(
+                f"[{self.__classname__}] Setup took {self.timings['setup']} seconds."
+            )
+
+            session = dict(
+                session_uuid=session_uuid,
+                session_start=session_start.isoformat(),
+                transfer_start=transfer_start,
+                process_group_id=process_group_id,
+                fetch_id=processor_name_map["FetchS3Object"]["id"],
+                put_id=processor_name_map["PutS3Object"]["id"],
+                timing_source=self.timing_source,
+                nfiles=len(self.files),
+                timings=dict(self.timings),
+            )
+            checkpoint = self._open_checkpoint(**kwargs)
+            if checkpoint is not None:
+                checkpoint.update(session=session, force=True)
+
+            vals = self._measure_session(client, session, checkpoint, **kwargs)
         logger.debug(
             f"Delta time for {self.__classname__} = {time.time() - start_automation}"
         )
         return vals
 
+    def resume_automation(
+        self, checkpoint: Union[TYPE_PATH, Checkpoint], **kwargs
+    ) -> Tuple[TransferDTO]:
+        """
+        Reattach to the session stored in the checkpoint: the running flow
+        is left untouched and the parser continues from the saved log
+        offsets (or queries the provenance events since the session start).
+        """
+        checkpoint = self._load_checkpoint(checkpoint, **kwargs)
+        session = checkpoint["session"]
+        self.timings = dict(session.get("timings", {}))
+        if checkpoint.done:
+            self.timings = dict(checkpoint.get("timings", self.timings))
+            return load_timekeeper(checkpoint.get("timekeeper", []))
+
+        logger.info(
+            f"[{self.__classname__}] Resuming session {session['session_uuid']}..."
+        )
+        tails = {
+            node: (offset, list(map(tuple, events)))
+            for node, (offset, events) in checkpoint.get("tails", {}).items()
+        }
+        completed = load_timekeeper(checkpoint.get("timekeeper", []))
+        with self._get_client() as client:
+            return self._measure_session(
+                client, session, checkpoint, tails=tails, completed=completed, **kwargs
+            )
+
+    def _measure_session(
+        self,
+        client: NifiClient,
+        session: Dict[str, Any],
+        checkpoint: Optional[Checkpoint] = None,
+        tails: Optional[Dict[str, Tuple[int, List[TYPE_EVENT]]]] = None,
+        completed: Sequence[TransferDTO] = (),
+        **kwargs,
+    ) -> Tuple[TransferDTO]:
+        """
+        Parse the transfer times of a started session, and fill in the
+        transfer/listing timings.
+        """
+        session_start = datetime.fromisoformat(session["session_start"])
+        poll_wait_time = kwargs.get("nifi_log_poll_time", 5) or 5
+        deadlines = TransferDeadlines.from_kwargs(self.files, **kwargs)
+        if session["timing_source"] == "provenance":
+            vals = self.parse_provenance(
+                client,
+                fetch_id=session["fetch_id"],
+                put_id=session["put_id"],
+                nfiles=session["nfiles"],
+                since=session_start,
+                poll_wait_time=poll_wait_time,
+                deadlines=deadlines,
+            )
+        else:
+            log_file_location = os.path.join(self.nifi_dir, self._RESOURCES_CFG["log"])
+            logger.debug(f"log_file_location = {log_file_location}")
+            sources = as_log_sources(self.node_logs or log_file_location)
+            vals = self.parse_log(
+                log=sources,
+                nfiles=session["nfiles"],
+                session_uuid=session["session_uuid"],
+                poll_wait_time=poll_wait_time,
+                checkpoint=checkpoint,
+                tails=tails,
+                completed=completed,
+                deadlines=deadlines,
+                clock_offsets=self._measure_clocks(client, sources),
+            )
+            if self.recorder is not None:
+                self._record_session_logs(sources, session["session_uuid"])
+        if self.recorder is not None:
+            self.recorder.add_json("nifi/session.json", session)
+        self.timings["transfer"] = time.time() - session["transfer_start"]
+
+        start_times = tuple(filter(None, map(lambda d: d.start_time, vals)))
+        if start_times:
+            # time until the listing delivered the first object
+            self.timings["listing"] = max(
+                0.0,
+                (_to_utc(min(start_times)) - _to_utc(session_start)).total_seconds(),
+            )
+        if checkpoint is not None:
+            checkpoint.update(
+                done=True,
+                timekeeper=dump_timekeeper(vals),
+                timings=dict(self.timings),
+                force=True,
+            )
+        return vals
+
+    def _record_session_logs(
+        self,
+        log: Union[TYPE_PATH, NodeLogSource, Sequence[Union[TYPE_PATH, NodeLogSource]]],
+        session_uuid: str,
+    ) -> None:
+        """
+        Record the lines of the session from each node log.
+        """
+        nodes = []
+        for i, source in enumerate(as_log_sources(log)):
+            if isinstance(source, FileLogSource):
+                with open(source.path, "rb") as f:
+                    uuid = session_uuid.encode("utf-8")
+                    lines = b"".join(line for line in f if uuid in line)
+            else:
+                lines = "".join(
+                    line if line.endswith("\n") else line + "\n"
+                    for line in source.read_lines()
+                    if session_uuid in line
+                ).encode("utf-8")
+            name = f"nifi/node-{i}.log"
+            self.recorder.add_bytes(name, lines)
+            # the offsets used, so that the replay parses the same timeline
+            clock_offset = self.clock_offsets.get(source.node, source.clock_offset)
+            nodes.append(dict(name=name, node=source.node, clock_offset=clock_offset))
+        self.recorder.add_json("nifi/nodes.json", nodes)
+
+    def replay_automation(
+        self, artifacts: TrialArtifacts, **kwargs
+    ) -> Tuple[TransferDTO]:
+        """
+        Parse the recorded session again: the session lines of the node
+        logs, or the provenance events, depending on the timing source.
+        """
+        session = artifacts.json("nifi/session.json")
+        # everything was recorded: a single poll
+        deadlines = TransferDeadlines(run_timeout=0)
+        if session["timing_source"] == "provenance":
+            return self.parse_provenance(
+                _RecordedProvenance(artifacts.json("nifi/provenance.json")),
+                fetch_id=session["fetch_id"],
+                put_id=session["put_id"],
+                nfiles=session["nfiles"],
+                since=datetime.fromisoformat(session["session_start"]),
+                poll_wait_time=0,
+                deadlines=deadlines,
+            )
+        sources = [
+            FileLogSource(
+                artifacts.path(node["name"]),
+                node=node["node"],
+                clock_offset=node["clock_offset"],
+            )
+            for node in artifacts.json("nifi/nodes.json")
+        ]
+        return self.parse_log(
+            log=sources,
+            nfiles=session["nfiles"],
+            session_uuid=session["session_uuid"],
+            poll_wait_time=0,
+            deadlines=deadlines,
+        )
+
+    def _session_scanner(self, session_uuid: str) -> LogScanner:
+        """
+        Build the log scanner for the start/complete lines of the session.
+        """
+        timestamp = rb"(?P<ts>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(?:,\d+)?)[^\n]*?"
+        uuid = re.escape(session_uuid.encode("utf-8"))
+        decoder = TimestampCache("%Y-%m-%d %H:%M:%S", 19, frac_sep=b",")
+        return LogScanner(
+            [
+                LogPattern(
+                    kind,
+                    timestamp
+                    + re.escape(phrase.encode("utf-8"))
+                    + rb"[^\n]*?"
+                    + uuid
+                    + rb"(?P<name>[^\n]*)",
+                    decoder,
+                    session_uuid.encode("utf-8"),
+                )
+                for kind, phrase in (
+                    ("start", self._LOG_START_PHRASE),
+                    ("end", self._LOG_COMPLETE_PHRASE),
+                )
+            ]
+        )
+
+    @staticmethod
+    def _records_to_events(records: LogRecords) -> List[TYPE_EVENT]:
+        return [
+            ((t - _EPOCH).total_seconds(), fname, kind == "start")
+            for kind, fname, t in records.rows()
+        ]
+
+    def _measure_clocks(
+        self, client: NifiClient, sources: Sequence[NodeLogSource]
+    ) -> Dict[str, float]:
+        """
+        Measure the clock offsets of the nodes without a given one against
+        this host, from the times in the system diagnostics. A source is
+        matched to its node by name ("<address>:<api port>" or "<address>"),
+        or directly when there's a single node.
+        """
+        pending = [source for source in sources if source.clock_offset is None]
+        if not self.clock_sync or not pending:
+            return {}
+        try:
+            measured = measure_clock_offsets(
+                lambda: {
+                    node: parse_clock(clock)
+                    for node, clock in client.node_clocks().items()
+                }
+            )
+        except Exception as e:
+            logger.warning(f"[{self.__classname__}] Can't measure the node clocks: {e}")
+            return {}
+
+        offsets = {}
+        for source in pending:
+            if len(sources) == 1 and len(measured) == 1:
+                node = next(iter(measured))
+            else:
+                node = next(
+                    (
+                        node
+                        for node in measured
+                        if source.node in (node, node.rsplit(":", 1)[0])
+                    ),
+                    None,
+                )
+            if node is None:
+                continue
+            offset, error = measured[node]
+            logger.debug(
+                f"[{self.__classname__}] Clock offset of {source.node} = {offset} +/- {error}s"
+            )
+            offsets[source.node] = offset
+        return offsets
+
+    def _read_node_events(
+        self,
+        source: NodeLogSource,
+        scanner: LogScanner,
+        tails: Dict[str, Tuple[int, List[TYPE_EVENT]]],
+    ) -> List[TYPE_EVENT]:
+        """
+        Read all the session events from a single node log.
+
+        Local log files are scanned incrementally: `tails` keeps the byte
+        offset reached and the events found so far for each node.
+        Other sources are read entirely every time.
+        """
+        if not isinstance(source, FileLogSource):
+            return self._records_to_events(scanner.scan_lines(source.read_lines()))
+
+        offset, events = tails.get(source.node, (0, []))
+        records = scanner.scan(source.path, offset=offset)
+        events = events + self._records_to_events(records)
+        tails[source.node] = (records.offset, events)
+        return events
+
     def parse_log(
-        self, log: str, nfiles: int, session_uuid: str, poll_wait_time: int = 5
+        self,
+        log: Union[TYPE_PATH, NodeLogSource, Sequence[Union[TYPE_PATH, NodeLogSource]]],
+        nfiles: int,
+        session_uuid: str,
+        poll_wait_time: int = 5,
+        checkpoint: Optional[Checkpoint] = None,
+        tails: Optional[Dict[str, Tuple[int, List[TYPE_EVENT]]]] = None,
+        completed: Sequence[TransferDTO] = (),
+        deadlines: Optional[TransferDeadlines] = None,
+        clock_offsets: Optional[Dict[str, float]] = None,
     ) -> Tuple[TransferDTO]:
+        """
+        Parse the node logs and return start/end times for each file transfer.
+
+        `log` can be a single log or a list of node logs (paths or
+        `node_logs.NodeLogSource` readers) for a NiFi cluster. All the nodes
+        are read concurrently and their events are merged into a single
+        timeline. The clock offsets of the nodes are taken from the sources,
+        else from the measured `clock_offsets` (see `_measure_clocks`), and
+        refined from the events (see `node_logs.estimate_clock_offsets`).
+        How each offset was obtained is kept in `clock_sources`: the nodes
+        left "uncorrected" are reported.
+
+        The offsets reached in the local log files (`tails`) are saved to
+        the `checkpoint`, so that parsing can continue from there. Only the
+        start events of the transfers still open are kept in the checkpoint:
+        the `completed` records are saved apart and passed back on resume.
+
+        The NiFi flow auto-terminates the failures, so they never show up
+        in the log. Polling stops when the `deadlines` are reached, with the
+        unfinished transfers marked as TIMED_OUT.
+        """
+        sources = as_log_sources(log)
+        fixed_offsets = {source.node: source.clock_offset for source in sources}
+        scanner = self._session_scanner(session_uuid)
+        tails = dict(tails or {})
+        deadlines = deadlines or TransferDeadlines()
+
         timekeeper = {}
         end_counter = 0
 
@@ -410,32 +1016,324 @@ class NifiAutomation(AbstractAutomation):
                 f"[{self.__classname__}] log parser polling... {end_counter}/{nfiles} files transferred!"
             )
             time.sleep(poll_wait_time)
-            # read file line by line
-            with open(log, "r") as f:
-                # reset counter
-                end_counter = 0
-                for line in f:
-                    if line.find(session_uuid) != -1:
-                        utc_time = datetime.strptime(
-                            line.split(",")[0], "%Y-%m-%d %H:%M:%S"
-                        )
-                        fname = line.split(session_uuid)[1].strip()
-                        is_start = (
-                            line.split(session_uuid)[0].find(self._LOG_START_PHRASE)
-                            > -1
-                        )
-                        is_complete = (
-                            line.split(session_uuid)[0].find(self._LOG_COMPLETE_PHRASE)
-                            > -1
-                        )
-
-                        dto = timekeeper.get(
-                            fname, TransferDTO(fname=fname, transferer="nifi")
-                        )
-                        if is_start:
-                            dto.start_time = utc_time
-                        if is_complete:
-                            dto.end_time = utc_time
-                            end_counter += 1
-                        timekeeper[fname] = dto
+            parse_start = time.time()
+
+            with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+                node_events = executor.map(
+                    lambda source: self._read_node_events(source, scanner, tails),
+                    sources,
+                )
+                node_events = dict(zip(map(lambda s: s.node, sources), node_events))
+
+            self.clock_offsets = estimate_clock_offsets(
+                node_events, fixed_offsets, initial=clock_offsets
+            )
+            timeline = heapq.merge(
+                *(
+                    sorted(
+                        (t + self.clock_offsets[node], fname, is_start)
+                        for t, fname, is_start in events
+                    )
+                    for node, events in node_events.items()
+                )
+            )
+
+            timekeeper = {dto.fname: copy.copy(dto) for dto in completed}
+            for t, fname, is_start in timeline:
+                dto = timekeeper.get(fname, TransferDTO(fname=fname, transferer="nifi"))
+                if is_start and dto.start_time is None:
+                    dto.start_time = _EPOCH + timedelta(seconds=t)
+                if not is_start:
+                    dto.end_time = _EPOCH + timedelta(seconds=t)
+                timekeeper[fname] = dto
+
+            deadlines.apply(
+                timekeeper, expected=map(str, self.files), transferer="nifi"
+            )
+            end_counter = self._count_completed(timekeeper)
+            self._observe_progress(
+                tuple(timekeeper.values()), lag=time.time() - parse_start
+            )
+            if checkpoint is not None:
+                self._checkpoint_tails(checkpoint, tails, timekeeper)
+            if deadlines.expired:
+                break
+        self.clock_sources = self._clock_sources(
+            sources[0].node, fixed_offsets, clock_offsets or {}
+        )
+        if len(sources) > 1:
+            logger.info(f"[{self.__classname__}] Clock offsets = {self.clock_offsets}")
+            uncorrected = [
+                node for node, how in self.clock_sources.items() if how == "uncorrected"
+            ]
+            if uncorrected:
+                logger.warning(
+                    f"[{self.__classname__}] No clock offset for the nodes {uncorrected}: "
+                    "their times are taken as is. Pass `NodeLogSource.clock_offset`."
+                )
+        return tuple(timekeeper.values())
+
+    def _clock_sources(
+        self,
+        reference: str,
+        fixed: Dict[str, Optional[float]],
+        measured: Dict[str, float],
+    ) -> Dict[str, str]:
+        """
+        How each clock offset was obtained: "given" (by the source),
+        "measured" (against this host), "refined" (measured, then shifted
+        by the events), "events" (estimated from the events only),
+        "reference" (the node the others are relative to, when nothing was
+        measured) or "uncorrected".
+        """
+        clock_sources = {}
+        for node, offset in self.clock_offsets.items():
+            if fixed.get(node) is not None:
+                how = "given"
+            elif node in measured:
+                how = "measured" if offset == measured[node] else "refined"
+            elif offset:
+                how = "events"
+            elif node == reference and not measured:
+                how = "reference"
+            else:
+                how = "uncorrected"
+            clock_sources[node] = how
+        return clock_sources
+
+    @staticmethod
+    def _checkpoint_tails(
+        checkpoint: Checkpoint,
+        tails: Dict[str, Tuple[int, List[TYPE_EVENT]]],
+        timekeeper: Dict[str, TransferDTO],
+    ) -> None:
+        """
+        Save the log offsets with the start events of the transfers still
+        open, and the completed records, instead of every event seen.
+        """
+        completed = [dto for dto in timekeeper.values() if dto.end_time is not None]
+        done = set(map(lambda d: d.fname, completed))
+        checkpoint.update(
+            tails={
+                node: (
+                    offset,
+                    [e for e in events if e[2] and e[1] not in done],
+                )
+                for node, (offset, events) in tails.items()
+            },
+            timekeeper=dump_timekeeper(completed),
+        )
+
+    _PROVENANCE_DATE_FORMAT = "%m/%d/%Y %H:%M:%S"
+
+    # events can be indexed after newer ones: each poll looks back this
+    # much before the latest event seen (duplicates are dropped by id)
+    _PROVENANCE_OVERLAP = timedelta(seconds=30)
+    # the largest batch queried when a single second holds more events
+    # than `provenance_batch_size` (see `_fetch_provenance_events`)
+    _PROVENANCE_MAX_BATCH = 100000
+
+    @classmethod
+    def _parse_event_time(cls, event_time: str) -> datetime:
+        """
+        Parse provenance event time like "03/09/2022 03:05:32.123 UTC",
+        into an aware UTC datetime. The NiFi time zone can differ from
+        the one of this host.
+        """
+        value, _, zone = event_time.rpartition(" ")
+        if not value:
+            value, zone = zone, "UTC"
+        parsed = datetime.strptime(value, cls._PROVENANCE_DATE_FORMAT + ".%f")
+        if zone in _ZONE_OFFSETS:
+            offset = timezone(timedelta(hours=_ZONE_OFFSETS[zone]))
+        elif re.fullmatch(r"[+-]\d{2}:?\d{2}", zone):
+            sign = -1 if zone[0] == "-" else 1
+            hours, minutes = int(zone[1:3]), int(zone[-2:])
+            offset = timezone(sign * timedelta(hours=hours, minutes=minutes))
+        else:
+            if zone not in time.tzname:
+                logger.warning(
+                    f"Unknown time zone {zone} in the provenance events. Assuming the local time of this host."
+                )
+            return _to_utc(parsed)
+        return parsed.replace(tzinfo=offset).astimezone(timezone.utc)
+
+    @classmethod
+    def _format_date(cls, dt: datetime) -> str:
+        """
+        Provenance query date, in UTC whatever the zones of NiFi and this host.
+        """
+        return _to_utc(dt).strftime(cls._PROVENANCE_DATE_FORMAT) + " UTC"
+
+    @staticmethod
+    def _event_attribute(event: Dict[str, Any], name: str) -> Optional[str]:
+        for attribute in event.get("attributes", []):
+            if attribute.get("name") == name:
+                return attribute.get("value")
+        return None
+
+    def _fetch_provenance_events(
+        self,
+        client: NifiClient,
+        processor_id: str,
+        event_type: str,
+        since: datetime,
+    ) -> List[Dict[str, Any]]:
+        """
+        Fetch all the events of a processor since the given time.
+        Queries are made in batches of `provenance_batch_size`; when a batch
+        is full, the window is narrowed down to page through older events.
+
+        The query dates have second resolution: when a full batch brings
+        nothing new, the oldest second holds more events than the batch,
+        so the batch is doubled (up to `_PROVENANCE_MAX_BATCH`) instead.
+        """
+        start_date = self._format_date(since)
+        events, end_date = {}, None
+        batch_size = self.provenance_batch_size
+        while True:
+            batch = client.query_provenance(
+                {"ProcessorID": processor_id, "EventType": event_type},
+                start_date=start_date,
+                end_date=end_date,
+                max_results=batch_size,
+            )
+            new = tuple(filter(lambda e: e["eventId"] not in events, batch))
+            events.update({e["eventId"]: e for e in batch})
+            if len(batch) < batch_size:
+                break
+            if not new:
+                if batch_size >= self._PROVENANCE_MAX_BATCH:
+                    logger.warning(
+                        f"[{self.__classname__}] More than {batch_size} {event_type} events "
+                        f"in the second before {end_date}. Some of them are missed!"
+                    )
+                    break
+                batch_size = min(2 * batch_size, self._PROVENANCE_MAX_BATCH)
+                continue
+            oldest = min(map(lambda e: self._parse_event_time(e["eventTime"]), batch))
+            end_date = self._format_date(oldest)
+        return list(events.values())
+
+    def parse_provenance(
+        self,
+        client: NifiClient,
+        fetch_id: str,
+        put_id: str,
+        nfiles: int,
+        since: datetime,
+        poll_wait_time: int = 5,
+        deadlines: Optional[TransferDeadlines] = None,
+    ) -> Tuple[TransferDTO]:
+        """
+        Build the transfer times from the provenance events of the session.
+
+        The start time is when FetchS3Object started fetching the object
+        (FETCH event time minus its duration) and the end time is the
+        PutS3Object SEND event time, both with millisecond precision.
+        Objects are matched through their `filename` attribute.
+
+        Objects dropped through the (auto-terminated) `failure` relationship
+        of either processor are marked as FAILED.
+
+        Event times are converted from the time zone of NiFi to the local
+        time of this host. Each poll only queries the events since the
+        latest one seen (minus `_PROVENANCE_OVERLAP`).
+        """
+        # provenance dates have second resolution
+        since = _to_utc(since).replace(microsecond=0)
+        deadlines = deadlines or TransferDeadlines()
+
+        queries = [
+            (fetch_id, "FETCH"),
+            (put_id, "SEND"),
+            (fetch_id, "DROP"),
+            (put_id, "DROP"),
+        ]
+        # all the events seen (by id), and where the next poll starts from,
+        # so that each poll only fetches the latest events
+        seen = [{} for _ in queries]
+        cursors = [since for _ in queries]
+
+        timekeeper = {}
+        end_counter = 0
+        while end_counter < nfiles:
+            logger.debug(
+                f"[{self.__classname__}] provenance polling... {end_counter}/{nfiles} files transferred!"
+            )
+            time.sleep(poll_wait_time)
+            parse_start = time.time()
+            batches = client.map(
+                lambda i: self._fetch_provenance_events(
+                    client, *queries[i], cursors[i]
+                ),
+                range(len(queries)),
+            )
+            new_batches = []
+            for i, batch in enumerate(batches):
+                new_batches.append([e for e in batch if e["eventId"] not in seen[i]])
+                seen[i].update({e["eventId"]: e for e in batch})
+                if batch:
+                    latest = max(
+                        map(lambda e: self._parse_event_time(e["eventTime"]), batch)
+                    )
+                    cursors[i] = max(
+                        cursors[i],
+                        latest.replace(microsecond=0) - self._PROVENANCE_OVERLAP,
+                    )
+            fetch_events, send_events, *drop_events = new_batches
+
+            for event in fetch_events:
+                fname = self._event_attribute(event, "filename")
+                if fname is None:
+                    continue
+                dto = timekeeper.get(fname, TransferDTO(fname=fname, transferer="nifi"))
+                start_time = self._parse_event_time(event["eventTime"])
+                duration = event.get("eventDuration", -1) or -1
+                if duration > 0:
+                    start_time -= timedelta(milliseconds=duration)
+                dto.start_time = _to_local(start_time)
+                timekeeper[fname] = dto
+
+            for event in send_events:
+                fname = self._event_attribute(event, "filename")
+                if fname is None:
+                    continue
+                dto = timekeeper.get(fname, TransferDTO(fname=fname, transferer="nifi"))
+                dto.end_time = _to_local(self._parse_event_time(event["eventTime"]))
+                dto.nbytes = event.get("fileSizeBytes")
+                dto.status = None
+                timekeeper[fname] = dto
+
+            for event in (e for events in drop_events for e in events):
+                fname = self._event_attribute(event, "filename")
+                if fname is None or "failure" not in (event.get("details") or ""):
+                    continue
+                dto = timekeeper.get(fname, TransferDTO(fname=fname, transferer="nifi"))
+                if dto.end_time is None:
+                    dto.status = TransferStatus.FAILED
+                timekeeper[fname] = dto
+
+            deadlines.apply(
+                timekeeper, expected=map(str, self.files), transferer="nifi"
+            )
+            end_counter = self._count_completed(timekeeper)
+
+            self._observe_progress(
+                tuple(timekeeper.values()), lag=time.time() - parse_start
+            )
+            if deadlines.expired:
+                break
+        if self.recorder is not None:
+            self.recorder.add_json(
+                "nifi/provenance.json",
+                [
+                    dict(
+                        processor_id=processor_id, event_type=event_type, events=events
+                    )
+                    for (processor_id, event_type), events in zip(
+                        queries, map(lambda events: list(events.values()), seen)
+                    )
+                ],
+            )
         return tuple(timekeeper.values())
@@ -0,0 +1,482 @@
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import requests
+from loguru import logger
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class NifiClient:
+    """
+    A thin client over the NiFi REST API.
+
+    All the calls go through a single `requests.Session` with a pooled
+    keep-alive adapter, so we pay the TLS handshake only once per
+    connection instead of once per call. Transient errors (5xx) are
+    retried with backoff, and revision conflicts (409) are resolved by
+    refreshing the component revision before trying again.
+
+    Args:
+        `nifi_url`: `str`
+            Base url of the api, eg: `https://localhost:8443/nifi-api`
+
+        `njobs`: `int`
+            Number of threads used for independent concurrent calls.
+            This is also used as the connection pool size.
+
+        `max_retries`: `int`
+            Number of retries for transient http errors.
+
+        `max_conflict_retries`: `int`
+            Number of retries on revision conflicts.
+    """
+
+    _RETRY_STATUS = (500, 502, 503, 504)
+
+    def __init__(
+        self,
+        nifi_url: str,
+        verify: bool = False,
+        njobs: int = 8,
+        max_retries: int = 3,
+        max_conflict_retries: int = 5,
+        backoff_factor: float = 0.5,
+        timeout: float = 60,
+        debug: bool = False,
+    ) -> None:
+        self.nifi_url = nifi_url.rstrip("/")
+        self.verify = verify
+        self.njobs = max(1, int(njobs))
+        self.max_conflict_retries = max(0, int(max_conflict_retries))
+        self.timeout = timeout
+        self.debug = bool(debug)
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=self._RETRY_STATUS,
+            allowed_methods=frozenset(["GET", "PUT", "DELETE"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.njobs,
+            pool_maxsize=self.njobs,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.verify = verify
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Make a request to the api. `path` is relative to the `nifi_url`.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        r = self.session.request(method, self.nifi_url + path, **kwargs)
+        if self.debug:
+            logger.debug(f"{method} {path} => {r.status_code}")
+        return r
+
+    def get(self, path: str, **kwargs) -> Any:
+        r = self.request("GET", path, **kwargs)
+        r.raise_for_status()
+        return r.json()
+
+    def map(self, func: Callable, items: Iterable) -> List[Any]:
+        """
+        Run `func` over all the items concurrently.
+        Used for independent calls like deletions and updates.
+        """
+        items = list(items)
+        if len(items) <= 1 or self.njobs == 1:
+            return list(map(func, items))
+        with ThreadPoolExecutor(max_workers=min(self.njobs, len(items))) as executor:
+            return list(executor.map(func, items))
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self) -> NifiClient:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _with_revision(
+        self,
+        resource: str,
+        entity: Dict[str, Any],
+        action: Callable[[Dict[str, Any]], requests.Response],
+    ) -> requests.Response:
+        """
+        Perform a revisioned action on a component.
+        On revision conflict, the latest revision is fetched and
+        the action is retried.
+        """
+        revision = entity.get("revision", {})
+        for _ in range(self.max_conflict_retries + 1):
+            r = action(revision)
+            if r.status_code != 409:
+                break
+            logger.warning(
+                f"Revision conflict for {resource}/{entity['id']}. Refreshing revision..."
+            )
+            time.sleep(0.1)
+            latest = self.request("GET", f"/{resource}/{entity['id']}")
+            if latest.status_code == 404:
+                break
+            revision = latest.json().get("revision", revision)
+        return r
+
+    # process groups
+
+    def root_process_group_id(self) -> str:
+        return self.get("/flow/process-groups/root?uiOnly=true")["processGroupFlow"][
+            "id"
+        ]
+
+    def get_process_group_flow(self, process_group_id: str) -> Dict[str, Any]:
+        return self.get(f"/flow/process-groups/{process_group_id}")["processGroupFlow"][
+            "flow"
+        ]
+
+    def set_process_group_state(
+        self, process_group_id: str, state: str
+    ) -> requests.Response:
+        logger.info(f"Setting process group = {process_group_id} to {state}")
+        r = self.request(
+            "PUT",
+            f"/flow/process-groups/{process_group_id}",
+            json={
+                "id": process_group_id,
+                "state": state,
+                "disconnectedNodeAcknowledged": "false",
+            },
+        )
+        logger.debug(f"Status = {r.status_code}")
+        return r
+
+    def list_child_process_groups(self, process_group_id: str) -> List[Dict[str, Any]]:
+        return self.get_process_group_flow(process_group_id).get("processGroups", [])
+
+    def create_process_group(
+        self,
+        parent_id: str,
+        name: str,
+        comments: str = "",
+        position: Tuple[float, float] = (0.0, 0.0),
+    ) -> Dict[str, Any]:
+        """
+        Create a child process group under `parent_id`.
+        """
+        r = self.request(
+            "POST",
+            f"/process-groups/{parent_id}/process-groups",
+            json={
+                "revision": {"version": 0},
+                "component": {
+                    "name": name,
+                    "comments": comments,
+                    "position": {"x": position[0], "y": position[1]},
+                },
+                "disconnectedNodeAcknowledged": "false",
+            },
+        )
+        r.raise_for_status()
+        logger.info(f"Created process group {name} => {r.json()['id']}")
+        return r.json()
+
+    # components
+
+    def delete_component(
+        self, resource: str, entity: Dict[str, Any]
+    ) -> requests.Response:
+        """
+        Delete a revisioned component.
+        `resource` is one of "connections", "processors", "process-groups".
+        """
+        if self.debug:
+            logger.debug(f"Deleting {resource} {entity['id']}")
+        return self._with_revision(
+            resource,
+            entity,
+            lambda revision: self.request(
+                "DELETE",
+                f"/{resource}/{entity['id']}",
+                params={
+                    "version": str(revision.get("version", 0)),
+                    "disconnectedNodeAcknowledged": "false",
+                },
+            ),
+        )
+
+    def update_processor(
+        self, processor: Dict[str, Any], component: Dict[str, Any]
+    ) -> requests.Response:
+        """
+        Update a processor with the given component json.
+        """
+        if self.debug:
+            logger.debug(f"Updating processor {component.get('name')}")
+        return self._with_revision(
+            "processors",
+            processor,
+            lambda revision: self.request(
+                "PUT",
+                f"/processors/{processor['id']}",
+                json={
+                    "component": component,
+                    "revision": {"version": revision.get("version", 0)},
+                    "disconnectedNodeAcknowledged": "false",
+                },
+            ),
+        )
+
+    def create_processor(
+        self,
+        process_group_id: str,
+        processor_type: str,
+        name: str,
+        config: Dict[str, Any],
+        position: Tuple[float, float] = (0.0, 0.0),
+    ) -> Dict[str, Any]:
+        """
+        Create a processor of the given (fully qualified) type.
+        """
+        r = self.request(
+            "POST",
+            f"/process-groups/{process_group_id}/processors",
+            json={
+                "revision": {"version": 0},
+                "component": {
+                    "type": processor_type,
+                    "name": name,
+                    "config": config,
+                    "position": {"x": position[0], "y": position[1]},
+                },
+                "disconnectedNodeAcknowledged": "false",
+            },
+        )
+        r.raise_for_status()
+        return r.json()
+
+    def create_connection(
+        self,
+        process_group_id: str,
+        source_id: str,
+        destination_id: str,
+        relationships: List[str],
+    ) -> Dict[str, Any]:
+        """
+        Connect two processors of the process group.
+        """
+        r = self.request(
+            "POST",
+            f"/process-groups/{process_group_id}/connections",
+            json={
+                "revision": {"version": 0},
+                "component": {
+                    "source": {
+                        "id": source_id,
+                        "groupId": process_group_id,
+                        "type": "PROCESSOR",
+                    },
+                    "destination": {
+                        "id": destination_id,
+                        "groupId": process_group_id,
+                        "type": "PROCESSOR",
+                    },
+                    "selectedRelationships": relationships,
+                },
+                "disconnectedNodeAcknowledged": "false",
+            },
+        )
+        r.raise_for_status()
+        return r.json()
+
+    def set_processor_state(
+        self, processor: Dict[str, Any], state: str
+    ) -> requests.Response:
+        """
+        Set the run status of a processor: RUNNING, STOPPED or DISABLED.
+        """
+        return self._with_revision(
+            "processors",
+            processor,
+            lambda revision: self.request(
+                "PUT",
+                f"/processors/{processor['id']}/run-status",
+                json={
+                    "revision": {"version": revision.get("version", 0)},
+                    "state": state,
+                    "disconnectedNodeAcknowledged": "false",
+                },
+            ),
+        )
+
+    def clear_processor_state(self, processor_id: str) -> requests.Response:
+        """
+        Clear the state of a (stopped) processor.
+        Eg: ListS3 keeps track of already listed keys in its state.
+        """
+        return self.request("POST", f"/processors/{processor_id}/state/clear-requests")
+
+    def drop_queue(self, connection_id: str) -> requests.Response:
+        """
+        Drop all the flowfiles queued in a connection.
+        """
+        return self.request("POST", f"/flowfile-queues/{connection_id}/drop-requests")
+
+    def clear_process_group(self, process_group_id: str) -> Tuple[int, int]:
+        """
+        Delete all the connections and processors in the process group.
+        Connections are deleted concurrently first, as processors with
+        connections can't be deleted.
+
+        Returns:
+            tuple of (number of connections, number of processors) deleted
+        """
+        flow = self.get_process_group_flow(process_group_id)
+        connections = flow["connections"]
+        processors = flow["processors"]
+        self.map(lambda c: self.delete_component("connections", c), connections)
+        self.map(lambda p: self.delete_component("processors", p), processors)
+        return len(connections), len(processors)
+
+    # templates
+
+    def list_templates(self) -> List[Dict[str, Any]]:
+        return self.get("/flow/templates")["templates"]
+
+    def delete_templates(self, templates: Optional[List[Dict[str, Any]]] = None):
+        templates = self.list_templates() if templates is None else templates
+        if self.debug:
+            for template in templates:
+                logger.debug(
+                    f"Deleting template {template['id']} {template['template']['name']}"
+                )
+        return self.map(
+            lambda t: self.request("DELETE", f"/templates/{t['id']}"), templates
+        )
+
+    def upload_template(self, process_group_id: str, template_file: str) -> str:
+        """
+        Upload the template xml to the process group.
+
+        Returns:
+            id of the uploaded template
+        """
+        with open(template_file, "rb") as f:
+            r = self.request(
+                "POST",
+                f"/process-groups/{process_group_id}/templates/upload",
+                files={"template": (template_file, f, "multipart/form-data")},
+            )
+        r.raise_for_status()
+        id_pos = r.text.find("<id>")
+        id_end_pos = r.text.find("</id>")
+        template_id = r.text[id_pos + 4 : id_end_pos]
+        logger.info(f"Template uploaded. Template id = {template_id}")
+        return template_id
+
+    def instantiate_template(
+        self,
+        process_group_id: str,
+        template_id: str,
+        origin: Tuple[float, float] = (611.2981057221397, 85.35885905334999),
+    ) -> Dict[str, Any]:
+        """
+        Instantiate the template in the process group.
+
+        Returns:
+            the flow json of the instantiated template
+        """
+        r = self.request(
+            "POST",
+            f"/process-groups/{process_group_id}/template-instance",
+            json={
+                "templateId": template_id,
+                "originX": origin[0],
+                "originY": origin[1],
+                "disconnectedNodeAcknowledged": "false",
+            },
+        )
+        r.raise_for_status()
+        return r.json()["flow"]
+
+    # cluster
+
+    def node_clocks(self) -> Dict[str, str]:
+        """
+        The current time of each node ("HH:mm:ss z", in its own time zone),
+        from the nodewise system diagnostics. Keyed by "<address>:<api port>",
+        or by "" for a standalone instance.
+        """
+        diagnostics = self.get("/system-diagnostics", params={"nodewise": "true"})[
+            "systemDiagnostics"
+        ]
+        nodes = diagnostics.get("nodeSnapshots") or []
+        if not nodes:
+            return {"": diagnostics["aggregateSnapshot"]["statsLastRefreshed"]}
+        return {
+            f"{node['address']}:{node['apiPort']}": node["snapshot"][
+                "statsLastRefreshed"
+            ]
+            for node in nodes
+        }
+
+    # provenance
+
+    def query_provenance(
+        self,
+        search_terms: Dict[str, str],
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        max_results: int = 1000,
+        poll_interval: float = 0.2,
+    ) -> List[Dict[str, Any]]:
+        """
+        Run a provenance query and wait for its results.
+        Events are fetched un-summarized, so that their attributes are included.
+
+        Args:
+            `search_terms`: `Dict[str, str]`
+                Eg: {"ProcessorID": "<id>", "EventType": "SEND"}
+
+            `start_date`, `end_date`: `str`
+                Dates in NiFi format "MM/dd/yyyy HH:mm:ss z"
+
+        Returns:
+            list of provenance event json
+        """
+        request = {
+            "maxResults": max_results,
+            "summarize": False,
+            "incrementalResults": False,
+            "searchTerms": {
+                key: {"value": value, "inverse": False}
+                for key, value in search_terms.items()
+            },
+        }
+        if start_date:
+            request["startDate"] = start_date
+        if end_date:
+            request["endDate"] = end_date
+
+        r = self.request(
+            "POST", "/provenance", json={"provenance": {"request": request}}
+        )
+        r.raise_for_status()
+        provenance = r.json()["provenance"]
+        try:
+            while not provenance.get("finished", False):
+                time.sleep(poll_interval)
+                provenance = self.get(f"/provenance/{provenance['id']}")["provenance"]
+        finally:
+            self.request("DELETE", f"/provenance/{provenance['id']}")
+        return provenance.get("results", {}).get("provenanceEvents", [])
@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import re
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from loguru import logger
+
+from ..structures import TYPE_PATH
+
+# (time in seconds, file name, is start event)
+TYPE_EVENT = Tuple[float, str, bool]
+
+
+class NodeLogSource:
+    """
+    Represents the `nifi-app.log` of a single NiFi node.
+
+    Subclass this and implement `read_lines(...)` for logs that are not
+    on the local filesystem (eg: fetched over ssh or from a log shipper).
+
+    Args:
+        `node`: `str`
+            Name of the node, used in the merged timeline.
+
+        `clock_offset`: `float`
+            Known offset (in seconds) to add to this node's timestamps.
+            If `None`, it's measured against this host when the `node` is
+            named after its NiFi address ("<address>:<api port>" or
+            "<address>", see `measure_clock_offsets(...)`), and refined from
+            the events (see `estimate_clock_offsets(...)`).
+    """
+
+    def __init__(self, node: str, clock_offset: Optional[float] = None) -> None:
+        self.node = str(node)
+        self.clock_offset = clock_offset
+
+    def read_lines(self) -> Iterable[str]:
+        raise NotImplementedError()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(node={self.node}, clock_offset={self.clock_offset})"
+
+
+class FileLogSource(NodeLogSource):
+    """
+    Log of a node readable as a local (or mounted) file.
+    """
+
+    def __init__(
+        self,
+        path: TYPE_PATH,
+        node: Optional[str] = None,
+        clock_offset: Optional[float] = None,
+    ) -> None:
+        super().__init__(node=node or str(path), clock_offset=clock_offset)
+        self.path = path
+
+    def read_lines(self) -> Iterable[str]:
+        if not Path(self.path).exists():
+            logger.warning(f"[{self.node}] log {self.path} doesn't exist yet!")
+            return
+        with open(self.path, "r") as f:
+            yield from f
+
+
+class CallableLogSource(NodeLogSource):
+    """
+    Log of a node read through any callable returning the log lines.
+    """
+
+    def __init__(
+        self,
+        reader: Callable[[], Iterable[str]],
+        node: str,
+        clock_offset: Optional[float] = None,
+    ) -> None:
+        super().__init__(node=node, clock_offset=clock_offset)
+        self.reader = reader
+
+    def read_lines(self) -> Iterable[str]:
+        return self.reader()
+
+
+def as_log_sources(
+    logs: Union[TYPE_PATH, NodeLogSource, Sequence[Union[TYPE_PATH, NodeLogSource]]]
+) -> Tuple[NodeLogSource]:
+    """
+    Normalize paths/readers into a tuple of `NodeLogSource`.
+    """
+    if isinstance(logs, (str, Path, NodeLogSource)) or callable(logs):
+        logs = [logs]
+
+    sources = []
+    for i, log in enumerate(logs):
+        if isinstance(log, NodeLogSource):
+            sources.append(log)
+        elif isinstance(log, (str, Path)):
+            sources.append(FileLogSource(log))
+        elif callable(log):
+            sources.append(CallableLogSource(log, node=f"node-{i}"))
+        else:
+            raise TypeError(
+                f"Invalid type for log source={log}. Expected path, NodeLogSource or callable. Got {type(log)}"
+            )
+    return tuple(sources)
+
+
+def parse_clock(text: str, now: Optional[datetime] = None) -> datetime:
+    """
+    Parse a NiFi time of day ("HH:mm:ss z") into the naive datetime closest
+    to `now`. The zone is dropped, as the node writes its log in that zone.
+    """
+    match = re.match(r"\s*(\d{1,2}):(\d{2}):(\d{2})", text)
+    if match is None:
+        raise ValueError(f"Invalid NiFi time {text}")
+    now = now or datetime.now()
+    hour, minute, second = map(int, match.groups())
+    today = now.replace(hour=hour, minute=minute, second=second, microsecond=0)
+    return min(
+        (today + timedelta(days=days) for days in (-1, 0, 1)),
+        key=lambda t: abs((t - now).total_seconds()),
+    )
+
+
+def measure_clock_offsets(
+    read_clocks: Callable[[], Dict[str, datetime]],
+    samples: int = 8,
+    interval: float = 0.13,
+    resolution: float = 1.0,
+) -> Dict[str, Tuple[float, float]]:
+    """
+    Measure the clock offset of remote nodes against this host.
+
+    Each sample reads the node clocks (eg: the NiFi system diagnostics),
+    which were read by the node between the request and the reply. So the
+    node clock minus this host's is within
+    `[node - reply time, node + resolution - request time]`. The samples are
+    spaced by `interval`, so that their phases within the `resolution`
+    (a second for NiFi) differ, and their bounds are intersected.
+
+    Args:
+        `read_clocks`: `Callable[[], Dict[str, datetime]]`
+            Returns the current (naive) time of each node, as in its log.
+
+    Returns:
+        Mapping from node name to (offset to add to its times, error bound),
+        in seconds.
+    """
+    bounds: Dict[str, List[Tuple[float, float]]] = {}
+    for i in range(samples):
+        if i:
+            time.sleep(interval)
+        before = datetime.now()
+        clocks = read_clocks()
+        after = datetime.now()
+        for node, clock in clocks.items():
+            bounds.setdefault(node, []).append(
+                (
+                    (clock - after).total_seconds(),
+                    (clock - before).total_seconds() + resolution,
+                )
+            )
+
+    offsets = {}
+    for node, node_bounds in bounds.items():
+        low = max(b[0] for b in node_bounds)
+        high = min(b[1] for b in node_bounds)
+        if low > high:
+            # the clock stepped while sampling: the widest consistent guess
+            low = min(b[0] for b in node_bounds)
+            high = max(b[1] for b in node_bounds)
+        offsets[node] = (round(-(low + high) / 2, 3), round((high - low) / 2, 3))
+    return offsets
+
+
+def estimate_clock_offsets(
+    events: Dict[str, List[TYPE_EVENT]],
+    fixed: Optional[Dict[str, float]] = None,
+    reference: Optional[str] = None,
+    initial: Optional[Dict[str, float]] = None,
+) -> Dict[str, float]:
+    """
+    Refine per-node clock offsets (in seconds) from the transfer events.
+
+    A transfer can't complete before it starts. So, for every file that
+    starts on node A and completes on node B, we have the constraint:
+
+        end_B + offset_B >= start_A + offset_A
+
+    The offsets are the smallest shifts of the `initial` ones (eg: measured
+    with `measure_clock_offsets`, 0 by default) that satisfy all such
+    constraints, relative to the reference node. They're found by relaxing
+    the constraints like a longest-path problem (Bellman-Ford).
+    Nodes with a known (`fixed`) offset are never shifted.
+
+    Note:
+        Causality only bounds the skew, and only for the files started and
+        completed on different nodes. A node whose clock is ahead doesn't
+        violate any constraint, so it can't be detected here: measure it,
+        or pass its offset through `NodeLogSource.clock_offset`.
+
+    Args:
+        `events`: `Dict[str, List[TYPE_EVENT]]`
+            Mapping from node name to its (time, fname, is_start) events.
+
+        `fixed`: `Dict[str, float]`
+            Known offsets for some nodes.
+
+        `reference`: `str`
+            Reference node. Defaults to the first node.
+
+        `initial`: `Dict[str, float]`
+            Starting offsets of the other nodes.
+
+    Returns:
+        Mapping from node name to clock offset to add to its times.
+    """
+    fixed = {k: v for k, v in (fixed or {}).items() if v is not None}
+    nodes = list(events.keys())
+    if not nodes:
+        return {}
+    reference = reference or nodes[0]
+
+    starts, ends = {}, {}
+    for node, node_events in events.items():
+        for t, fname, is_start in node_events:
+            if is_start:
+                starts.setdefault(fname, []).append((node, t))
+            else:
+                ends.setdefault(fname, []).append((node, t))
+
+    # violation[(a, b)] => how much b has to be shifted after a
+    violations = {}
+    for fname, node_ends in ends.items():
+        for node_a, start in starts.get(fname, []):
+            for node_b, end in node_ends:
+                if node_a == node_b:
+                    continue
+                key = (node_a, node_b)
+                violations[key] = max(violations.get(key, float("-inf")), start - end)
+
+    initial = initial or {}
+    offsets = {node: fixed.get(node, initial.get(node, 0.0)) for node in nodes}
+    for _ in range(len(nodes)):
+        changed = False
+        for (node_a, node_b), violation in violations.items():
+            if violation <= 0 or offsets[node_b] - offsets[node_a] >= violation:
+                continue
+            if node_b not in fixed and node_b != reference:
+                offsets[node_b] = offsets[node_a] + violation
+            elif node_a not in fixed and node_a != reference:
+                offsets[node_a] = offsets[node_b] - violation
+            else:
+                continue
+            changed = True
+        if not changed:
+            break
+    return {node: round(offset, 3) for node, offset in offsets.items()}
@@ -1,9 +1,10 @@
 import os
+import re
 import tempfile
+import threading
 import time
-from datetime import datetime
 from pathlib import Path
-from typing import Dict, Optional, Sequence, TextIO, Tuple, Union
+from typing import Dict, List, Optional, Sequence, TextIO, Tuple, Union
 
 import urllib3
 
@@ -12,8 +13,29 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 from loguru import logger
 
 from .._base import AbstractAutomation
-from ..misc.shell import ShellExecutor
-from ..structures import TYPE_PATH, TransferDTO
+from ..misc.deadlines import TransferDeadlines
+from ..misc.delta import TransferPlan
+from ..misc.parsing import LogPattern, LogScanner, TimestampCache
+from ..misc.replay import TrialArtifacts
+from ..misc.shell import ExecutionDTO, ShellExecutor
+from ..structures import TYPE_PATH, TransferDTO, TransferStatus
+
+_LOG_TIMESTAMP = TimestampCache("%Y/%m/%d %H:%M:%S", 19, frac_sep=b".")
+
+
+def _rclone_log_pattern(kind: str, level: bytes, phrase: bytes) -> LogPattern:
+    """
+    Pattern for lines like "2022/03/09 03:05:32 DEBUG : <fname>: <phrase>..."
+    """
+    return LogPattern(
+        kind,
+        rb"(?P<ts>\d{4}/\d\d/\d\d \d\d:\d\d:\d\d(?:\.\d+)?) +"
+        + level
+        + rb" +: (?P<name>[^:\n]*):[^\n]*?"
+        + re.escape(phrase),
+        _LOG_TIMESTAMP,
+        phrase,
+    )
 
 
 class RcloneAutomation(AbstractAutomation):
@@ -26,7 +48,9 @@ class RcloneAutomation(AbstractAutomation):
 
         files: `List[str]`
             List of filenames to be transferred.
-            (Currently it's not used in RcloneAutomation)
+            Rclone copies the whole bucket, unless `files` is a
+            `misc.delta.TransferPlan` (or `files_from=True`): then only
+            these files are copied (through `--files-from-raw`).
 
         shell_executor: `misc.shell.ShellExecutor`
             A misc component to execute external shell commands.
@@ -45,8 +69,30 @@ class RcloneAutomation(AbstractAutomation):
             - ntransfers (number of parallelization for downloads)
             - s3_max_upload_parts (how many chunks at max used to upload to s3?)
             - s3_upload_concurrency (number of parallelization for uploads)
+            - dest_prefix (prefix of the destination keys)
+            - files_from (if `True`, only `files` are copied. Defaults to
+            `True` for a `misc.delta.TransferPlan`)
+
+        `run_timeout` passed to `run_automation(...)` (derived from the
+        sizes in the `filemap` by default, see
+        `misc.deadlines.TransferDeadlines.from_kwargs`) maps to rclone's
+        `--max-duration`. Transfers still in flight when it stops are
+        marked as TIMED_OUT. `file_timeout` and `straggler_factor` don't
+        apply: rclone runs as a single process, whose own `--timeout`
+        (idle connections) and retries handle the stalled transfers.
     """
 
+    _LOG_SCANNER = LogScanner(
+        [
+            _rclone_log_pattern(
+                "start", b"DEBUG", b"multipart upload starting chunk 1 size"
+            ),
+            _rclone_log_pattern("start", b"DEBUG", b"Transferring unconditionally"),
+            _rclone_log_pattern("end", b"INFO", b"Copied"),
+            _rclone_log_pattern("failed", b"ERROR", b"Failed to copy"),
+        ]
+    )
+
     def __init__(
         self,
         config: Union[Dict[str, str], TYPE_PATH],
@@ -55,7 +101,9 @@ class RcloneAutomation(AbstractAutomation):
         debug: bool = False,
         **params,
     ) -> None:
-        super().__init__(config=config, files=files, debug=debug)
+        super().__init__(
+            config=config, files=files, debug=debug, name=params.get("name")
+        )
 
         shell_executor = shell_executor or ShellExecutor()
         assert isinstance(shell_executor, ShellExecutor)
@@ -69,6 +117,18 @@ class RcloneAutomation(AbstractAutomation):
         self.s3_max_upload_parts = params.get("s3_max_upload_parts", 10)
         self.s3_upload_concurrency = params.get("s3_upload_concurrency", 10)
 
+        # copy from a local directory instead of the source bucket
+        self.source_dir = params.get("source_dir")
+        self.dest_prefix = params.get("dest_prefix", "")
+        # a transfer plan lists the exact objects to copy
+        self.files_from = bool(
+            params.get("files_from", isinstance(files, TransferPlan))
+        )
+
+    @property
+    def verifiable(self) -> bool:
+        return self.source_dir is None
+
     def _generate_rclone_cfg(self) -> tempfile.NamedTemporaryFile:
         """
         Generate a temporary config file compatible to rclone.
@@ -138,8 +198,8 @@ class RcloneAutomation(AbstractAutomation):
         cmd = [
             "rclone",
             "copy",
-            f"s3source:{source_s3_bucket}",
-            f"s3dest:{dest_s3_bucket}",
+            self.source_dir or f"s3source:{source_s3_bucket}",
+            f"s3dest:{dest_s3_bucket}/{self.dest_prefix}".rstrip("/"),
             f"--multi-thread-streams={self.multi_thread_streams}",
             f"--multi-thread-cutoff={self.multi_thread_cutoff}M",
             f"--s3-max-upload-parts={self.s3_max_upload_parts}",
@@ -152,22 +212,107 @@ class RcloneAutomation(AbstractAutomation):
             "--log-level=DEBUG",
             "-I",
         ]
+        files_from = None
+        if self.files and self.files_from:
+            files_from = tempfile.NamedTemporaryFile(
+                mode="w", prefix="rclone_files_", suffix=".txt"
+            )
+            files_from.writelines(map(lambda f: f"{f}\n", self.files))
+            files_from.flush()
+            cmd.append(f"--files-from-raw={files_from.name}")
+            logger.debug(f"rclone files-from :: {files_from.name}")
+
+        run_timeout = TransferDeadlines.from_kwargs(self.files, **kwargs).run_timeout
+        if run_timeout is not None:
+            cmd.append(f"--max-duration={int(run_timeout)}s")
+        for key in ("file_timeout", "straggler_factor"):
+            if kwargs.get(key) is not None:
+                logger.warning(
+                    f"[{self.__classname__}] {key} isn't supported. Ignored!"
+                )
 
         start = time.time()
-        exdto = self.shell_executor(cmd)
+        if self.metrics is None:
+            exdto = self.shell_executor(cmd)
+        else:
+            exdto = self._execute_with_progress(
+                cmd,
+                rclone_log_file.name,
+                poll_wait_time=kwargs.get("rclone_log_poll_time", 5) or 5,
+            )
         logger.debug(f"Execution took {time.time()-start} seconds.")
 
         # this deletes the temp file also
         logger.info(f"Removing temp config at {rclone_config_file.name}")
         rclone_config_file.close()
+        if files_from is not None:
+            files_from.close()
+
+        if self.recorder is not None:
+            self.recorder.add_execution(exdto)
+            self.recorder.add_file("rclone.log", rclone_log_file.name)
 
         # start_time_map, end_time_map = self.parse_log(rclone_log_file, debug=self.debug)
         vals = self.parse_log(rclone_log_file, debug=self.debug)
+        if self._cut_off(rclone_log_file.name, **kwargs):
+            self._mark_timed_out(vals)
         logger.debug(
             f"Delta time for {self.__classname__} = {time.time() - start_automation}"
         )
         return vals
 
+    def replay_automation(
+        self, artifacts: TrialArtifacts, **kwargs
+    ) -> Tuple[TransferDTO]:
+        """
+        Parse the recorded rclone log again.
+        """
+        vals = self.parse_log(artifacts.path("rclone.log"), debug=self.debug)
+        if self._cut_off(artifacts.path("rclone.log"), **kwargs):
+            self._mark_timed_out(vals)
+        return vals
+
+    @staticmethod
+    def _cut_off(log: TYPE_PATH, **kwargs) -> bool:
+        """
+        Whether the run was stopped by `--max-duration`: with an explicit
+        `run_timeout`, or when rclone logged it (the default deadline).
+        """
+        if kwargs.get("run_timeout") is not None:
+            return True
+        if "run_timeout" in kwargs or not os.path.exists(log):
+            return False
+        with open(log, "rb") as f:
+            return any(b"max transfer duration reached" in line for line in f)
+
+    @staticmethod
+    def _mark_timed_out(vals: Tuple[TransferDTO]) -> None:
+        # transfers cut off by --max-duration
+        for dto in vals:
+            if not dto.finished:
+                dto.status = TransferStatus.TIMED_OUT
+
+    def _execute_with_progress(
+        self, cmd: List[str], log: str, poll_wait_time: int = 5
+    ) -> ExecutionDTO:
+        """
+        Run rclone in a background thread while the log is parsed
+        periodically to keep the live metrics updated.
+        """
+        result = {}
+
+        def _target():
+            result["exdto"] = self.shell_executor(cmd)
+
+        thread = threading.Thread(target=_target, daemon=True)
+        thread.start()
+        while thread.is_alive():
+            thread.join(poll_wait_time)
+            parse_start = time.time()
+            dtos = self.parse_log(log)
+            self._observe_progress(dtos, lag=time.time() - parse_start)
+        return result.get("exdto", ExecutionDTO.default_empty_object())
+
     def parse_log(
         self, log: Union[str, TextIO], debug: bool = False
     ) -> Tuple[TransferDTO]:
@@ -175,40 +320,32 @@ class RcloneAutomation(AbstractAutomation):
         Parse rclone-generated log file to extract transfer information
         for each file.
 
+        Files that rclone gave up on ("Failed to copy" after its retries)
+        are marked as FAILED.
+
         Returns:
             tuple of data transfer metadata `Tuple[TransferDTO]`.
         """
-        # in case it's a path
-        if isinstance(log, str):
-            log = open(log)
-        log.seek(0)
+        path = log if isinstance(log, (str, Path)) else getattr(log, "name", None)
+        logger.debug(f"Parsing log at {path}")
 
-        logger.debug(f"Parsing log at {log.name}")
+        if path is not None and os.path.exists(path):
+            records = self._LOG_SCANNER.scan(path)
+        else:
+            log.seek(0)
+            records = self._LOG_SCANNER.scan_lines(log)
 
         timekeeper = {}
-        for line in log:
-            if (
-                line.find("multipart upload starting chunk 1 size") != -1
-                or line.find("Transferring unconditionally") != -1
-            ):
-                fname = line.split(":")[3].strip()
-                dto = timekeeper.get(
-                    fname, TransferDTO(fname=fname, transferer="rclone")
-                )
-                dto.start_time = datetime.strptime(
-                    line.split("DEBUG")[0].strip(), "%Y/%m/%d %H:%M:%S"
-                )
-                timekeeper[fname] = dto
-
-            if line.find("Copied") != -1:
-                fname = line.split(":")[3].strip()
-                dto = timekeeper.get(
-                    fname, TransferDTO(fname=fname, transferer="rclone")
-                )
-                dto.end_time = datetime.strptime(
-                    line.split("INFO")[0].strip(), "%Y/%m/%d %H:%M:%S"
-                )
-                timekeeper[fname] = dto
+        for kind, fname, t in records.rows():
+            dto = timekeeper.get(fname, TransferDTO(fname=fname, transferer="rclone"))
+            if kind == "start":
+                dto.start_time = t
+            elif kind == "end":
+                dto.end_time = t
+                dto.status = None
+            elif dto.end_time is None:
+                dto.status = TransferStatus.FAILED
+            timekeeper[fname] = dto
 
         if debug:
             logger.debug(f"Transfer maps => {timekeeper}")
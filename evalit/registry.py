@@ -0,0 +1,138 @@
+"""
+Registry of the automations, loaded lazily on first use.
+
+Automations are registered by name with an import path like
+"evalit.rclone:RcloneAutomation". Nothing is imported until the automation
+is first looked up, so that `import evalit.api` doesn't pull in the
+dependencies of every tool (eg: `requests` for NiFi/MFT), and a host with
+only some of the tools installed can still use those.
+
+Third-party automations can be added through the "evalit.automations"
+entry point group:
+
+    .. code-block:: python
+
+        setup(
+            ...,
+            entry_points={
+                "evalit.automations": ["mytool = mypkg.automation:MyAutomation"],
+            },
+        )
+"""
+
+from __future__ import annotations
+
+import importlib
+import threading
+from typing import TYPE_CHECKING, Dict, Optional, Type
+
+from loguru import logger
+
+if TYPE_CHECKING:
+    from ._base import AbstractAutomation
+
+ENTRY_POINT_GROUP = "evalit.automations"
+
+# the builtin automations, also declared as entry points in setup.py
+# (kept here so that they're found without an installed distribution)
+_BUILTINS = {
+    "rclone": "evalit.rclone:RcloneAutomation",
+    "nifi": "evalit.nifi:NifiAutomation",
+    "mft": "evalit.mft:MFTAutomation",
+    "native": "evalit.native:NativeAutomation",
+    "local": "evalit.local:LocalAutomation",
+    "composite": "evalit.composite:CompositeAutomation",
+}
+
+_targets: Dict[str, str] = dict(_BUILTINS)
+_loaded: Dict[str, Type[AbstractAutomation]] = {}
+_discovered = False
+_lock = threading.RLock()
+
+
+def _entry_points() -> Dict[str, str]:
+    try:
+        from importlib.metadata import entry_points
+    except ModuleNotFoundError:
+        # python 3.7
+        try:
+            from importlib_metadata import entry_points
+        except ModuleNotFoundError:
+            return {}
+
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        eps = eps.select(group=ENTRY_POINT_GROUP)
+    else:
+        eps = eps.get(ENTRY_POINT_GROUP, [])
+    return {ep.name: ep.value for ep in eps}
+
+
+def _discover() -> None:
+    global _discovered
+    if _discovered:
+        return
+    for name, target in _entry_points().items():
+        _targets.setdefault(name, target)
+    _discovered = True
+
+
+def register_automation(name: str, target: str) -> None:
+    """
+    Register an automation by name.
+
+    Args:
+        `target`: `str`
+            Import path of the class, like "mypkg.automation:MyAutomation".
+    """
+    with _lock:
+        _targets[name] = target
+        _loaded.pop(name, None)
+
+
+def available_automations() -> Dict[str, str]:
+    """
+    Names of all the registered automations and their import paths.
+    Nothing is imported.
+    """
+    with _lock:
+        _discover()
+        return dict(_targets)
+
+
+def get_automation(name: str) -> Type[AbstractAutomation]:
+    """
+    The automation class registered as `name`, imported on first use.
+
+    Raises:
+        `KeyError` if no automation is registered as `name`.
+        `ImportError` if the automation (or one of its dependencies)
+        isn't installed on this host.
+    """
+    with _lock:
+        if name in _loaded:
+            return _loaded[name]
+        _discover()
+        if name not in _targets:
+            raise KeyError(f"No automation named {name}. Available: {sorted(_targets)}")
+        module_name, _, attr = _targets[name].partition(":")
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError as e:
+            raise ImportError(
+                f"Automation {name} ({_targets[name]}) can't be loaded: {e}"
+            ) from e
+        automation = getattr(module, attr)
+        logger.debug(f"Loaded automation {name} from {_targets[name]}")
+        _loaded[name] = automation
+        return automation
+
+
+def find_automation(classname: str) -> Optional[str]:
+    """
+    Registered name of the automation class `classname`, if any.
+    """
+    for name, target in available_automations().items():
+        if target.partition(":")[2] == classname:
+            return name
+    return None
@@ -1,11 +1,22 @@
 from dataclasses import dataclass, field
 from datetime import datetime
+from enum import Enum
 from pathlib import Path
-from typing import Union
+from typing import Optional, Union
 
 TYPE_PATH = Union[str, Path]
 
 
+class TransferStatus(str, Enum):
+    """
+    Final state of a transfer that didn't complete.
+    Completed transfers have no explicit status.
+    """
+
+    FAILED = "FAILED"
+    TIMED_OUT = "TIMED_OUT"
+
+
 @dataclass
 class TransferDTO:
     # hold file name
@@ -21,6 +32,23 @@ class TransferDTO:
     # end_time: datetime = field(default_factory=lambda: datetime.now())
     end_time: datetime = None
 
+    # holds number of bytes transferred, if reported by the tool
+    nbytes: Optional[int] = None
+
+    # FAILED/TIMED_OUT if the transfer didn't complete
+    status: Optional[TransferStatus] = None
+
     @property
     def transfer_time(self) -> float:
         return (self.end_time - self.start_time).seconds
+
+    @property
+    def failed(self) -> bool:
+        return self.status is not None
+
+    @property
+    def finished(self) -> bool:
+        """
+        Whether the transfer reached a final state (completed or not).
+        """
+        return self.failed or self.end_time is not None
@@ -19,8 +19,31 @@ setup(
     author_email="np0069@uah.edu",
     # license="MIT",
     python_requires=">=3.7",
-    packages=["evalit", "evalit.rclone", "evalit.nifi", "evalit.mft"],
+    packages=[
+        "evalit",
+        "evalit.misc",
+        "evalit.rclone",
+        "evalit.nifi",
+        "evalit.mft",
+        "evalit.native",
+        "evalit.composite",
+        "evalit.local",
+    ],
     install_requires=required,
+    entry_points={
+        "console_scripts": [
+            "evalit = evalit.cli:main",
+            "evalit-distributed = evalit.distributed:main",
+        ],
+        "evalit.automations": [
+            "rclone = evalit.rclone:RcloneAutomation",
+            "nifi = evalit.nifi:NifiAutomation",
+            "mft = evalit.mft:MFTAutomation",
+            "native = evalit.native:NativeAutomation",
+            "local = evalit.local:LocalAutomation",
+            "composite = evalit.composite:CompositeAutomation",
+        ],
+    },
     classifiers=[
         "Intended Audience :: Education",
         "Intended Audience :: Science/Research",
@@ -0,0 +1,99 @@
+"""
+Check that concurrent bundle-mode runs of `NativeAutomation` (eg: the
+workers of a distributed run) keep their archives apart, against a mocked
+S3 (`moto`): every record must be found in the index of its bundle.
+
+No endpoint is needed. Usage:
+
+    python tests/bundle_test.py
+    python -m pytest tests/bundle_test.py
+"""
+import json
+import sys
+import threading
+
+sys.path.append("./")
+sys.path.append("../evalit/")
+sys.path.append("./evalit/")
+
+import pytest
+
+from evalit.api import NativeAutomation
+
+moto = pytest.importorskip("moto")
+
+CONFIG = dict(
+    source_token="token",
+    source_secret="secret",
+    source_s3_endpoint=None,
+    source_s3_bucket="source",
+    source_s3_region="us-east-1",
+    dest_token="token",
+    dest_secret="secret",
+    dest_s3_endpoint=None,
+    dest_s3_bucket="dest",
+    dest_s3_region="us-east-1",
+)
+
+NWORKERS = 3
+FILES = [f"file-{i:02d}" for i in range(30)]
+
+
+def _bundle_indexes(client) -> list:
+    keys = [
+        obj["Key"]
+        for obj in client.list_objects_v2(Bucket="dest").get("Contents", [])
+        if obj["Key"].endswith(".index.json")
+    ]
+    return [
+        json.loads(client.get_object(Bucket="dest", Key=key)["Body"].read())
+        for key in keys
+    ]
+
+
+def test_concurrent_bundles():
+    with moto.mock_aws():
+        import boto3
+
+        client = boto3.client("s3", region_name="us-east-1")
+        for bucket in ("source", "dest"):
+            client.create_bucket(Bucket=bucket)
+        for fname in FILES:
+            client.put_object(Bucket="source", Key=fname, Body=fname.encode() * 100)
+
+        # the same label on every worker, all starting in the same second
+        automations = [
+            NativeAutomation(
+                CONFIG, FILES[i::NWORKERS], name="native", mode="bundle", njobs=2
+            )
+            for i in range(NWORKERS)
+        ]
+        results = [None] * NWORKERS
+
+        def _run(i: int) -> None:
+            results[i] = automations[i].run_automation()
+
+        threads = [threading.Thread(target=_run, args=(i,)) for i in range(NWORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        records = [dto for vals in results for dto in vals]
+        assert len(records) == len(FILES)
+        assert not any(dto.failed for dto in records)
+
+        indexes = _bundle_indexes(client)
+        assert len(indexes) == NWORKERS
+        assert sorted(o["key"] for index in indexes for o in index["objects"]) == FILES
+        for index in indexes:
+            bundle = client.get_object(Bucket="dest", Key=index["bundle"])
+            data = bundle["Body"].read()
+            for obj in index["objects"]:
+                member = data[obj["offset"] : obj["offset"] + obj["size"]]
+                assert member == obj["key"].encode() * 100
+
+
+if __name__ == "__main__":
+    test_concurrent_bundles()
+    print("OK")
@@ -18,6 +18,7 @@ import numpy as np
 from loguru import logger
 
 from evalit.api import MFTAutomation, NifiAutomation, RcloneAutomation, TransferDTO
+from evalit.misc.dataset import generate_dataset
 
 
 def dtotimes_to_times(timesdto: Tuple[TransferDTO]) -> List[List[float]]:
@@ -63,6 +64,18 @@ mft_installation = os.getenv("MFT_INSTALLATION")
 
 dt_config = os.getenv("CFG_YAML", "tests/config.yaml")
 
+# generate the source files instead, eg: SYNTHETIC_DATASET=lognormal
+if os.getenv("SYNTHETIC_DATASET"):
+    dataset = generate_dataset(
+        RcloneAutomation.load_yaml(dt_config),
+        distribution=os.getenv("SYNTHETIC_DATASET"),
+        count=int(os.getenv("SYNTHETIC_COUNT", 100)),
+        size_mb=float(os.getenv("SYNTHETIC_SIZE_MB", 1)),
+        manifest=os.getenv("SYNTHETIC_MANIFEST"),
+    )
+    file_list = list(dataset)
+    file_sizes = [size / 1024**3 for size in dataset.sizes]
+
 ###### Nifi ###########
 automation1 = NifiAutomation(
     config=dt_config,
@@ -16,6 +16,8 @@ from loguru import logger
 
 from evalit.api import MFTAutomation, NifiAutomation, RcloneAutomation
 from evalit.controller import StandardAutomationController
+from evalit.misc.dataset import generate_dataset
+from evalit.misc.delta import plan_transfer
 
 ncpus = multiprocessing.cpu_count()
 logger.info(f"N cpus = {ncpus}")
@@ -26,8 +28,24 @@ mft_installation = os.getenv("MFT_INSTALLATION")
 dt_config = os.getenv("CFG_YAML", "tests/config.yaml")
 dt_config = RcloneAutomation.load_yaml(dt_config)
 
+# populate the source bucket with a synthetic dataset first
+if os.getenv("SYNTHETIC_DATASET"):
+    generate_dataset(
+        dt_config,
+        distribution=os.getenv("SYNTHETIC_DATASET"),
+        count=int(os.getenv("SYNTHETIC_COUNT", 1000)),
+        size_mb=float(os.getenv("SYNTHETIC_SIZE_MB", 1)),
+        manifest=os.getenv("SYNTHETIC_MANIFEST"),
+        njobs=4 * ncpus,
+    )
+
 filemap = StandardAutomationController.get_source_file_map(dt_config)
 filenames = tuple(filemap.keys())
+
+# only transfer the objects missing/changed at the destination
+if bool(int(os.getenv("DELTA_PLAN", 0))):
+    plan = plan_transfer(dt_config)
+    filemap, filenames = plan.filemap(), plan
 logger.debug(filemap)
 
 # build controller with available automation components
@@ -70,5 +88,17 @@ results = controller.run(
     nifi_log_poll_time=5,
     mft_log_poll_time=5,
     mft_log_parser_njobs=ncpus,
+    metrics_port=os.getenv("METRICS_PORT"),
+    results_path=os.getenv("RESULTS_PATH"),
+    checkpoint_dir=os.getenv("CHECKPOINT_DIR"),
+    resume=bool(int(os.getenv("RESUME", 0))),
+    verify=bool(int(os.getenv("VERIFY", 0))),
+    verify_sample=float(os.getenv("VERIFY_SAMPLE", 0)),
+    trials=int(os.getenv("TRIALS", 1)),
+    reset_destination=bool(int(os.getenv("RESET_DESTINATION", 0))),
+    link_probe=bool(int(os.getenv("LINK_PROBE", 0))),
+    analysis=bool(int(os.getenv("ANALYSIS", 0))),
+    record_path=os.getenv("RECORD_PATH"),
+    contention=bool(int(os.getenv("CONTENTION", 0))),
 )
 logger.info(results)
@@ -0,0 +1,54 @@
+"""
+Run the native copier from several worker processes on this host, through
+the coordinator/worker mode (see `evalit.distributed`), and compare the
+aggregate throughput with the one of a single worker.
+
+Usage:
+
+    CFG_YAML=tests/config.yaml NWORKERS=4 python tests/distributed_test.py
+"""
+import json
+import multiprocessing
+import os
+import sys
+
+sys.path.append("./")
+sys.path.append("../evalit/")
+sys.path.append("./evalit/")
+
+from loguru import logger
+
+from evalit.api import NativeAutomation
+from evalit.controller import StandardAutomationController
+from evalit.distributed import Coordinator, spawn_workers
+
+ncpus = multiprocessing.cpu_count()
+nworkers = int(os.getenv("NWORKERS", 4))
+
+if __name__ == "__main__":
+    dt_config = os.getenv("CFG_YAML", "tests/config.yaml")
+    dt_config = NativeAutomation.load_yaml(dt_config)
+
+    filemap = StandardAutomationController.get_source_file_map(dt_config)
+    logger.info(f"{len(filemap)} files in the source bucket")
+
+    tools = [dict(type="native", name="native", params=dict(njobs=ncpus))]
+
+    results = {}
+    for n in sorted({1, nworkers}):
+        coordinator = Coordinator(dt_config, tools, filemap, nworkers=n).start()
+        workers = spawn_workers(coordinator.url, n)
+        try:
+            results[n] = coordinator.run(
+                trials=int(os.getenv("TRIALS", 1)),
+                reset_destination=True,
+                register_timeout=60,
+            )
+        finally:
+            coordinator.stop()
+            for process in workers:
+                process.wait()
+
+    for n, result in results.items():
+        logger.info(f"{n} workers => {result['native']['throughput']} Gbps")
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,74 @@
+"""
+Track the import time of evalit, so that heavy dependencies don't creep
+back into the import path (see `evalit.registry`).
+
+Each module is imported in a fresh interpreter with `-X importtime`,
+a few times, and the best cumulative time is reported.
+
+Usage:
+
+    python tests/import_time.py
+
+    # fail if `import evalit.api` takes more than 300 ms,
+    # and append the measurements to a JSON lines file
+    MAX_IMPORT_MS=300 IMPORT_TIME_LOG=import_time.jsonl python tests/import_time.py
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+MODULES = ("evalit", "evalit.api", "evalit.controller")
+
+# modules that must not be imported by `import evalit.api`
+DEFERRED = ("matplotlib", "numpy", "requests", "joblib")
+
+_LINE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \|\s+(\S+)")
+
+
+def measure(module: str, runs: int = 5) -> float:
+    """
+    Best cumulative import time (ms) of the module over `runs` runs.
+    """
+    best = float("inf")
+    for _ in range(runs):
+        stderr = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stderr
+        for match in _LINE.finditer(stderr):
+            if match.group(2) == module:
+                best = min(best, int(match.group(1)) / 1000)
+    return best
+
+
+def deferred_imports() -> list:
+    code = (
+        "import sys, evalit.api; "
+        f"print(','.join(m for m in {DEFERRED!r} if m in sys.modules))"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout.strip()
+    return [m for m in out.split(",") if m]
+
+
+if __name__ == "__main__":
+    results = {module: round(measure(module), 3) for module in MODULES}
+    leaked = deferred_imports()
+    print(json.dumps(dict(import_ms=results, leaked=leaked), indent=2))
+
+    log = os.getenv("IMPORT_TIME_LOG")
+    if log:
+        with open(log, "a") as f:
+            f.write(json.dumps(dict(time=time.time(), import_ms=results)) + "\n")
+
+    budget = os.getenv("MAX_IMPORT_MS")
+    if leaked:
+        sys.exit(f"Heavy dependencies imported by evalit.api: {leaked}")
+    if budget and results["evalit.api"] > float(budget):
+        sys.exit(f"import evalit.api took {results['evalit.api']} ms > {budget} ms")
@@ -0,0 +1,63 @@
+"""
+Compare local directory to S3 uploads: `LocalAutomation` with the mmap
+and read readers, against `rclone copy` from the same local path.
+
+Usage:
+
+    SOURCE_DIR=/data/sample CFG_YAML=tests/config.yaml python tests/local_benchmark.py
+"""
+import multiprocessing
+import os
+import sys
+
+sys.path.append("./")
+sys.path.append("../evalit/")
+sys.path.append("./evalit/")
+
+from loguru import logger
+
+from evalit.api import LocalAutomation, RcloneAutomation
+from evalit.controller import StandardAutomationController
+from evalit.local import get_local_file_map
+
+ncpus = multiprocessing.cpu_count()
+
+source_dir = os.getenv("SOURCE_DIR")
+dt_config = os.getenv("CFG_YAML", "tests/config.yaml")
+dt_config = LocalAutomation.load_yaml(dt_config)
+
+filemap = get_local_file_map(source_dir, njobs=ncpus)
+logger.debug(f"{len(filemap)} files in {source_dir}")
+
+controller = StandardAutomationController(debug=False).add_automations(
+    (
+        LocalAutomation(
+            dt_config,
+            name="local-mmap",
+            source_dir=source_dir,
+            reader="mmap",
+            njobs=4 * ncpus,
+        ),
+        LocalAutomation(
+            dt_config,
+            name="local-read",
+            source_dir=source_dir,
+            reader="read",
+            njobs=4 * ncpus,
+        ),
+        RcloneAutomation(
+            dt_config,
+            name="rclone-local",
+            source_dir=source_dir,
+            ntransfers=4 * ncpus,
+            s3_upload_concurrency=16,
+        ),
+    )
+)
+results = controller.run(
+    filemap=filemap, reset_destination=True, analysis=True, progress_interval=0
+)
+for name, result in results.items():
+    logger.info(
+        f"[{name}] {result['objects_per_sec']} objects/sec | {result['throughput']} Gbps"
+    )
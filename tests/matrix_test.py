@@ -0,0 +1,66 @@
+"""
+Run rclone and the native copier over a matrix of endpoint pairs, and
+print the pair x tool throughput matrix (see `evalit.matrix`).
+
+Each `PAIR_<NAME>` environment variable is the config yaml of a pair, and
+`PATHS_<NAME>` (comma separated, optional) its network paths. Both tools
+move the data through this host, so the pairs also share the "host" path.
+
+Usage:
+
+    PAIR_AWS=tests/config.yaml PAIR_MINIO=configs/minio.yaml \
+        PATHS_MINIO=minio python tests/matrix_test.py
+"""
+import json
+import multiprocessing
+import os
+import sys
+
+sys.path.append("./")
+sys.path.append("../evalit/")
+sys.path.append("./evalit/")
+
+from loguru import logger
+
+from evalit.api import NativeAutomation, RcloneAutomation
+from evalit.matrix import EndpointPair, MatrixRunner
+
+ncpus = multiprocessing.cpu_count()
+
+
+def env_pairs() -> list:
+    return [
+        EndpointPair(
+            name[len("PAIR_") :].lower(),
+            config,
+            paths=tuple(
+                filter(None, os.getenv(f"PATHS_{name[len('PAIR_'):]}", "").split(","))
+            ),
+        )
+        for name, config in sorted(os.environ.items())
+        if name.startswith("PAIR_")
+    ]
+
+
+if __name__ == "__main__":
+    pairs = env_pairs()
+    if not pairs:
+        sys.exit("No PAIR_<NAME> config given!")
+
+    runner = MatrixRunner(
+        pairs,
+        {
+            "rclone": lambda cfg, files: RcloneAutomation(
+                cfg, files, ntransfers=2 * ncpus, s3_upload_concurrency=2 * ncpus
+            ),
+            "native": lambda cfg, files: NativeAutomation(cfg, files, njobs=4 * ncpus),
+        },
+    )
+    logger.info(f"Plan: {runner.plan()}")
+
+    result = runner.run(
+        trials=int(os.getenv("TRIALS", 1)),
+        reset_destination=True,
+        results_path=os.getenv("RESULTS_PATH"),
+    )
+    print(json.dumps(result.summary(), indent=2))
@@ -0,0 +1,143 @@
+"""
+Check the live metrics endpoint of the controller (`metrics_port`):
+`/metrics` is scraped while a fake automation is still transferring,
+and the counters are compared with what it reported so far.
+
+No endpoint is needed. Usage:
+
+    python tests/metrics_test.py
+    python -m pytest tests/metrics_test.py
+"""
+import re
+import socket
+import sys
+import urllib.request
+from datetime import datetime, timedelta
+
+sys.path.append("./")
+sys.path.append("../evalit/")
+sys.path.append("./evalit/")
+
+from evalit._base import AbstractAutomation
+from evalit.controller import StandardAutomationController
+from evalit.misc.metrics import MetricsExporter
+from evalit.structures import TransferDTO
+
+_GB = 1024 * 1024 * 1024
+
+CONFIG = dict(
+    source_token="token",
+    source_secret="secret",
+    source_s3_endpoint=None,
+    source_s3_bucket="source",
+    source_s3_region="us-east-1",
+    dest_token="token",
+    dest_secret="secret",
+    dest_s3_endpoint=None,
+    dest_s3_bucket="dest",
+    dest_s3_region="us-east-1",
+)
+
+FILEMAP = {f"file-{i}": dict(size=0.5) for i in range(10)}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _scrape(port: int) -> dict:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+        assert response.status == 200
+        text = response.read().decode("utf-8")
+    return {
+        match.group(1): float(match.group(2))
+        for match in re.finditer(
+            r'^(evalit_\w+)\{automation="fake"\} (\S+)$', text, re.M
+        )
+    }
+
+
+class FakeAutomation(AbstractAutomation):
+    """
+    Transfers the files one second apart (on paper, without waiting),
+    and scrapes the metrics endpoint halfway through.
+    """
+
+    def __init__(self, *args, port: int, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.port = port
+        self.scraped = None
+
+    def run_automation(self, **kwargs):
+        return tuple(self.stream_automation(**kwargs))
+
+    def stream_automation(self, **kwargs):
+        start = datetime(2022, 1, 1)
+        dtos = [
+            TransferDTO(fname, "fake", start_time=start + timedelta(seconds=i))
+            for i, fname in enumerate(self.files)
+        ]
+        for i, dto in enumerate(dtos):
+            dto.end_time = dto.start_time + timedelta(seconds=1)
+            self._observe_progress(dtos[: i + 2], lag=0.25)
+            if i == 4:
+                self.scraped = _scrape(self.port)
+            yield dto
+
+
+def test_exporter_render():
+    exporter = MetricsExporter(port=0).start()
+    try:
+        assert exporter.port != 0
+        exporter.scope("fake", FILEMAP).observe(
+            [
+                TransferDTO(
+                    "file-0",
+                    "fake",
+                    start_time=datetime(2022, 1, 1),
+                    end_time=datetime(2022, 1, 1, 0, 0, 2),
+                )
+            ]
+        )
+        samples = _scrape(exporter.port)
+    finally:
+        exporter.stop()
+    assert samples["evalit_files_completed_total"] == 1
+    assert samples["evalit_bytes_moved_total"] == int(0.5 * _GB)
+    assert samples["evalit_throughput_gbps"] == 2.0
+    assert samples["evalit_inflight_transfers"] == 0
+
+
+def test_controller_metrics_during_run():
+    port = _free_port()
+    automation = FakeAutomation(CONFIG, tuple(FILEMAP), name="fake", port=port)
+    result = (
+        StandardAutomationController()
+        .add_automation(automation)
+        .run(filemap=FILEMAP, metrics_port=port, graphs=False, progress_interval=0)
+    )
+
+    samples = automation.scraped
+    # 5 files done (one second each, back to back), the 6th in flight
+    assert samples["evalit_files_completed_total"] == 5
+    assert samples["evalit_bytes_moved_total"] == int(5 * 0.5 * _GB)
+    assert samples["evalit_throughput_gbps"] == round(5 * 0.5 * 8 / 5, 3)
+    assert samples["evalit_inflight_transfers"] == 1
+    assert samples["evalit_parse_loop_lag_seconds"] == 0.25
+    assert result["fake"]["throughput"] == 4.0
+
+    # the endpoint is gone with the run
+    try:
+        _scrape(port)
+    except OSError:
+        pass
+    else:
+        raise AssertionError("The metrics endpoint outlived the run!")
+
+
+if __name__ == "__main__":
+    test_exporter_render()
+    test_controller_metrics_during_run()
+    print("OK")
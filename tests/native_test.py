@@ -0,0 +1,57 @@
+"""
+Compare per-object copying against the small-object bundling mode
+of `NativeAutomation` (objects/sec and Gbps).
+
+Usage:
+
+    CFG_YAML=tests/config.yaml python tests/native_test.py
+"""
+import multiprocessing
+import os
+import sys
+
+sys.path.append("./")
+sys.path.append("../evalit/")
+sys.path.append("./evalit/")
+
+from loguru import logger
+
+from evalit.api import NativeAutomation
+from evalit.controller import StandardAutomationController
+
+ncpus = multiprocessing.cpu_count()
+
+if __name__ == "__main__":
+    dt_config = os.getenv("CFG_YAML", "tests/config.yaml")
+    dt_config = NativeAutomation.load_yaml(dt_config)
+
+    filemap = StandardAutomationController.get_source_file_map(dt_config)
+    filenames = tuple(filemap.keys())
+    logger.debug(f"{len(filemap)} files in the source bucket")
+
+    controller = StandardAutomationController(debug=False).add_automations(
+        (
+            NativeAutomation(
+                dt_config,
+                filenames,
+                name="native-object",
+                mode="object",
+                njobs=4 * ncpus,
+            ),
+            NativeAutomation(
+                dt_config,
+                filenames,
+                name="native-bundle",
+                mode="bundle",
+                njobs=4 * ncpus,
+                part_size_mb=64,
+                upload_concurrency=4,
+                bundle_threshold_mb=int(os.getenv("BUNDLE_THRESHOLD_MB", 8)),
+            ),
+        )
+    )
+    results = controller.run(filemap=filemap)
+    for name, result in results.items():
+        logger.info(
+            f"[{name}] {result['objects_per_sec']} objects/sec | {result['throughput']} Gbps"
+        )
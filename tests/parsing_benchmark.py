@@ -0,0 +1,105 @@
+"""
+Benchmark of the shared log parsing engine (`evalit.misc.parsing`)
+against the plain line-by-line parsing, on a synthetic rclone DEBUG log.
+
+Usage:
+
+    BENCH_LOG_GB=5 python tests/parsing_benchmark.py
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append("./")
+sys.path.append("../evalit/")
+sys.path.append("./evalit/")
+
+from loguru import logger
+
+from evalit.rclone.rclone_automation import RcloneAutomation
+
+log_size_gb = float(os.getenv("BENCH_LOG_GB", 1))
+run_legacy = bool(int(os.getenv("BENCH_LEGACY", 1)))
+
+
+def generate_log(path: str, size_gb: float) -> int:
+    """
+    Write a synthetic rclone DEBUG log of roughly `size_gb` GB.
+    Each file transfer produces one start line, a few chunk lines
+    and one "Copied" line.
+
+    Returns:
+        number of lines written
+    """
+    target = int(size_gb * 1024 * 1024 * 1024)
+    t = datetime(2022, 3, 9, 3, 5, 32)
+    written, nlines, i = 0, 0, 0
+    with open(path, "w") as f:
+        while written < target:
+            stamp = t.strftime("%Y/%m/%d %H:%M:%S")
+            block = (
+                f"{stamp} DEBUG : data/file_{i}.bin: Transferring unconditionally as --ignore-times is in use\n"
+                + "".join(
+                    f'{stamp} DEBUG : data/file_{i}.bin: multipart upload wrote chunk {c} with 52428800 bytes and etag "abc"\n'
+                    for c in range(2, 10)
+                )
+                + f"{stamp} INFO  : data/file_{i}.bin: Copied (new)\n"
+            )
+            f.write(block)
+            written += len(block)
+            nlines += 10
+            i += 1
+            if i % 50 == 0:
+                t += timedelta(seconds=1)
+    return nlines
+
+
+def legacy_parse(path: str) -> int:
+    """
+    The line-by-line parsing, as done before the engine.
+    """
+    timekeeper = {}
+    with open(path) as log:
+        for line in log:
+            if (
+                line.find("multipart upload starting chunk 1 size") != -1
+                or line.find("Transferring unconditionally") != -1
+            ):
+                fname = line.split(":")[3].strip()
+                timekeeper.setdefault(fname, [None, None])[0] = datetime.strptime(
+                    line.split("DEBUG")[0].strip(), "%Y/%m/%d %H:%M:%S"
+                )
+            if line.find("Copied") != -1:
+                fname = line.split(":")[3].strip()
+                timekeeper.setdefault(fname, [None, None])[1] = datetime.strptime(
+                    line.split("INFO")[0].strip(), "%Y/%m/%d %H:%M:%S"
+                )
+    return len(timekeeper)
+
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    log_path = os.path.join(tmpdir, "rclone_bench.log")
+
+    start = time.time()
+    nlines = generate_log(log_path, log_size_gb)
+    logger.info(
+        f"Generated {nlines} lines ({os.path.getsize(log_path)} bytes) in {time.time()-start:.2f} seconds"
+    )
+
+    automation = RcloneAutomation.__new__(RcloneAutomation)
+    start = time.time()
+    nfiles = len(automation.parse_log(log_path))
+    delta = time.time() - start
+    logger.info(
+        f"[engine] {nfiles} files | {delta:.2f} seconds | {nlines/delta:.0f} lines/sec"
+    )
+
+    if run_legacy:
+        start = time.time()
+        nfiles = legacy_parse(log_path)
+        delta = time.time() - start
+        logger.info(
+            f"[legacy] {nfiles} files | {delta:.2f} seconds | {nlines/delta:.0f} lines/sec"
+        )
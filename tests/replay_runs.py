@@ -0,0 +1,37 @@
+"""
+Replay recorded runs (see `evalit.misc.replay`) through the parsers and
+the controller, without transferring anything, and print their results.
+
+Runs are recorded with `RECORD_PATH=runs/<name>.tar.gz` in
+`controller_test2.py` or `evalit spec.yaml --record runs/<name>.tar.gz`.
+
+Usage:
+
+    RUNS_DIR=runs/ ANALYSIS=1 python tests/replay_runs.py
+"""
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.append("./")
+sys.path.append("../evalit/")
+sys.path.append("./evalit/")
+
+from loguru import logger
+
+from evalit.misc.replay import replay
+
+runs_dir = os.getenv("RUNS_DIR", "runs/")
+bundles = sorted(glob.glob(os.path.join(runs_dir, "*.tar.gz")))
+logger.info(f"{len(bundles)} runs in {runs_dir}")
+
+start = time.time()
+replayed = {}
+for bundle in bundles:
+    replayed[os.path.basename(bundle)] = replay(
+        bundle, analysis=bool(int(os.getenv("ANALYSIS", 0)))
+    )
+logger.info(f"Replayed {len(bundles)} runs in {time.time() - start} seconds")
+print(json.dumps(replayed, indent=2, default=str))